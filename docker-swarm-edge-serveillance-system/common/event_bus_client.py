@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import wire_format
+from local_transport import LOCAL_SCHEME, LocalTransportClient
+
+logger = logging.getLogger(__name__)
+
+# 再試行するHTTPステータス（イベントバスの起動中・フェイルオーバー中・シャード不達）
+RETRY_STATUS = (502, 503, 504)
+
+# ローカルトランスポートで送るパス（その他の通知はHTTPで送信）
+LOCAL_PATHS = ('/transition', '/transitions')
+# ローカルトランスポートに接続できない場合にHTTPで送る期間（秒）
+LOCAL_RETRY_INTERVAL = 5.0
+
+class EventBusClient:
+    """状態コンテナからイベントバスへの通知クライアント
+
+    keep-aliveの接続プールを使い回し、接続失敗や503等はジッター付き指数バックオフで
+    max_retries回まで再試行する。batch_window>0 では窓内の遷移イベントを /transitions にまとめて送信する。
+    payload_format='msgpack' ではmsgpack（バウンディングボックスは列形式）で送受信する。
+    base_url が unix:///path の場合、遷移イベントはUnixドメインソケットで送り、
+    ソケットに接続できなければ EVENT_BUS_HTTP_URL へのHTTPにフォールバックする。
+    遷移イベントには冪等キー（再試行でも同じ値）とコンテナの世代トークン（STATE_GENERATION）を付与する。
+    """
+    def __init__(self, base_url: str = None, machine_id: str = None, state_name: str = None,
+                 timeout: float = 5.0, max_retries: int = 3, backoff: float = 0.1,
+                 max_backoff: float = 2.0, batch_window: float = None, batch_size: int = 50,
+                 pool_size: int = 4, payload_format: str = None, generation: str = None):
+        self.base_url = (base_url or os.getenv('EVENT_BUS_URL', 'http://localhost:5000')).rstrip('/')
+        self.local = None
+        self._local_retry_at = 0.0
+        if self.base_url.startswith(LOCAL_SCHEME):
+            self.local = LocalTransportClient(self.base_url[len(LOCAL_SCHEME):], timeout)
+            self.base_url = os.getenv('EVENT_BUS_HTTP_URL', 'http://event-bus:5000').rstrip('/')
+        self.machine_id = machine_id or os.getenv('MACHINE_ID')
+        self.state_name = state_name or os.getenv('STATE_NAME')
+        self.generation = generation or os.getenv('STATE_GENERATION')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_window = float(os.getenv('EVENT_BATCH_WINDOW', '0')) if batch_window is None else batch_window
+        self.batch_size = batch_size
+
+        payload_format = payload_format or os.getenv('EVENT_BUS_FORMAT', 'json')
+        if payload_format == 'msgpack' and wire_format.msgpack is None:
+            logger.warning("msgpack is not installed, falling back to JSON")
+            payload_format = 'json'
+        self.content_type = wire_format.MSGPACK_TYPE if payload_format == 'msgpack' else wire_format.JSON_TYPE
+
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': self.content_type, 'Accept': self.content_type})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._batch = []  # [(payload, Future)]
+        self._batch_cond = threading.Condition()
+        self._batch_thread = None
+        self._closed = False
+
+    def _post(self, path: str, payload) -> Tuple[int, dict]:
+        """再試行付きPOST（再試行しても失敗した場合は最後の (ステータス, 応答本文) を返すか例外を送出）"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                status_code, body, retry_after = self._send(path, payload)
+                if status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    return status_code, body
+                delay = self._retry_delay(attempt, retry_after)
+                logger.warning(f"Event bus returned {status_code} for {path}, retrying in {delay:.2f}s")
+            except requests.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning(f"Event bus request {path} failed ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _send(self, path: str, payload) -> Tuple[int, dict, Optional[str]]:
+        """ローカルトランスポート（使用可能な場合）またはHTTPで1回送信"""
+        if self.local is not None and path in LOCAL_PATHS and time.time() >= self._local_retry_at:
+            try:
+                status_code, body, headers = self.local.request(path, payload)
+                return status_code, body, headers.get('Retry-After')
+            except (OSError, ValueError) as e:
+                # バスが別ホスト（ソケット未作成）や再起動中の場合はHTTPで送信
+                self._local_retry_at = time.time() + LOCAL_RETRY_INTERVAL
+                logger.warning(f"Local transport {self.local.path} unavailable ({str(e)}), falling back to HTTP")
+        response = self.session.post(
+            f"{self.base_url}{path}", data=wire_format.dumps(payload, self.content_type),
+            timeout=self.timeout
+        )
+        # 応答のContent-Typeに応じてデコード（転送された応答はJSONの場合がある）
+        body = wire_format.loads(response.content, response.headers.get('Content-Type')) if response.content else {}
+        return response.status_code, body, response.headers.get('Retry-After')
+
+    def _retry_delay(self, attempt: int, retry_after: str = None) -> float:
+        """フルジッター付き指数バックオフ（Retry-Afterがあればそれを上限まで尊重）"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff * (2 ** attempt), self.max_backoff))
+
+    def _transition_payload(self, transition_name: str, event_data: dict, machine_id: str) -> dict:
+        payload = {
+            'machine_id': machine_id or self.machine_id,
+            'transition_name': transition_name,
+            'event_data': event_data or {},
+            'idempotency_key': uuid.uuid4().hex
+        }
+        # 他マシン宛ての遷移には自身の世代を付けない（世代は自マシンの状態に対するもの）
+        if self.generation and payload['machine_id'] == self.machine_id:
+            payload['generation'] = self.generation
+        return payload
+
+    def send_transition(self, transition_name: str, event_data: dict = None,
+                        machine_id: str = None) -> Optional[dict]:
+        """遷移イベントを送信し、受理されれば応答を返す（失敗はログのみでNone）"""
+        if self.batch_window > 0:
+            return self.submit_transition(transition_name, event_data, machine_id).result()
+        payload = self._transition_payload(transition_name, event_data, machine_id)
+        try:
+            status_code, body = self._post('/transition', payload)
+            return self._result(transition_name, status_code, body)
+        except Exception as e:
+            logger.error(f"Error sending transition event: {str(e)}")
+            return None
+
+    def _result(self, transition_name: str, status_code: int, body: dict) -> Optional[dict]:
+        if status_code in (200, 202):
+            logger.info(f"Transition event sent: {transition_name}")
+            return body
+        if status_code == 409:
+            # 状態が既に切り替わり、このコンテナは置き換えられている（再試行しない）
+            logger.warning(f"Transition event {transition_name} dropped: container generation superseded")
+            return None
+        logger.error(f"Failed to send transition event {transition_name}: {status_code} {body.get('message', '')}")
+        return None
+
+    def submit_transition(self, transition_name: str, event_data: dict = None,
+                          machine_id: str = None) -> Future:
+        """遷移イベントをバッチに追加し、送信結果のFutureを返す（batch_window内のイベントをまとめて送信）"""
+        future = Future()
+        payload = self._transition_payload(transition_name, event_data, machine_id)
+        with self._batch_cond:
+            if self._closed:
+                raise RuntimeError('Event bus client is closed')
+            if self._batch_thread is None:
+                self._batch_thread = threading.Thread(
+                    target=self._batch_loop, daemon=True, name='event-bus-batch'
+                )
+                self._batch_thread.start()
+            self._batch.append((payload, future))
+            self._batch_cond.notify_all()
+        return future
+
+    def _batch_loop(self):
+        while True:
+            with self._batch_cond:
+                self._batch_cond.wait_for(lambda: self._batch or self._closed)
+                if not self._batch and self._closed:
+                    return
+                # 最初のイベントから窓の終わりまで（または上限件数まで）後続を待つ
+                deadline = time.time() + self.batch_window
+                self._batch_cond.wait_for(
+                    lambda: len(self._batch) >= self.batch_size or self._closed,
+                    max(0.0, deadline - time.time())
+                )
+                batch, self._batch = self._batch[:self.batch_size], self._batch[self.batch_size:]
+            self._send_batch(batch)
+
+    def _send_batch(self, batch: List[tuple]):
+        """バッチを送信（項目毎の503等は、その項目のみ _post と同じバックオフで max_retries 回まで再送）"""
+        for attempt in range(self.max_retries + 1):
+            # 1件のみのバッチは /transition で送信し _post 内で再試行（再送分は /transitions で送り回数を共有）
+            single = len(batch) == 1 and attempt == 0
+            try:
+                if single:
+                    status_code, body = self._post('/transition', batch[0][0])
+                    results = [dict(body, status_code=status_code)]
+                else:
+                    status_code, body = self._post('/transitions', {'transitions': [payload for payload, _ in batch]})
+                    if status_code != 200:
+                        raise RuntimeError(f"Batch rejected: {status_code} {body.get('message', '')}")
+                    results = body['results']
+            except Exception as e:
+                logger.error(f"Error sending {len(batch)} transition events: {str(e)}")
+                for _, future in batch:
+                    future.set_result(None)
+                return
+
+            retry = []
+            last_attempt = single or attempt == self.max_retries
+            for (payload, future), result in zip(batch, results):
+                status_code = result.pop('status_code')
+                if status_code in RETRY_STATUS and not last_attempt:
+                    retry.append((payload, future))
+                else:
+                    future.set_result(self._result(payload['transition_name'], status_code, result))
+            if not retry:
+                return
+            delay = self._retry_delay(attempt)
+            logger.warning(f"Event bus returned a retryable status for {len(retry)} of {len(batch)} "
+                           f"batched events, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            batch = retry
+
+    def register_standby(self, attempts: int = 5) -> bool:
+        """スタンバイコンテナとして起動完了を通知"""
+        for _ in range(attempts):
+            try:
+                status_code, _ = self._post('/standby', self._container_payload())
+                if status_code == 200:
+                    return True
+            except Exception as e:
+                logger.warning(f"Failed to register standby container: {str(e)}")
+            time.sleep(1)
+        return False
+
+    def notify_ready(self):
+        """起動完了をイベントバスに通知（make-before-break切り替えの準備完了判定に使用）"""
+        try:
+            self._post('/ready', self._container_payload())
+        except Exception as e:
+            logger.warning(f"Failed to send ready notification: {str(e)}")
+
+    def wait_for_activation(self):
+        """スタンバイモード（STANDBY_MODE=1）ではスタンバイ登録後、イベントバスからの起動シグナル(SIGUSR1)を待機"""
+        if os.getenv('STANDBY_MODE') != '1':
+            return
+
+        # 通知前にシグナルをブロックして取りこぼしを防ぐ
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+        self.register_standby()
+        logger.info(f"Standby ready, waiting for activation: {self.machine_id}-{self.state_name}")
+        signal.sigwait({signal.SIGUSR1})
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGUSR1})
+        logger.info("Activated from standby pool")
+
+    def run_state(self, run: Callable[[], None]):
+        """状態コンテナの処理を実行（スタンバイの起動待ち → 起動完了通知 → run）
+
+        frozenライフサイクル（STATE_LIFECYCLE=frozen）では遷移時に一時停止され、再開シグナル(SIGUSR1)を
+        受けてから次の run を行う（一時停止されるまでrunを繰り返すと無効・旧世代のイベントを送り続けるため）。
+        """
+        self.wait_for_activation()
+        frozen = os.getenv('STATE_LIFECYCLE') == 'frozen'
+        if frozen:
+            # 再開シグナルは既定動作（終了）にならないよう最初の処理前からブロック
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGUSR1})
+        self.notify_ready()
+        run()
+        while frozen:
+            logger.info(f"Waiting for resume: {self.machine_id}-{self.state_name}")
+            signal.sigwait({signal.SIGUSR1})
+            logger.info("Resumed from frozen state")
+            run()
+
+    def _container_payload(self) -> dict:
+        return {
+            'machine_id': self.machine_id,
+            'state_name': self.state_name,
+            'container_id': socket.gethostname()
+        }
+
+    def close(self):
+        """未送信のバッチを送信してから接続を閉じる"""
+        with self._batch_cond:
+            self._closed = True
+            self._batch_cond.notify_all()
+            thread = self._batch_thread
+        if thread is not None:
+            thread.join(self.timeout * (self.max_retries + 1))
+        if self.local is not None:
+            self.local.close()
+        self.session.close()
+
+class AsyncEventBusClient:
+    """asyncioから使うためのラッパー（HTTP処理は同じ接続プールを使いスレッドで実行）"""
+    def __init__(self, client: EventBusClient = None, **kwargs):
+        self.client = client or EventBusClient(**kwargs)
+
+    async def send_transition(self, transition_name: str, event_data: dict = None,
+                              machine_id: str = None) -> Optional[dict]:
+        if self.client.batch_window > 0:
+            return await asyncio.wrap_future(
+                self.client.submit_transition(transition_name, event_data, machine_id)
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.client.send_transition, transition_name, event_data, machine_id
+        )
+
+    async def notify_ready(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.client.notify_ready)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.client.close)
@@ -0,0 +1,155 @@
+import logging
+import os
+import socket
+import stat
+import struct
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import wire_format
+
+logger = logging.getLogger(__name__)
+
+# EVENT_BUS_URL にこのスキームを指定するとUnixドメインソケットで接続
+LOCAL_SCHEME = 'unix://'
+
+# フレーム: 本文長（4バイト）+ 形式（0: JSON, 1: msgpack）+ 本文
+_HEADER = struct.Struct('>IB')
+_JSON, _MSGPACK = 0, 1
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+def _content_type(flag: int) -> str:
+    return wire_format.MSGPACK_TYPE if flag == _MSGPACK else wire_format.JSON_TYPE
+
+def _send_frame(sock: socket.socket, message: dict, flag: int):
+    body = wire_format.dumps(message, _content_type(flag))
+    sock.sendall(_HEADER.pack(len(body), flag) + body)
+
+def _recv_frame(rfile) -> Optional[Tuple[dict, int]]:
+    """1フレームを受信（接続が閉じられた場合はNone）"""
+    header = rfile.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ConnectionError('Connection closed in the middle of a frame header')
+    length, flag = _HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {length} bytes")
+    body = rfile.read(length)
+    if len(body) < length:
+        raise ConnectionError('Connection closed in the middle of a frame')
+    return wire_format.loads(body, _content_type(flag)), flag
+
+class LocalTransportServer:
+    """同一ホストの状態コンテナからのリクエストをUnixドメインソケットで受け付ける
+
+    HTTPのパースを経由せず、長さ付きフレームで {'path', 'body'} を受け取り
+    handler(path, body) の (応答本文, ステータス[, ヘッダー]) を返す。接続は使い回される。
+    """
+    def __init__(self, path: str, handler: Callable[[str, dict], tuple], backlog: int = 128):
+        self.path = path
+        self.handler = handler
+        self.backlog = backlog
+        self.stats = {'connections': 0, 'requests': 0, 'errors': 0}
+        self._sock = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # 前のリーダーが残したソケットファイルは削除して作り直す
+        if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o666)  # 状態コンテナは別ユーザーで動作し得る
+        self._sock.listen(self.backlog)
+        threading.Thread(target=self._accept_loop, daemon=True, name='local-transport').start()
+        logger.info(f"Local transport listening on {self.path}")
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _accept_loop(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.stats['connections'] += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        rfile = conn.makefile('rb')
+        try:
+            while True:
+                frame = _recv_frame(rfile)
+                if frame is None:
+                    return
+                request, flag = frame
+                _send_frame(conn, self._dispatch(request), flag)
+        except Exception as e:
+            logger.warning(f"Local transport connection closed: {str(e)}")
+        finally:
+            rfile.close()
+            conn.close()
+
+    def _dispatch(self, request: dict) -> dict:
+        self.stats['requests'] += 1
+        try:
+            body, status, *rest = self.handler(request['path'], request.get('body') or {})
+            headers = rest[0] if rest else {}
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Local transport request {request.get('path')} failed: {str(e)}")
+            body, status, headers = {'status': 'error', 'message': str(e)}, 500, {}
+        return {'status': status, 'body': body, 'headers': headers}
+
+    def get_stats(self) -> Dict[str, object]:
+        return dict(self.stats, path=self.path)
+
+class LocalTransportClient:
+    """LocalTransportServer への接続（1接続を使い回し、切断時は次のリクエストで再接続）"""
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self.flag = _MSGPACK if wire_format.msgpack is not None else _JSON
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock, self._rfile = sock, sock.makefile('rb')
+
+    def request(self, path: str, body: dict) -> Tuple[int, dict, dict]:
+        """(ステータス, 応答本文, ヘッダー) を返す（接続できない・切断された場合は例外）"""
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                _send_frame(self._sock, {'path': path, 'body': body}, self.flag)
+                frame = _recv_frame(self._rfile)
+                if frame is None:
+                    raise ConnectionError('Connection closed by the event bus')
+            except Exception:
+                self._close()
+                raise
+            response = frame[0]
+            return response['status'], response['body'], response.get('headers') or {}
+
+    def _close(self):
+        if self._sock is not None:
+            self._rfile.close()
+            self._sock.close()
+            self._sock = self._rfile = None
+
+    def close(self):
+        with self._lock:
+            self._close()
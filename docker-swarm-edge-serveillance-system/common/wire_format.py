@@ -0,0 +1,103 @@
+import json
+import sys
+from array import array
+from typing import List, Optional
+
+# 高速なエンコーダがあれば使用（未インストールなら標準のjsonのみ）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+MSGPACK_TYPES = (MSGPACK_TYPE, 'application/x-msgpack')
+
+# バウンディングボックスの列（座標はint32、信頼度はfloat32のリトルエンディアン配列）
+BOX_COORDS = ('x1', 'y1', 'x2', 'y2')
+BOXES_KEY = 'bounding_boxes'
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(';', 1)[0].strip() in MSGPACK_TYPES
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+def _from_bytes(typecode: str, data: bytes) -> list:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tolist()
+
+def pack_boxes(boxes: List[dict]) -> dict:
+    """[{'x1', 'y1', 'x2', 'y2', 'confidence'}, ...] を列毎の詰めたバイト列に変換"""
+    return {
+        'count': len(boxes),
+        'xyxy': _to_bytes(array('i', [int(box[key]) for box in boxes for key in BOX_COORDS])),
+        'confidence': _to_bytes(array('f', [float(box.get('confidence', 0.0)) for box in boxes]))
+    }
+
+def unpack_boxes(packed: dict) -> List[dict]:
+    """pack_boxes の逆変換（信頼度はfloat32精度）"""
+    coords = _from_bytes('i', packed['xyxy'])
+    confidences = _from_bytes('f', packed['confidence'])
+    if len(coords) != 4 * packed['count'] or len(confidences) != packed['count']:
+        raise ValueError('Malformed packed bounding boxes')
+    return [
+        {'x1': coords[index], 'y1': coords[index + 1], 'x2': coords[index + 2], 'y2': coords[index + 3],
+         'confidence': confidence}
+        for index, confidence in zip(range(0, len(coords), 4), confidences)
+    ]
+
+def _convert_boxes(value, packing: bool):
+    """ペイロード内の bounding_boxes を再帰的に列形式と相互変換"""
+    if isinstance(value, dict):
+        converted = {}
+        for key, item in value.items():
+            if key == BOXES_KEY and packing and isinstance(item, list):
+                converted[key] = pack_boxes(item)
+            elif key == BOXES_KEY and not packing and isinstance(item, dict) and 'xyxy' in item:
+                converted[key] = unpack_boxes(item)
+            else:
+                converted[key] = _convert_boxes(item, packing)
+        return converted
+    if isinstance(value, list):
+        return [_convert_boxes(item, packing) for item in value]
+    return value
+
+def dumps(payload, content_type: str = JSON_TYPE) -> bytes:
+    """content_type に応じてエンコード（msgpackではバウンディングボックスを列形式に詰める）"""
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise ValueError('msgpack is not installed')
+        return msgpack.packb(_convert_boxes(payload, True), use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+def loads(body: bytes, content_type: str = JSON_TYPE):
+    """content_type に応じてデコード（列形式のバウンディングボックスは辞書のリストに戻す）"""
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise ValueError('msgpack is not installed')
+        return _convert_boxes(msgpack.unpackb(body, raw=False), False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def negotiate(accept: Optional[str], content_type: Optional[str]) -> str:
+    """応答形式を決定（Acceptでmsgpackを要求されるか、Accept指定なしでmsgpackで送られた場合はmsgpack）"""
+    if msgpack is None:
+        return JSON_TYPE
+    if accept and any(media_type in accept for media_type in MSGPACK_TYPES):
+        return MSGPACK_TYPE
+    if (not accept or accept.strip() == '*/*') and is_msgpack(content_type):
+        return MSGPACK_TYPE
+    return JSON_TYPE
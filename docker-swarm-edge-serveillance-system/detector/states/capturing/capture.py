@@ -1,11 +1,11 @@
 import time
-import requests
 import cv2
 import numpy as np
 import os
 import json
 from datetime import datetime
 import logging
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,6 +15,7 @@ class CaptureState:
         self.machine_id = os.getenv('MACHINE_ID', 'detector')
         self.state_name = os.getenv('STATE_NAME', 'capturing')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         self.capture_interval = 0.5  # 500ms
         
     def run(self):
@@ -32,7 +33,7 @@ class CaptureState:
                 cv2.imwrite(image_path, image)
                 
                 # 状態遷移イベント送信
-                self._send_transition_event('image_captured', {
+                self.event_bus.send_transition('image_captured', {
                     'image_path': image_path,
                     'timestamp': timestamp,
                     'image_size': image.shape
@@ -59,29 +60,7 @@ class CaptureState:
             
         return image
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     capture_state = CaptureState()
+    capture_state.event_bus.notify_ready()
     capture_state.run()
\ No newline at end of file
@@ -1,11 +1,11 @@
 import cv2
 import numpy as np
 from ultralytics import YOLO
-import requests
 import os
 import time
 import logging
 from datetime import datetime
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,6 +15,7 @@ class ProcessingState:
         self.machine_id = os.getenv('MACHINE_ID', 'detector')
         self.state_name = os.getenv('STATE_NAME', 'processing')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         self.processing_timeout = 0.5
         self.confidence_threshold = 0.5
         
@@ -32,7 +33,7 @@ class ProcessingState:
         
         if not os.path.exists(image_path):
             logger.error(f"Image not found: {image_path}")
-            self._send_transition_event('processing_error', {
+            self.event_bus.send_transition('processing_error', {
                 'error': 'image_not_found',
                 'timestamp': datetime.now().isoformat()
             })
@@ -47,7 +48,7 @@ class ProcessingState:
             processing_time = time.time() - start_time
             
             if processing_time > self.processing_timeout:
-                self._send_transition_event('processing_timeout', {
+                self.event_bus.send_transition('processing_timeout', {
                     'timeout_duration': processing_time,
                     'timestamp': datetime.now().isoformat()
                 })
@@ -56,7 +57,7 @@ class ProcessingState:
             
             if detection_result['person_detected']:
                 # 人物検出時
-                self._send_transition_event('person_detected', {
+                self.event_bus.send_transition('person_detected', {
                     'detection_confidence': detection_result['max_confidence'],
                     'timestamp': datetime.now().isoformat(),
                     'person_count': detection_result['person_count'],
@@ -67,7 +68,7 @@ class ProcessingState:
                           f"confidence: {detection_result['max_confidence']:.2f})")
             else:
                 # 人物未検出
-                self._send_transition_event('processing_complete', {
+                self.event_bus.send_transition('processing_complete', {
                     'result': 'no_person',
                     'timestamp': datetime.now().isoformat(),
                     'processing_time': processing_time
@@ -76,7 +77,7 @@ class ProcessingState:
                 
         except Exception as e:
             logger.error(f"Processing error: {str(e)}")
-            self._send_transition_event('processing_error', {
+            self.event_bus.send_transition('processing_error', {
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             })
@@ -119,29 +120,7 @@ class ProcessingState:
             'bounding_boxes': bounding_boxes
         }
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     processing_state = ProcessingState()
+    processing_state.event_bus.notify_ready()
     processing_state.run()
\ No newline at end of file
@@ -1,11 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, request, jsonify, make_response
 import docker
 import yaml
 import json
+import os
+import threading
+import time
 from datetime import datetime
 import logging
 from state_machines import StateMachineManager
 from rules import RulesEngine
+from transition_pipeline import TransitionPipeline
+from image_prewarm import ImagePrewarmer
+from machine_startup import MachineStartup
+from transition_journal import TransitionJournal
+from sharding import ShardRouter
+import wire_format
+from replication import LeaderLease, ReplicationFollower, ReplicationLog, default_advertise_url
 from container_manager_swarm import SwarmContainerManager  # 変更
 
 app = Flask(__name__)
@@ -16,141 +26,479 @@ logger = logging.getLogger(__name__)
 container_manager = None
 rules_engine = None
 state_machine_manager = None
+transition_pipeline = None
+image_prewarmer = None
+machine_startup = None
+shard_router = None
+leader_lease = None
+replication_log = None
+replication_follower = None
+
+# 破棄したイベント数（duplicate: 冪等キーの重複 / stale: 置き換えられたコンテナ世代）
+fenced_events = {'duplicate': 0, 'stale': 0}
+fenced_events_lock = threading.Lock()  # Flaskのリクエストスレッド間で加算が失われないようにする
+
+# ホットスタンバイが自身で応答するエンドポイント（その他はリーダーへ転送）
+STANDBY_LOCAL_ENDPOINTS = ('health_check', 'replication_stream', 'get_shard')
 
 def initialize_system():
     """システム初期化"""
-    global container_manager, rules_engine, state_machine_manager
+    global container_manager, rules_engine, state_machine_manager, transition_pipeline, image_prewarmer, machine_startup, shard_router
+    global leader_lease, replication_log, replication_follower
     
-    container_manager = SwarmContainerManager()  # 変更
+    # machine_idのコンシステントハッシュで自シャードが所有するマシンのみ管理
+    shard_router = ShardRouter()
+    container_manager = SwarmContainerManager(
+        event_bus_url_for=shard_router.url_for, on_generation=activate_generation
+    )  # 変更
     rules_engine = RulesEngine()
-    state_machine_manager = StateMachineManager()
+    # 遷移ジャーナル（再起動時はスナップショット+末尾の遷移から状態を復元）
+    journal = TransitionJournal(
+        os.getenv('JOURNAL_DIR', '/data/journal'),
+        flush_interval=float(os.getenv('JOURNAL_FLUSH_INTERVAL', '0.05')),
+        snapshot_every=int(os.getenv('JOURNAL_SNAPSHOT_EVERY', '1000'))
+    )
+    # ホットスタンバイ構成（LEASE_PATH指定時）では確定済み遷移をフォロワーへ配信
+    lease_path = os.getenv('LEASE_PATH', '')
+    if lease_path:
+        replication_log = ReplicationLog(
+            int(os.getenv('REPLICATION_LOG_SIZE', '10000')),
+            wait_timeout=float(os.getenv('REPLICATION_WAIT_TIMEOUT', '0.5'))
+        )
+    state_machine_manager = StateMachineManager(
+        journal=journal, owns=shard_router.is_local, replication_log=replication_log
+    )
+    transition_pipeline = TransitionPipeline(
+        apply_transition, max_workers=int(os.getenv('TRANSITION_WORKERS', '4')),
+        id_prefix=shard_router.transition_id_prefix()
+    )
     
-    # ステートマシンを初期状態で開始
-    state_machine_manager.initialize_machines()
+    # 全状態のイメージを対象ノードに事前取得（設定ファイル変更時は再取得）
+    image_prewarmer = ImagePrewarmer(
+        container_manager.prewarm_image, state_machine_manager.config_paths,
+        check_interval=float(os.getenv('PREWARM_CHECK_INTERVAL', '30')),
+        config_glob=os.path.join(state_machine_manager.config_dir, '*' + StateMachineManager.CONFIG_SUFFIX)
+    )
+    machine_startup = MachineStartup(
+        start_machine, max_workers=int(os.getenv('STARTUP_WORKERS', '8'))
+    )
     
-    # 初期状態のコンテナを起動
     for machine_id in state_machine_manager.get_machine_ids():
         machine = state_machine_manager.get_machine(machine_id)
+        for state in machine.states.values():
+            container_manager.configure_resources(machine_id, state.name, state.resources)
+        container_manager.configure_placement(machine_id, machine.placement)
+    
+    if lease_path:
+        # 同一ノード上のリースを取得した方がリーダー、取得できなければホットスタンバイとして待機
+        leader_lease = LeaderLease(
+            lease_path, os.getenv('REPLICA_ADVERTISE_URL') or default_advertise_url()
+        )
+        if not leader_lease.try_acquire():
+            start_standby()
+            return
+    
+    start_leader()
+
+def start_leader(takeover=False):
+    """リーダーとして状態の永続化とコンテナ管理を開始"""
+    image_prewarmer.start()
+    
+    # ステートマシンを初期状態で開始（ジャーナルがあれば前回の状態を復元）
+    state_machine_manager.initialize_machines()
+    if leader_lease is not None:
+        leader_lease.is_leader = True
+    
+    # 初期状態のサービスを並列に起動（完了を待たずにHTTPサーバーを開始）
+    # 新規起動では初回のイメージ事前取得が終わるまで初期サービスを起動せず、その間の遷移は503で拒否する
+    # （最初の遷移がイメージの取得を待たないように。その間も /health は status: starting をHTTP 200で返す）
+    # 昇格時は稼働中のサービスを引き継ぐだけのため、完了を待たずに遷移を受け付ける
+    prewarm_timeout = float(os.getenv('PREWARM_TIMEOUT', '600'))
+    machine_startup.start(
+        state_machine_manager.get_machine_ids(), accept_transitions=takeover,
+        wait_before_start=None if takeover else lambda: image_prewarmer.wait_first_pass(prewarm_timeout)
+    )
+
+def start_standby():
+    """ホットスタンバイとしてリーダーの確定済み遷移を複製し、リース解放時に昇格"""
+    global replication_follower
+    state_machine_manager.initialize_machines(start_journal=False)
+    replication_follower = ReplicationFollower(
+        leader_lease.leader_url, state_machine_manager.restore_states
+    )
+    replication_follower.start()
+    threading.Thread(target=promote_on_lease, daemon=True, name='leader-lease').start()
+    logger.info(f"Standing by for leader {leader_lease.leader_url()}")
+
+def promote_on_lease():
+    """リーダーのプロセス終了でリースが解放されたら昇格"""
+    leader_lease.acquire()
+    started_at = time.time()
+    replication_follower.stop()
+    # 配信が届く前にリーダーがジャーナルへ書き込んだ遷移も反映してからジャーナルを引き継ぐ
+    start_leader(takeover=True)
+    logger.info(f"Promoted to leader in {(time.time() - started_at) * 1000:.1f}ms "
+                f"(replicated up to seq {replication_follower.seq})")
+
+@app.before_request
+def forward_to_leader():
+    """ホットスタンバイ宛てのリクエストをリーダーへ転送（リーダー不在の間は503）"""
+    if leader_lease is None or leader_lease.is_leader or request.endpoint in STANDBY_LOCAL_ENDPOINTS:
+        return None
+    try:
+        response = replication_follower.forward(
+            request.method, request.full_path, request.get_data(), request.headers
+        )
+    except Exception as e:
+        return jsonify({
+            'status': 'unavailable', 'message': f"Leader unavailable: {str(e)}"
+        }), 503, {'Retry-After': '1'}
+    return relay_response(response)
+
+def start_machine(machine_id):
+    """マシン1台分の初期サービス起動（起動ワーカーで実行、1台あたり最大60秒の準備待ちを含む）"""
+    machine = state_machine_manager.get_machine(machine_id)
+    with machine.lock:
         initial_state = machine.get_current_state()
+    
+    # 前回起動時のサービスが復元した状態と一致すれば引き継ぎ、不一致のもののみ置き換え
+    adopted = container_manager.adopt_state_service(machine_id, initial_state)
+    container_manager.prepare_state_services(machine_id, machine.states.values())
+    if adopted is None:
         container_manager.start_state_container(
             machine_id, initial_state.name, initial_state.container_image
         )
 
 @app.route('/transition', methods=['POST'])
 def process_transition():
-    """状態遷移処理"""
-    data = request.json
+    """状態遷移処理（JSON/msgpackをContent-Typeで判別し、Acceptに応じた形式で応答）"""
+    return reply(*accept_transition(read_payload()))
+
+@app.route('/transitions', methods=['POST'])
+def process_transition_batch():
+    """複数の遷移イベントを1リクエストで受付（クライアントの短時間バッチ送信用、各イベントを順に処理）"""
+    results = []
+    for data in read_payload().get('transitions', []):
+        body, status = accept_transition(data)[:2]
+        results.append(dict(body, status_code=status))
+    return reply({'status': 'success', 'results': results})
+
+def read_payload():
+    """リクエスト本文をContent-Typeに応じてデコード（msgpack以外はJSONとして扱う）"""
+    try:
+        return wire_format.loads(request.get_data(), request.content_type)
+    except ValueError as e:
+        abort(reply({'status': 'error', 'message': f"Malformed request body: {str(e)}"}, 400))
+
+def reply(body, status=200, headers=None):
+    """Accept（指定がなければリクエストのContent-Type）に応じてJSONまたはmsgpackで応答"""
+    mimetype = wire_format.negotiate(request.headers.get('Accept'), request.content_type)
+    return Response(wire_format.dumps(body, mimetype), status=status, headers=headers, mimetype=mimetype)
+
+def decode_response(rv):
+    """転送先の応答を (応答本文, ステータス, ヘッダー) に戻す（クライアントの形式で応答し直すため）"""
+    response = make_response(rv)
+    headers = {key: response.headers[key] for key in ('Retry-After',) if key in response.headers}
+    return wire_format.loads(response.get_data(), response.mimetype), response.status_code, headers
+
+def accept_transition(data):
+    """遷移イベント1件の検証・確定・キュー投入（戻り値は (応答本文, ステータス[, ヘッダー])）"""
     machine_id = data['machine_id']
     transition_name = data['transition_name']
     event_data = data.get('event_data', {})
     
+    # 他シャード所有のマシンは所有シャードに転送
+    forwarded = route_to_owner(machine_id, '/transition', data)
+    if forwarded is not None:
+        return decode_response(forwarded)
+    
+    # 重複・旧世代コンテナからのイベントはロック・遷移判定・コンテナ操作の前に破棄
+    fenced = fence_event(machine_id, data)
+    if fenced is not None:
+        return fenced
+    
+    # 初期コンテナ起動中のマシンは遷移を受け付けない（クライアントは再試行）
+    if machine_startup.blocks_transitions(machine_id):
+        return {
+            'status': 'starting',
+            'message': f"Machine '{machine_id}' is still starting",
+            'machine_id': machine_id
+        }, 503, {'Retry-After': '5'}
+    
     try:
-        # 現在の状態をログ出力（デバッグ用）
         machine = state_machine_manager.get_machine(machine_id)
-        current_state = machine.get_current_state()
-        logger.info(f"Attempting transition '{transition_name}' on machine '{machine_id}' from state '{current_state.name}'")
-        
-        # 利用可能な遷移を確認
-        available_transitions = []
-        for trans_name, transition in machine.transitions.items():
-            if transition.from_state == current_state.name:
-                available_transitions.append(trans_name)
         
-        logger.info(f"Available transitions from '{current_state.name}': {available_transitions}")
-        
-        # 遷移が可能かチェック
-        if not machine.can_transition(transition_name):
-            error_msg = f"Invalid transition '{transition_name}' from state '{current_state.name}'. Available transitions: {available_transitions}"
-            logger.error(error_msg)
-            return jsonify({
-                'status': 'error', 
-                'message': error_msg,
-                'current_state': current_state.name,
-                'available_transitions': available_transitions
-            }), 400
-        
-        # 状態遷移実行
-        old_state, new_state = state_machine_manager.execute_transition(
-            machine_id, transition_name, event_data
-        )
-        
-        # コンテナ切り替え
-        container_manager.transition_container(
-            machine_id, old_state, new_state
-        )
+        # マシン単位のロック内で検証・確定・キュー投入を行い、コミット順とコンテナ切り替え順を一致させる
+        with machine.lock:
+            # ロック待ちの間に確定した同じキー・置き換えられた世代を再確認
+            fenced = fence_event(machine_id, data)
+            if fenced is not None:
+                return fenced
+            
+            # 現在の状態をログ出力（デバッグ用）
+            current_state = machine.get_current_state()
+            logger.info(f"Attempting transition '{transition_name}' on machine '{machine_id}' from state '{current_state.name}'")
+            
+            # 利用可能な遷移を確認（事前コンパイル済みの表から取得）
+            available_transitions = machine.get_available_transitions()
+            
+            logger.info(f"Available transitions from '{current_state.name}': {available_transitions}")
+            
+            # 遷移が可能かチェック
+            if not machine.can_transition(transition_name):
+                error_msg = f"Invalid transition '{transition_name}' from state '{current_state.name}'. Available transitions: {available_transitions}"
+                logger.error(error_msg)
+                return {
+                    'status': 'error', 
+                    'message': error_msg,
+                    'current_state': current_state.name,
+                    'available_transitions': available_transitions
+                }, 400
+            
+            # 状態遷移実行（ステートマシンの更新のみ同期的に確定）
+            old_state, new_state = state_machine_manager.execute_transition(
+                machine_id, transition_name, event_data, idempotency_key=data.get('idempotency_key')
+            )
+            
+            # コンテナ切り替えとルール連鎖はワーカーでマシン毎に順次実行
+            record = transition_pipeline.submit(
+                machine_id, transition_name, old_state, new_state, event_data
+            )
+            version = machine.version
+            replication_seq = machine.replication_seq
         
-        # ルールに基づく他マシンへのイベント送信
-        triggered_events = rules_engine.get_triggered_events(
-            machine_id, transition_name, event_data
-        )
+        # 応答前にホットスタンバイへの送信を待ち、応答済みの遷移がフェイルオーバーで失われないようにする
+        # （ロック解放後に他の遷移が追加されても、この遷移のseqまでを待つ）
+        if replication_log is not None:
+            replication_log.wait_replicated(replication_seq)
         
-        for target_machine, event in triggered_events:
-            send_event_to_machine(target_machine, event)
-            
-        logger.info(f"Successful transition: {machine_id} {old_state.name} -> {new_state.name}")
+        logger.info(f"Accepted transition {record.id[:8]}: {machine_id} {old_state.name} -> {new_state.name} (v{version})")
             
-        return jsonify({
-            'status': 'success',
+        return {
+            'status': 'accepted',
+            'transition_id': record.id,
             'machine_id': machine_id,
             'old_state': old_state.name,
             'new_state': new_state.name,
-            'triggered_events': len(triggered_events)
-        })
+            'version': version
+        }, 202
         
     except Exception as e:
         logger.error(f"Transition error: {str(e)}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return {'status': 'error', 'message': str(e)}, 500
 
-def send_event_to_machine(target_machine, event):
-    """他のステートマシンにイベント送信"""
+def fence_event(machine_id, data):
+    """確定済みの冪等キー（再送）や置き換えられたコンテナ世代のイベントなら応答を返す（O(1)、ログなし）"""
+    machine = state_machine_manager.machines.get(machine_id)
+    if machine is None:
+        return None
+    version = machine.applied_version(data.get('idempotency_key'))
+    if version is not None:
+        with fenced_events_lock:
+            fenced_events['duplicate'] += 1
+        return {
+            'status': 'duplicate',
+            'machine_id': machine_id,
+            'version': version,
+            'current_state': machine.current_state.name
+        }, 200
+    if machine.is_stale_generation(data.get('generation')):
+        with fenced_events_lock:
+            fenced_events['stale'] += 1
+        return {
+            'status': 'stale',
+            'message': f"Generation {data['generation']} of '{machine_id}' has been superseded",
+            'machine_id': machine_id
+        }, 409
+    return None
+
+def activate_generation(machine_id, state_name, generation):
+    """状態コンテナの起動・再開前に、その世代のみがイベントを送信できるよう設定（Noneは検査しない）"""
+    machine = state_machine_manager.machines.get(machine_id)
+    if machine is None:
+        return
+    with machine.lock:
+        # 切り替え中に次の遷移が確定していれば、その遷移のコンテナで設定される
+        if machine.current_state.name == state_name:
+            machine.generation = generation
+
+def route_to_owner(machine_id, path, payload):
+    """他シャード所有のマシンなら所有シャードに転送した応答、自シャードならNone"""
+    if shard_router.is_local(machine_id):
+        return None
+    if request.headers.get(ShardRouter.FORWARDED_HEADER):
+        # シャード設定が食い違っている場合に転送が往復しないよう再転送はしない
+        return jsonify({
+            'status': 'error',
+            'message': f"Machine '{machine_id}' is not owned by shard {shard_router.shard_id}"
+        }), 421
+    return forward_response(shard_router.owner(machine_id), 'POST', path, payload)
+
+def forward_response(shard, method, path, payload=None):
+    """他シャードにリクエストを転送し、応答をそのまま返す"""
     try:
-        # 対象マシンの適切な遷移を実行
-        if state_machine_manager.can_handle_event(target_machine, event):
-            transition_name = state_machine_manager.get_transition_for_event(
-                target_machine, event
+        response = shard_router.forward(shard, method, path, json=payload, params=request.args)
+    except Exception as e:
+        logger.error(f"Forwarding {path} to shard {shard} failed: {str(e)}")
+        return jsonify({'status': 'error', 'message': f"Shard {shard} unavailable: {str(e)}"}), 502
+    return relay_response(response)
+
+def relay_response(response):
+    """転送先の応答をそのまま返す"""
+    headers = {
+        key: value for key, value in response.headers.items()
+        if key in ('Content-Type', 'Retry-After')
+    }
+    return response.content, response.status_code, headers
+
+def apply_transition(record):
+    """確定済み遷移のコンテナ切り替えとルール連鎖（ワーカースレッドで実行）"""
+    # ルール連鎖で起動中のマシンに遷移が入った場合は初期コンテナ起動の完了後に切り替え
+    machine_startup.wait(record.machine_id)
+    
+    # コンテナ切り替え
+    container_manager.transition_container(
+        record.machine_id, record.old_state, record.new_state
+    )
+    
+    # ルールに基づく他マシンへのイベント送信（連鎖先の遷移からは再評価しない）
+    if record.parent_id is None:
+        triggered_events = rules_engine.get_triggered_events(
+            record.machine_id, record.transition_name, record.event_data
+        )
+        record.triggered_events = len(triggered_events)
+        
+        for target_machine, event in triggered_events:
+            # テンプレート名が対象の場合は全インスタンスに送信
+            for target in state_machine_manager.resolve_targets(target_machine):
+                send_event_to_machine(target, event, parent_id=record.id)
+    
+    logger.info(f"Successful transition: {record.machine_id} {record.old_state.name} -> {record.new_state.name}")
+
+def send_event_to_machine(target_machine, event, parent_id=None):
+    """他のステートマシンにイベント送信"""
+    if not shard_router.is_local(target_machine):
+        # 他シャード所有のマシンへは所有シャードの /events に転送
+        try:
+            response = shard_router.forward(
+                shard_router.owner(target_machine), 'POST', '/events',
+                json={'machine_id': target_machine, 'event': event, 'parent_id': parent_id}
             )
+            response.raise_for_status()
+            logger.info(f"Event routed to shard {shard_router.owner(target_machine)} for {target_machine}: {event['name']}")
+        except Exception as e:
+            logger.error(f"Error routing event to {target_machine}: {str(e)}")
+        return
+    
+    try:
+        machine = state_machine_manager.get_machine(target_machine)
+        
+        # 対象マシンの適切な遷移を実行（判定から確定までを原子的に行う）
+        with machine.lock:
+            transition_name = None
+            if state_machine_manager.can_handle_event(target_machine, event):
+                transition_name = state_machine_manager.get_transition_for_event(
+                    target_machine, event
+                )
             
             if transition_name:
                 old_state, new_state = state_machine_manager.execute_transition(
                     target_machine, transition_name, event['data']
                 )
                 
-                container_manager.transition_container(
-                    target_machine, old_state, new_state
+                transition_pipeline.submit(
+                    target_machine, transition_name, old_state, new_state,
+                    event['data'], parent_id=parent_id
                 )
-                
-                logger.info(f"Event sent to {target_machine}: {event['name']}")
+        
+        if transition_name:
+            logger.info(f"Event sent to {target_machine}: {event['name']}")
         else:
             logger.warning(f"Machine {target_machine} cannot handle event {event['name']}")
                 
     except Exception as e:
         logger.error(f"Error sending event to {target_machine}: {str(e)}")
 
+@app.route('/events', methods=['POST'])
+def receive_event():
+    """他シャードからのルール連鎖イベント受信"""
+    data = read_payload()
+    forwarded = route_to_owner(data['machine_id'], '/events', data)
+    if forwarded is not None:
+        return forwarded
+    send_event_to_machine(data['machine_id'], data['event'], parent_id=data.get('parent_id'))
+    return reply({'status': 'accepted'}, 202)
+
+@app.route('/transitions/<transition_id>', methods=['GET'])
+def get_transition(transition_id):
+    """非同期遷移の処理状況取得（?wait=秒 で完了まで待機）"""
+    # 遷移IDの接頭辞から処理したシャードを判定して転送
+    shard = shard_router.shard_of_transition(transition_id)
+    if shard is not None and shard != shard_router.shard_id:
+        return reply(*decode_response(forward_response(shard, 'GET', f'/transitions/{transition_id}')))
+    
+    wait = request.args.get('wait', type=float)
+    if wait:
+        record = transition_pipeline.wait(transition_id, min(wait, 60))
+    else:
+        record = transition_pipeline.get(transition_id)
+    
+    if record is None:
+        return reply({'status': 'error', 'message': f"Unknown transition: {transition_id}"}, 404)
+    return reply(record.to_dict())
+
+@app.route('/rules/evaluate', methods=['POST'])
+def evaluate_rules():
+    """イベント列に対するルール評価のみを一括実行（リプレイ・バースト処理用、遷移は行わない）"""
+    events = read_payload().get('events', [])
+    try:
+        inputs = [
+            (e['machine_id'], e['transition_name'], e.get('event_data', {}))
+            for e in events
+        ]
+        results = rules_engine.get_triggered_events_batch(inputs)
+    except Exception as e:
+        logger.error(f"Rule evaluation error: {str(e)}")
+        return reply({'status': 'error', 'message': str(e)}, 400)
+    
+    return reply({
+        'status': 'success',
+        'results': [
+            [{'target_machine': target_machine, 'event': event} for target_machine, event in triggered]
+            for triggered in results
+        ]
+    })
+
 @app.route('/status', methods=['GET'])
 def get_status():
     """システム状態取得"""
     status = {}
     for machine_id in state_machine_manager.get_machine_ids():
         machine = state_machine_manager.get_machine(machine_id)
-        current_state = machine.get_current_state()
+        with machine.lock:
+            current_state = machine.get_current_state()
+            version = machine.version
+            # 利用可能な遷移も含める
+            available_transitions = machine.get_available_transition_info()
         container_status = container_manager.get_container_status(machine_id)
         
-        # 利用可能な遷移も含める
-        available_transitions = []
-        for trans_name, transition in machine.transitions.items():
-            if transition.from_state == current_state.name:
-                available_transitions.append({
-                    'name': trans_name,
-                    'to_state': transition.to_state,
-                    'trigger_event': transition.trigger_event
-                })
-        
         status[machine_id] = {
             'current_state': current_state.name,
+            'version': version,
             'container_image': current_state.container_image,
             'container_status': container_status,
-            'available_transitions': available_transitions
+            'available_transitions': available_transitions,
+            'startup': machine_startup.get_machine(machine_id),
+            'shard': shard_router.shard_id
         }
+    
+    # 他シャードのマシン状態も集約（転送されたリクエストでは自シャード分のみ）
+    if shard_router.enabled and not request.headers.get(ShardRouter.FORWARDED_HEADER):
+        for shard in shard_router.peers():
+            try:
+                status.update(shard_router.forward(shard, 'GET', '/status').json())
+            except Exception as e:
+                logger.warning(f"Status of shard {shard} unavailable: {str(e)}")
         
     return jsonify(status)
 
@@ -164,6 +512,11 @@ def get_nodes():
         logger.error(f"Failed to get nodes: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/placement', methods=['GET'])
+def get_placement():
+    """マシン毎の配置先ノード取得"""
+    return jsonify(container_manager.placement.get_assignments())
+
 @app.route('/swarm', methods=['GET'])
 def get_swarm_info():
     """Swarmクラスタ情報取得"""
@@ -174,10 +527,87 @@ def get_swarm_info():
         logger.error(f"Failed to get swarm info: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/ready', methods=['POST'])
+def register_ready():
+    """状態コンテナの準備完了通知（make-before-break切り替えで使用）"""
+    data = read_payload()
+    if data.get('machine_id'):
+        forwarded = route_to_owner(data['machine_id'], '/ready', data)
+        if forwarded is not None:
+            return forwarded
+    container_manager.mark_container_ready(data['container_id'])
+    return jsonify({'status': 'success'})
+
+@app.route('/resources', methods=['GET'])
+def get_resources():
+    """状態毎のリソース設定・観測値・推奨値取得"""
+    return jsonify(container_manager.get_resource_report())
+
+@app.route('/shard', methods=['GET'])
+def get_shard():
+    """シャード情報取得（?machine_id= で所有シャードとURLを返す）"""
+    machine_id = request.args.get('machine_id')
+    if machine_id:
+        return jsonify({
+            'machine_id': machine_id,
+            'shard_id': shard_router.owner(machine_id),
+            'url': shard_router.url_for(machine_id)
+        })
+    return jsonify(dict(shard_router.get_info(), machines=state_machine_manager.get_machine_ids()))
+
+@app.route('/replication/stream', methods=['GET'])
+def replication_stream():
+    """ホットスタンバイへの確定済み遷移の配信（改行区切りJSON、?epoch=&since= から再開）"""
+    if replication_log is None or not leader_lease.is_leader:
+        return jsonify({'status': 'error', 'message': 'Not the leader'}), 503
+    return Response(
+        replication_log.stream(
+            request.args.get('epoch', ''), request.args.get('since', 0, type=int),
+            state_machine_manager.get_snapshot
+        ),
+        mimetype='application/x-ndjson'
+    )
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """ヘルスチェック"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    """ヘルスチェック（初期コンテナ起動・イメージ事前取得の進捗を含む）"""
+    startup = machine_startup.get_progress() if machine_startup else None
+    prewarm = image_prewarmer.get_progress() if image_prewarmer else None
+    if leader_lease is not None and not leader_lease.is_leader:
+        status = 'standby'
+    elif startup is None or not startup['complete']:
+        status = 'starting'
+    elif prewarm is None or not prewarm['complete']:
+        status = 'prewarming'
+    elif startup['failed'] or prewarm['failed']:
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    with fenced_events_lock:
+        fenced = dict(fenced_events)
+    return jsonify({
+        'status': status,
+        'shard': shard_router.get_info() if shard_router else None,
+        'replication': get_replication_info(),
+        'fenced_events': fenced,
+        'startup': startup,
+        'prewarm': prewarm,
+        'timestamp': datetime.now().isoformat()
+    })
+
+def get_replication_info():
+    """ホットスタンバイ構成の役割と複製の進捗"""
+    if leader_lease is None:
+        return None
+    info = {
+        'role': 'leader' if leader_lease.is_leader else 'standby',
+        'leader_url': leader_lease.leader_url()
+    }
+    if leader_lease.is_leader:
+        info.update(epoch=replication_log.epoch, seq=replication_log.seq)
+    if replication_follower is not None:
+        info['follower'] = replication_follower.get_stats()
+    return info
 
 if __name__ == '__main__':
     logger.info("🚀 Starting Edge Surveillance Event Bus (Docker Swarm Mode)...")
@@ -0,0 +1,129 @@
+"""RulesEngine のマイクロベンチマーク（10kルール）
+
+生成したルール設定を実際の読み込み経路（CONFIG_DIR/transition-rules.yaml）で読み込み、
+1イベント毎の評価を 変更前の全ルール走査 / 索引付き get_triggered_events で、
+バースト処理を get_triggered_events の繰り返し / NumPy列比較の get_triggered_events_batch で比較する。
+各経路の結果が一致することも確認する。
+
+    python bench_rules.py [--rules 10000] [--matching 20] [--events 1000]
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import yaml
+
+from rules import RulesEngine
+
+SOURCE_MACHINE = 'detector'
+SOURCE_TRANSITION = 'person_detected'
+
+def generate_rules(count: int, matching: int, seed: int = 0) -> list:
+    """count件のルールのうち matching 件が detector.person_detected を対象とするルール設定"""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        if i < matching:
+            source = (SOURCE_MACHINE, SOURCE_TRANSITION)
+        else:
+            source = (f'machine{i % 500}', f'transition{i % 7}')
+        rules.append({
+            'source_machine': source[0],
+            'source_transition': source[1],
+            'target_machine': f'target{i % 50}',
+            'target_event': f'event{i}',
+            # 変更前の実装でも解釈できる > / < / 等値の条件のみ使用
+            'conditions': {
+                'detection_confidence': f">{rng.uniform(0.3, 0.9):.2f}",
+                'person_count': f"<{rng.randint(2, 6)}",
+            } if i % 4 else {'zone': rng.choice(['entrance', 'parking'])}
+        })
+    return rules
+
+def generate_events(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [{
+        'detection_confidence': rng.random(),
+        'person_count': rng.randint(0, 8),
+        'zone': rng.choice(['entrance', 'parking', 'lobby'])
+    } for _ in range(count)]
+
+def legacy_triggered_events(rules, machine_id: str, transition_name: str, event_data: dict) -> list:
+    """変更前の実装: 全ルールを走査し、条件文字列を評価の度に解釈"""
+    triggered = []
+    for rule in rules:
+        if rule.source_machine == machine_id and rule.source_transition == transition_name:
+            if legacy_check_conditions(rule.conditions, event_data):
+                triggered.append((rule.target_machine, rule.target_event))
+    return triggered
+
+def legacy_check_conditions(conditions: dict, event_data: dict) -> bool:
+    for key, expected_value in conditions.items():
+        if key not in event_data:
+            return False
+        actual_value = event_data[key]
+        if isinstance(expected_value, str) and expected_value.startswith('>'):
+            if not (isinstance(actual_value, (int, float)) and actual_value > float(expected_value[1:])):
+                return False
+        elif isinstance(expected_value, str) and expected_value.startswith('<'):
+            if not (isinstance(actual_value, (int, float)) and actual_value < float(expected_value[1:])):
+                return False
+        elif actual_value != expected_value:
+            return False
+    return True
+
+def measure(func, repeat: int) -> float:
+    """1回あたりの平均時間（秒）"""
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started_at) / repeat
+
+def summarize(triggered) -> list:
+    return [(target_machine, event['name']) for target_machine, event in triggered]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=10000)
+    parser.add_argument('--matching', type=int, default=20, help='評価対象の遷移に一致するルール数')
+    parser.add_argument('--events', type=int, default=1000, help='バースト評価のイベント数')
+    args = parser.parse_args()
+
+    # ルール評価毎のINFOログは計測から除く
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        with open(os.path.join(config_dir, 'transition-rules.yaml'), 'w') as f:
+            yaml.safe_dump({'rules': generate_rules(args.rules, args.matching)}, f)
+        os.environ['CONFIG_DIR'] = config_dir
+        started_at = time.perf_counter()
+        engine = RulesEngine()
+        load_time = time.perf_counter() - started_at
+    assert len(engine.rules) == args.rules
+
+    events = generate_events(args.events)
+    inputs = [(SOURCE_MACHINE, SOURCE_TRANSITION, event) for event in events]
+
+    # 各経路の結果が一致することを確認
+    per_event = [engine.get_triggered_events(*item) for item in inputs]
+    batch = engine.get_triggered_events_batch(inputs)
+    for item, indexed, batched in zip(inputs, per_event, batch):
+        assert legacy_triggered_events(engine.rules, *item) == summarize(indexed) == summarize(batched)
+
+    event = events[0]
+    legacy = measure(lambda: legacy_triggered_events(engine.rules, SOURCE_MACHINE, SOURCE_TRANSITION, event), 200)
+    indexed = measure(lambda: engine.get_triggered_events(SOURCE_MACHINE, SOURCE_TRANSITION, event), 2000)
+    loop = measure(lambda: [engine.get_triggered_events(*item) for item in inputs], 5)
+    batched = measure(lambda: engine.get_triggered_events_batch(inputs), 5)
+
+    print(f"{args.rules} rules ({args.matching} on {SOURCE_MACHINE}.{SOURCE_TRANSITION}), loaded in {load_time:.2f}s")
+    print(f"per event:  legacy scan {legacy * 1e6:8.1f}us   indexed {indexed * 1e6:8.1f}us   "
+          f"({legacy / indexed:.1f}x)")
+    print(f"{args.events} events: per-event loop {loop * 1e3:8.2f}ms   batch {batched * 1e3:8.2f}ms   "
+          f"({loop / batched:.1f}x)")
+
+if __name__ == '__main__':
+    main()
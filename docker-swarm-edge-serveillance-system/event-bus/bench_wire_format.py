@@ -0,0 +1,90 @@
+"""ワイヤーフォーマットの比較（典型的な detector のイベント）
+
+processing_complete と、バウンディングボックス 1 / 3 / 10 / 50 個の person_detected について、
+JSON（標準のjson）と msgpack（バウンディングボックスは列形式）のサイズ、
+json / orjson / msgpack のエンコード・デコード時間を比較する。
+
+    python bench_wire_format.py [--repeat 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+import wire_format
+
+BOX_COUNTS = (1, 3, 10, 50)
+
+def transition_payload(transition_name: str, event_data: dict) -> dict:
+    """EventBusClient が送信する遷移イベントと同じ形"""
+    return {
+        'machine_id': 'detector@cam001',
+        'transition_name': transition_name,
+        'event_data': event_data,
+        'idempotency_key': uuid.uuid4().hex,
+        'generation': uuid.uuid4().hex[:12]
+    }
+
+def detector_events(seed: int = 0) -> list:
+    rng = random.Random(seed)
+    events = [('processing_complete', transition_payload('processing_complete', {
+        'result': 'no_person', 'timestamp': '2024-01-01T12:00:00.123456'
+    }))]
+    for count in BOX_COUNTS:
+        boxes = []
+        for _ in range(count):
+            x1, y1 = rng.randint(0, 600), rng.randint(0, 440)
+            boxes.append({'x1': x1, 'y1': y1, 'x2': x1 + rng.randint(20, 200), 'y2': y1 + rng.randint(40, 300),
+                          'confidence': rng.uniform(0.5, 1.0)})
+        events.append((f'person_detected x{count}', transition_payload('person_detected', {
+            'detection_confidence': max(box['confidence'] for box in boxes),
+            'person_count': count,
+            'bounding_boxes': boxes,
+            'timestamp': '2024-01-01T12:00:00.123456'
+        })))
+    return events
+
+def measure(func, repeat: int) -> float:
+    """1回あたりの平均時間（マイクロ秒）"""
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started_at) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+    if wire_format.msgpack is None or wire_format.orjson is None:
+        parser.error('msgpack and orjson are required')
+
+    codecs = {
+        'json': (lambda payload: json.dumps(payload, separators=(',', ':')).encode(), json.loads),
+        'orjson': (wire_format.orjson.dumps, wire_format.orjson.loads),
+        'msgpack': (lambda payload: wire_format.dumps(payload, wire_format.MSGPACK_TYPE),
+                    lambda body: wire_format.loads(body, wire_format.MSGPACK_TYPE)),
+    }
+
+    print(f"{'event':22s} {'json B':>7s} {'msgpack B':>9s}   {'enc json/orjson/msgpack us':>28s}"
+          f"   {'dec json/orjson/msgpack us':>28s}")
+    for name, payload in detector_events():
+        encoded = {codec: dumps(payload) for codec, (dumps, _) in codecs.items()}
+        # 往復で内容が変わらないこと（msgpackの信頼度はfloat32精度）
+        restored = codecs['msgpack'][1](encoded['msgpack'])
+        for box, original in zip(restored['event_data'].get('bounding_boxes', []),
+                                 payload['event_data'].get('bounding_boxes', [])):
+            assert abs(box['confidence'] - original['confidence']) < 1e-6
+        encode = [measure(lambda: dumps(payload), args.repeat) for dumps, _ in codecs.values()]
+        decode = [measure(lambda: loads(encoded[codec]), args.repeat) for codec, (_, loads) in codecs.items()]
+        print(f"{name:22s} {len(encoded['json']):7d} {len(encoded['msgpack']):9d}   "
+              f"{' / '.join(f'{value:.1f}' for value in encode):>28s}   "
+              f"{' / '.join(f'{value:.1f}' for value in decode):>28s}")
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,64 @@
 import docker
 import logging
+import os
+import threading
 import time
-from typing import Dict, Optional, List
+import uuid
+from typing import Callable, Dict, Optional, List
+
+from docker_watcher import DockerEventWatcher
+from placement import PlacementEngine
+from state_machines import ResourceProfile, resource_name
 
 logger = logging.getLogger(__name__)
 
 class SwarmContainerManager:
-    def __init__(self):
+    TRANSITION_MODES = ('recreate', 'scale', 'update')
+    HANDOFF_MODES = ('break-before-make', 'make-before-break')
+    # 状態のresources未指定時の既定値
+    DEFAULT_RESOURCES = ResourceProfile(
+        cpu_limit=500000000,                    # 0.5 CPU (nano cpus)
+        memory_limit=512 * 1024 * 1024,         # 512MB
+        cpu_reservation=100000000,              # 0.1 CPU
+        memory_reservation=128 * 1024 * 1024    # 128MB
+    )
+    
+    def __init__(self, transition_mode: str = None, handoff_mode: str = None,
+                 event_bus_url_for: Callable[[str], str] = None,
+                 on_generation: Callable[[str, str, Optional[str]], None] = None):
         """Docker Swarm管理クライアント初期化"""
         self.client = docker.from_env()
         self.active_services = {}  # {machine_id: service_id}
+        # 状態コンテナに渡すイベントバスURL（シャード構成ではマシンを所有するシャード）
+        self.event_bus_url_for = event_bus_url_for or (lambda machine_id: 'http://event-bus:5000')
+        # サービス毎の世代トークン（STATE_GENERATION）。タスクの起動前に on_generation で通知し、
+        # 置き換えられたサービスからの遅延イベントをイベントバスで破棄させる
+        self.on_generation = on_generation
+        self.generations = {}  # {service_id: 世代トークン}
+        
+        # recreate: 遷移毎にサービス削除/作成 / scale: 状態毎のサービスを0⇔1でスケール
+        # update: マシン毎の常駐サービスのイメージとSTATE_NAMEをローリング更新
+        self.transition_mode = transition_mode or os.getenv('SWARM_TRANSITION_MODE', 'recreate')
+        if self.transition_mode not in self.TRANSITION_MODES:
+            raise ValueError(f"Unknown transition mode: {self.transition_mode}")
+        self.state_services = {}  # {(machine_id, state_name): service_id} scaleモード用
+        
+        # break-before-make: 旧サービス停止後に起動 / make-before-break: 新サービス準備完了後に旧サービス停止
+        self.handoff_mode = handoff_mode or os.getenv('TRANSITION_HANDOFF', 'break-before-make')
+        if self.handoff_mode not in self.HANDOFF_MODES:
+            raise ValueError(f"Unknown handoff mode: {self.handoff_mode}")
+        self.ready_timeout = float(os.getenv('READY_TIMEOUT', '30'))
+        self.prewarm_timeout = float(os.getenv('PREWARM_TIMEOUT', '600'))
+        
+        # ノード一覧のTTLキャッシュ（/status, /nodes はノード数に関わらず一定回数のAPI呼び出し）
+        self.node_cache_ttl = float(os.getenv('NODE_CACHE_TTL', '30'))
+        self._node_directory = {}  # {node_id: node.attrs}
+        self._node_directory_expires = 0.0
+        self._node_lock = threading.Lock()
+        
+        # 状態サービス毎に最も負荷の低い適格ノードを選んで配置制約を生成
+        self.placement = PlacementEngine()
+        self.resource_profiles = {}  # {(machine_id, state_name): ResourceProfile}
         
         # Swarmモード確認
         try:
@@ -20,15 +69,28 @@ class SwarmContainerManager:
         except Exception as e:
             logger.error(f"Failed to connect to Docker Swarm: {str(e)}")
             raise
+        
+        # サービス/タスク状態はイベントストリームと一括取得で保持し、個別にポーリングしない
+        self.watcher = DockerEventWatcher(self.client, watch_services=True)
+        self.watcher.start()
+        # ラベルのないサービスを名前の接頭辞で検索済みのmachine_id（索引にないため初回のみAPIで検索）
+        self._unlabeled_swept = set()
     
     def start_state_container(self, machine_id: str, state_name: str, 
-                            container_image: str) -> str:
+                            container_image: str, stop_existing: bool = True) -> str:
         """状態用コンテナをSwarmサービスとしてデプロイ"""
         try:
-            service_name = f"{machine_id}-{state_name}"
+            service_name = f"{resource_name(machine_id)}-{state_name}"
             
-            # 既存サービス削除
-            self._force_stop_existing_services(machine_id)
+            if self.transition_mode == 'scale':
+                return self._activate_scaled_service(machine_id, state_name, container_image)
+            
+            if self.transition_mode == 'update':
+                return self._update_machine_service(machine_id, state_name, container_image)
+            
+            if stop_existing:
+                # 既存サービス削除
+                self._force_stop_existing_services(machine_id)
             
             # サービス作成
             service = self._create_service(
@@ -38,8 +100,13 @@ class SwarmContainerManager:
             self.active_services[machine_id] = service.id
             logger.info(f"Created Swarm service {service_name} ({service.id[:12]})")
             
-            # サービス起動待機
-            self._wait_for_service_ready(service_name)
+            # サービス起動待機（make-before-break時は準備完了通知まで待機）
+            if stop_existing:
+                self._wait_for_service_ready(service_name)
+            else:
+                self._wait_for_service_ready(
+                    service_name, timeout=self.ready_timeout, require_ready=True
+                )
             
             return service.id
             
@@ -47,18 +114,307 @@ class SwarmContainerManager:
             logger.error(f"Failed to create service for {machine_id}-{state_name}: {str(e)}")
             raise
     
+    def configure_placement(self, machine_id: str, placement: dict):
+        """マシンの配置設定（affinity: カメラを持つノードのラベル等）"""
+        affinity = (placement or {}).get('affinity', {})
+        if affinity:
+            self.placement.set_affinity(machine_id, affinity)
+            logger.info(f"Placement affinity for {machine_id}: {affinity}")
+    
+    def prewarm_image(self, image: str) -> dict:
+        """global-jobサービスで全エッジノードにイメージを取得させる"""
+        nodes = [
+            node for node in self.get_node_resources().values()
+            if node['status'] == 'ready' and node['availability'] == 'active'
+        ]
+        if not nodes:
+            return {'nodes': 0}
+        
+        # 各ノードでイメージを取得して即終了するジョブ（ノード毎に1タスク）
+        service = self.client.services.create(
+            image=image,
+            command=['true'],
+            name=f"prepull-{uuid.uuid4().hex[:8]}",
+            mode=docker.types.ServiceMode('global-job'),
+            constraints=['node.labels.role==edge'],
+            restart_policy=docker.types.RestartPolicy(condition='none'),
+            labels={'app': 'edge-surveillance', 'role': 'prepull'}
+        )
+        self.watcher.track_service(service)
+        
+        def finished_tasks():
+            return [
+                t for t in self.watcher.get_tasks(service.id)
+                if t['Status']['State'] in ('complete', 'failed', 'rejected', 'shutdown')
+            ]
+        
+        try:
+            completed = self.watcher.wait_for(
+                lambda: len(finished_tasks()) >= len(nodes), self.prewarm_timeout, needs_tasks=True
+            )
+            failed = [
+                self._get_node_name(t.get('NodeID', ''))
+                for t in finished_tasks() if t['Status']['State'] != 'complete'
+            ]
+        finally:
+            self._delete_service_by_id(service.id)
+        
+        if not completed:
+            raise RuntimeError(f"prepull of {image} timed out after {self.prewarm_timeout}s")
+        if failed:
+            raise RuntimeError(f"prepull of {image} failed on nodes: {', '.join(failed)}")
+        return {'nodes': len(nodes)}
+    
+    def configure_resources(self, machine_id: str, state_name: str, profile: ResourceProfile):
+        """(machine_id, state_name) ごとのCPU/メモリ制限・予約を設定"""
+        self.resource_profiles[(machine_id, state_name)] = profile
+    
+    def _get_profile(self, machine_id: str, state_name: str) -> ResourceProfile:
+        profile = self.resource_profiles.get((machine_id, state_name), ResourceProfile())
+        return profile.merged(self.DEFAULT_RESOURCES)
+    
+    def _service_resources(self, machine_id: str, state_name: str):
+        profile = self._get_profile(machine_id, state_name)
+        return docker.types.Resources(
+            cpu_limit=profile.cpu_limit,
+            mem_limit=profile.memory_limit,
+            cpu_reservation=profile.cpu_reservation,
+            mem_reservation=profile.memory_reservation
+        )
+    
+    def get_resource_report(self) -> Dict[str, dict]:
+        """状態毎の設定値（Swarmでは各ノードのコンテナ統計はマネージャーから取得できないため設定値のみ）"""
+        return {
+            f"{machine_id}-{state_name}": {
+                'configured': self._get_profile(machine_id, state_name).to_dict(),
+                'observed': None,
+                'recommended': None,
+                'applied': False
+            }
+            for (machine_id, state_name) in list(self.resource_profiles)
+        }
+    
+    def _place_service(self, machine_id: str, state_name: str) -> List[str]:
+        """配置先ノードを決定してSwarmの配置制約を返す"""
+        profile = self._get_profile(machine_id, state_name)
+        node_name = self.placement.place(
+            machine_id, state_name, self.get_node_resources(),
+            profile.cpu_reservation, profile.memory_reservation
+        )
+        if node_name is not None:
+            logger.info(f"Placing {machine_id}-{state_name} on node {node_name}")
+        return self.placement.constraints_for(node_name)
+    
+    def adopt_state_service(self, machine_id: str, state) -> Optional[str]:
+        """event-bus再起動時: ラベルから既存サービスを検出し、復元した状態と照合
+
+        現在状態のサービスが同じイメージで稼働中なら引き継ぎ、不一致のもののみ削除する
+        （scaleモードの他状態サービスは prepare_state_services で0レプリカに戻す）。
+        引き継いだサービスIDを返す（なければNone）。
+        """
+        self._delete_unlabeled_services(machine_id)
+        if self.transition_mode == 'update':
+            service_name = f"{resource_name(machine_id)}-service"
+        else:
+            service_name = f"{resource_name(machine_id)}-{state.name}"
+        
+        adopted = None
+        for service in self.watcher.find_services(machine_id=machine_id):
+            running = [
+                t for t in self.watcher.get_tasks(service['id'])
+                if t['Status']['State'] == 'running' and t['DesiredState'] == 'running'
+            ]
+            # レジストリ経由のイメージはダイジェストが付与されるため除いて比較
+            if (service['name'] == service_name and service['labels'].get('state') == state.name
+                    and service['image'].split('@')[0] == state.container_image and running):
+                adopted = (service, running[0])
+                break
+        if adopted is None:
+            return None
+        
+        service, task = adopted
+        self.active_services[machine_id] = service['id']
+        self.generations[service['id']] = service['labels'].get('generation')
+        self._activate(machine_id, state.name, service['id'])
+        if self.transition_mode == 'scale':
+            self.state_services[(machine_id, state.name)] = service['id']
+        else:
+            self._force_stop_existing_services(machine_id, keep=service['id'])
+        
+        # 引き継いだタスクのノードを配置エンジンの予約に反映
+        profile = self._get_profile(machine_id, state.name)
+        self.placement.adopt(
+            machine_id, state.name, self._get_node_name(task.get('NodeID', '')),
+            profile.cpu_reservation, profile.memory_reservation
+        )
+        logger.info(f"Adopted running service {service['name']} for {machine_id}-{state.name} "
+                    f"({service['id'][:12]})")
+        return service['id']
+    
+    def prepare_state_services(self, machine_id: str, states):
+        """scaleモード: 全状態のサービスを0レプリカで事前作成"""
+        if self.transition_mode != 'scale':
+            return
+        
+        existing = {
+            service['name']: service
+            for service in self.watcher.find_services(machine_id=machine_id)
+        }
+        
+        for state in states:
+            service_name = f"{resource_name(machine_id)}-{state.name}"
+            service = existing.get(service_name)
+            if service is None:
+                service = self._create_service(
+                    service_name, machine_id, state.name, state.container_image, replicas=0
+                )
+                logger.info(f"Created standby service {service_name} (0 replicas)")
+                service_id = service.id
+            else:
+                # 前回起動時のサービスは0レプリカに戻して再利用（引き継いだ現在状態は除く）
+                service_id = service['id']
+                self.generations.setdefault(service_id, service['labels'].get('generation'))
+                if service_id != self.active_services.get(machine_id):
+                    self._scale_service_by_id(service_id, 0)
+            self.state_services[(machine_id, state.name)] = service_id
+    
+    def _activate_scaled_service(self, machine_id: str, state_name: str,
+                                 container_image: str) -> str:
+        """scaleモード: 対象状態のサービスを1、その他を0にスケール"""
+        key = (machine_id, state_name)
+        service_name = f"{resource_name(machine_id)}-{state_name}"
+        
+        if key not in self.state_services:
+            service = self._create_service(
+                service_name, machine_id, state_name, container_image, replicas=0
+            )
+            self.state_services[key] = service.id
+        
+        overlapped = self.handoff_mode == 'make-before-break'
+        if not overlapped:
+            # 他状態のサービスを停止（0レプリカ）
+            self._scale_down_other_services(machine_id, state_name)
+        
+        service_id = self.state_services[key]
+        # 状態サービスは再利用するため世代はサービス単位（同じ状態の前回のタスクとは区別しない）
+        self._activate(machine_id, state_name, service_id)
+        self._scale_service_by_id(service_id, 1)
+        self.active_services[machine_id] = service_id
+        logger.info(f"Scaled up Swarm service {service_name} ({service_id[:12]})")
+        
+        if overlapped:
+            # 新サービスの準備完了後に他状態のサービスを停止
+            self._wait_for_service_ready(
+                service_name, timeout=self.ready_timeout, require_ready=True
+            )
+            self._scale_down_other_services(machine_id, state_name)
+        else:
+            self._wait_for_service_ready(service_name)
+        return service_id
+    
+    def _scale_down_other_services(self, machine_id: str, state_name: str):
+        """scaleモード: 対象状態以外のサービスを0レプリカに"""
+        for (owner, other_state), service_id in list(self.state_services.items()):
+            if owner == machine_id and other_state != state_name:
+                self._scale_service_by_id(service_id, 0)
+    
+    def _update_machine_service(self, machine_id: str, state_name: str,
+                                container_image: str) -> str:
+        """updateモード: マシンの常駐サービスを新しい状態のイメージ/環境変数で更新"""
+        service_name = f"{resource_name(machine_id)}-service"
+        service_id = self.active_services.get(machine_id)
+        if service_id is None:
+            # 前回起動時のサービスがあれば再利用
+            existing = self.watcher.get_service(service_name)
+            service_id = existing['id'] if existing else None
+        
+        if service_id is None:
+            service = self._create_service(
+                service_name, machine_id, state_name, container_image,
+                update_config=self._fast_update_config()
+            )
+            service_id = service.id
+            logger.info(f"Created persistent Swarm service {service_name} ({service_id[:12]})")
+        else:
+            # サービスID・VIP・ネットワーク接続を維持したままタスクのみ入れ替え
+            generation = self._new_generation(machine_id, state_name)
+            service = self.client.services.get(service_id)
+            service.update(
+                image=container_image,
+                env=self._service_env(machine_id, state_name, generation),
+                labels=self._service_labels(machine_id, state_name, generation),
+                constraints=self._place_service(machine_id, state_name),
+                resources=self._service_resources(machine_id, state_name),
+                update_config=self._fast_update_config()
+            )
+            self.generations[service_id] = generation
+            logger.info(f"Updated Swarm service {service_name} to {state_name} ({container_image})")
+        
+        self.active_services[machine_id] = service_id
+        
+        # 新しい状態のタスクが起動するまで待機（start-firstのため旧タスクはそれまで稼働）
+        if self.handoff_mode == 'make-before-break':
+            self._wait_for_service_ready(
+                service_name, timeout=self.ready_timeout, require_ready=True, state_name=state_name
+            )
+        else:
+            self._wait_for_service_ready(service_name, state_name=state_name)
+        return service_id
+    
+    @staticmethod
+    def _fast_update_config():
+        """updateモード用: 新タスク起動後に旧タスク停止、待機・監視時間なし"""
+        return docker.types.UpdateConfig(
+            parallelism=1, delay=0, monitor=0, order='start-first', failure_action='continue'
+        )
+    
+    def _scale_service_by_id(self, service_id: str, replicas: int):
+        """レプリカ数が異なる場合のみサービスをスケール"""
+        service = self.client.services.get(service_id)
+        current = service.attrs['Spec'].get('Mode', {}).get('Replicated', {}).get('Replicas')
+        if current != replicas:
+            service.scale(replicas)
+    
+    def _service_env(self, machine_id: str, state_name: str, generation: str) -> dict:
+        return {
+            'MACHINE_ID': machine_id,
+            'STATE_NAME': state_name,
+            'EVENT_BUS_URL': self.event_bus_url_for(machine_id),
+            'STATE_GENERATION': generation
+        }
+    
+    @staticmethod
+    def _service_labels(machine_id: str, state_name: str, generation: str) -> dict:
+        return {
+            'machine-id': machine_id,
+            'state': state_name,
+            'generation': generation,
+            'app': 'edge-surveillance'
+        }
+    
+    def _new_generation(self, machine_id: str, state_name: str, activate: bool = True) -> str:
+        """新しい世代トークン（activate=Trueならタスク起動前に有効化）"""
+        generation = uuid.uuid4().hex[:16]
+        if activate and self.on_generation is not None:
+            self.on_generation(machine_id, state_name, generation)
+        return generation
+    
+    def _activate(self, machine_id: str, state_name: str, service_id: str):
+        """既存サービス（0レプリカからのスケール・引き継ぎ）の世代を有効化"""
+        if self.on_generation is not None:
+            self.on_generation(machine_id, state_name, self.generations.get(service_id))
+    
     def _create_service(self, service_name: str, machine_id: str,
-                       state_name: str, container_image: str):
+                       state_name: str, container_image: str, replicas: int = 1,
+                       update_config=None):
         """Swarmサービス作成"""
+        # 0レプリカで事前作成するサービスはスケール時に有効化
+        generation = self._new_generation(machine_id, state_name, activate=replicas > 0)
         
         # コンテナ設定
         container_spec = docker.types.ContainerSpec(
             image=container_image,
-            env={
-                'MACHINE_ID': machine_id,
-                'STATE_NAME': state_name,
-                'EVENT_BUS_URL': 'http://event-bus:5000'
-            }
+            env=self._service_env(machine_id, state_name, generation)
         )
         
         # タスクテンプレート
@@ -66,14 +422,9 @@ class SwarmContainerManager:
             container_spec=container_spec,
             restart_policy=docker.types.RestartPolicy(condition='none'),  # 状態遷移時は再起動しない
             placement=docker.types.Placement(
-                constraints=['node.labels.role==edge']  # エッジノードのみ
+                constraints=self._place_service(machine_id, state_name)  # エッジノードのうち配置先を指定
             ),
-            resources=docker.types.Resources(
-                cpu_limit=500000000,      # 0.5 CPU (nano cpus)
-                mem_limit=512 * 1024 * 1024,  # 512MB
-                cpu_reservation=100000000,  # 0.1 CPU
-                mem_reservation=128 * 1024 * 1024  # 128MB
-            )
+            resources=self._service_resources(machine_id, state_name)  # 状態毎のresources設定
         )
         
         # エンドポイント設定
@@ -85,25 +436,54 @@ class SwarmContainerManager:
         service = self.client.services.create(
             image=container_image,
             name=service_name,
+            mode=docker.types.ServiceMode('replicated', replicas=replicas),
             task_template=task_template,
             endpoint_spec=endpoint_spec,
             networks=['edge-surveillance-network'],
-            labels={
-                'machine-id': machine_id,
-                'state': state_name,
-                'app': 'edge-surveillance'
-            }
+            labels=self._service_labels(machine_id, state_name, generation),
+            update_config=update_config
         )
+        self.generations[service.id] = generation
+        
+        # イベント到着前でも起動待機できるよう索引に登録
+        self.watcher.track_service(service)
         
         return service
     
     def transition_container(self, machine_id: str, old_state, new_state):
         """状態遷移時のコンテナ切り替え"""
         try:
-            # 古いサービス削除
-            self._force_stop_existing_services(machine_id)
+            if self.transition_mode == 'scale':
+                # 作成済みサービスのレプリカ数切り替えのみ（1→0, 0→1）
+                self._activate_scaled_service(
+                    machine_id, new_state.name, new_state.container_image
+                )
+                logger.info(f"Transitioned {machine_id}: {old_state.name} -> {new_state.name}")
+                return
+            
+            if self.transition_mode == 'update':
+                # 常駐サービスのイメージ/STATE_NAME更新のみ（サービス削除/作成なし）
+                self._update_machine_service(
+                    machine_id, new_state.name, new_state.container_image
+                )
+                logger.info(f"Transitioned {machine_id}: {old_state.name} -> {new_state.name}")
+                return
+            
+            if self.handoff_mode == 'make-before-break' and old_state.name != new_state.name:
+                # 新サービスの準備完了を確認してから旧サービス削除
+                started_at = time.time()
+                service_id = self.start_state_container(
+                    machine_id, new_state.name, new_state.container_image, stop_existing=False
+                )
+                self._force_stop_existing_services(machine_id, keep=service_id)
+                logger.info(
+                    f"Transitioned {machine_id}: {old_state.name} -> {new_state.name} "
+                    f"(overlapped, {time.time() - started_at:.2f}s)"
+                )
+                return
             
-            time.sleep(1)
+            # 古いサービス削除（サービス名は削除時点で解放されるため待機不要）
+            self._force_stop_existing_services(machine_id)
             
             # 新しいサービス作成
             self.start_state_container(
@@ -116,64 +496,93 @@ class SwarmContainerManager:
             logger.error(f"Service transition failed for {machine_id}: {str(e)}")
             raise
     
-    def _force_stop_existing_services(self, machine_id: str):
-        """既存サービス削除"""
+    def _force_stop_existing_services(self, machine_id: str, keep: str = None):
+        """既存サービス削除（keepは除く）"""
         try:
             # アクティブサービスリストから削除
-            if machine_id in self.active_services:
+            if machine_id in self.active_services and self.active_services[machine_id] != keep:
                 service_id = self.active_services[machine_id]
                 self._delete_service_by_id(service_id)
                 del self.active_services[machine_id]
             
-            # ラベルセレクタで該当サービス検索・削除
-            services = self.client.services.list(
-                filters={'label': f'machine-id={machine_id}'}
-            )
+            # ラベル索引から該当サービス検索・削除
+            for service in self.watcher.find_services(machine_id=machine_id):
+                if service['id'] == keep:
+                    continue
+                logger.info(f"Force stopping service: {service['name']}")
+                self._delete_service_by_id(service['id'])
             
-            for service in services:
-                logger.info(f"Force stopping service: {service.name}")
-                self._delete_service_by_id(service.id)
+            # ラベルのないサービスは名前パターンマッチで削除
+            self._delete_unlabeled_services(machine_id, keep)
                 
         except Exception as e:
             logger.warning(f"Error during force stop for {machine_id}: {str(e)}")
     
+    def _delete_unlabeled_services(self, machine_id: str, keep: str = None):
+        """手動作成などで "{machine}-" で始まるラベルなしサービスを削除（マシン毎に初回のみ）"""
+        if machine_id in self._unlabeled_swept:
+            return
+        prefix = f"{resource_name(machine_id)}-"
+        try:
+            for service in self.client.services.list(filters={'name': prefix}):
+                spec = service.attrs['Spec']
+                if (spec['Name'].startswith(prefix) and service.id != keep and
+                        spec.get('Labels', {}).get('app') != self.watcher.app_label):
+                    logger.info(f"Force stopping unlabeled service by name pattern: {spec['Name']}")
+                    self._delete_service_by_id(service.id)
+            self._unlabeled_swept.add(machine_id)
+        except Exception as e:
+            logger.warning(f"Error removing unlabeled services for {machine_id}: {str(e)}")
+    
     def _delete_service_by_id(self, service_id: str):
         """サービスIDでサービス削除"""
+        self.generations.pop(service_id, None)
         try:
             service = self.client.services.get(service_id)
             service.remove()
+            self.watcher.forget_service(service_id)
             logger.info(f"Removed service {service_id[:12]}")
         except docker.errors.NotFound:
+            self.watcher.forget_service(service_id)
             logger.info(f"Service {service_id[:12]} not found (already removed)")
         except Exception as e:
             logger.warning(f"Failed to remove service {service_id[:12]}: {str(e)}")
     
-    def _wait_for_service_ready(self, service_name: str, timeout=60):
-        """サービス準備完了待機"""
-        start_time = time.time()
+    def _wait_for_service_ready(self, service_name: str, timeout=60, require_ready: bool = False,
+                                state_name: str = None):
+        """サービス準備完了待機（タスク索引の更新通知で待機）"""
+        def has_running_task():
+            service = self.watcher.get_service(service_name)
+            if service is None:
+                return False
+            if require_ready:
+                # 状態スクリプトからの準備完了通知まで待つ
+                tasks = self.watcher.get_ready_tasks(service['id'])
+            else:
+                tasks = [
+                    t for t in self.watcher.get_tasks(service['id'])
+                    if t['Status']['State'] == 'running' and t['DesiredState'] == 'running'
+                ]
+            if state_name is not None:
+                # updateモード: 新しい状態で起動したタスクのみ対象
+                tasks = [
+                    t for t in tasks
+                    if f"STATE_NAME={state_name}" in t['Spec']['ContainerSpec'].get('Env', [])
+                ]
+            return bool(tasks)
         
-        while time.time() - start_time < timeout:
-            try:
-                service = self.client.services.get(service_name)
-                tasks = service.tasks()
-                
-                # 実行中のタスクがあるか確認
-                running_tasks = [t for t in tasks if t['Status']['State'] == 'running']
-                
-                if running_tasks:
-                    logger.info(f"Service {service_name} is ready with {len(running_tasks)} running task(s)")
-                    return True
-                    
-            except docker.errors.NotFound:
-                pass
-            except Exception as e:
-                logger.warning(f"Error checking service status: {str(e)}")
-            
-            time.sleep(2)
+        if self.watcher.wait_for(has_running_task, timeout, needs_tasks=True):
+            logger.info(f"Service {service_name} is ready")
+            return True
         
         logger.warning(f"Service {service_name} not ready after {timeout}s")
         return False
     
+    def mark_container_ready(self, container_hostname: str):
+        """状態スクリプトからの準備完了通知を登録"""
+        self.watcher.mark_ready(container_hostname)
+        logger.info(f"Container ready: {container_hostname[:12]}")
+
     def get_container_status(self, machine_id: str) -> dict:
         """コンテナ状態取得"""
         if machine_id not in self.active_services:
@@ -182,8 +591,10 @@ class SwarmContainerManager:
         service_id = self.active_services[machine_id]
         
         try:
-            service = self.client.services.get(service_id)
-            tasks = service.tasks()
+            service = self.watcher.get_service(service_id)
+            if service is None:
+                raise docker.errors.NotFound(f"service {service_id[:12]} not indexed")
+            tasks = self.watcher.get_tasks(service_id)
             
             # タスク情報収集
             task_info = []
@@ -199,28 +610,38 @@ class SwarmContainerManager:
                 })
             
             # 実行中のタスク数
-            running_count = sum(1 for t in tasks if t['Status']['State'] == 'running')
+            running_count = sum(
+                1 for t in tasks
+                if t['Status']['State'] == 'running' and t['DesiredState'] == 'running'
+            )
             
             return {
                 'status': 'running' if running_count > 0 else 'pending',
-                'service_name': service.name,
-                'service_id': service.id[:12],
+                'service_name': service['name'],
+                'service_id': service['id'][:12],
                 'replicas': len(tasks),
                 'running_replicas': running_count,
                 'tasks': task_info
             }
             
         except docker.errors.NotFound:
-            del self.active_services[machine_id]
+            self.active_services.pop(machine_id, None)
             return {'status': 'not_found'}
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
+    def _get_node_directory(self) -> Dict[str, dict]:
+        """ノード一覧をTTLキャッシュから取得（期限切れ時のみnodes.listを1回呼ぶ）"""
+        with self._node_lock:
+            if time.time() >= self._node_directory_expires:
+                self._node_directory = {node.id: node.attrs for node in self.client.nodes.list()}
+                self._node_directory_expires = time.time() + self.node_cache_ttl
+            return self._node_directory
+    
     def _get_node_name(self, node_id: str) -> str:
         """ノードIDからノード名取得"""
         try:
-            node = self.client.nodes.get(node_id)
-            return node.attrs['Description']['Hostname']
+            return self._get_node_directory()[node_id]['Description']['Hostname']
         except:
             return node_id[:12]
     
@@ -229,23 +650,22 @@ class SwarmContainerManager:
         nodes = {}
         
         try:
-            node_list = self.client.nodes.list(
-                filters={'node.label.role': 'edge'}
-            )
+            # 全ノードの実行中タスクを1回で取得してノード毎に集計
+            running_tasks = {}
+            for task in self.client.api.tasks(filters={'desired-state': 'running'}):
+                node_id = task.get('NodeID')
+                running_tasks[node_id] = running_tasks.get(node_id, 0) + 1
             
-            for node in node_list:
-                node_name = node.attrs['Description']['Hostname']
-                node_id = node.id
+            for node_id, attrs in self._get_node_directory().items():
+                spec = attrs['Spec']
+                if spec.get('Labels', {}).get('role') != 'edge':
+                    continue
                 
-                # リソース情報
-                resources = node.attrs['Description']['Resources']
-                status = node.attrs['Status']
-                spec = node.attrs['Spec']
+                node_name = attrs['Description']['Hostname']
                 
-                # 現在のタスク数を取得
-                tasks = self.client.tasks.list(
-                    filters={'node': node_id, 'desired-state': 'running'}
-                )
+                # リソース情報
+                resources = attrs['Description']['Resources']
+                status = attrs['Status']
                 
                 nodes[node_name] = {
                     'node_id': node_id[:12],
@@ -253,7 +673,7 @@ class SwarmContainerManager:
                     'availability': spec.get('Availability', 'unknown'),
                     'nano_cpus': resources.get('NanoCPUs', 0),
                     'memory_bytes': resources.get('MemoryBytes', 0),
-                    'running_tasks': len(tasks),
+                    'running_tasks': running_tasks.get(node_id, 0),
                     'labels': spec.get('Labels', {})
                 }
             
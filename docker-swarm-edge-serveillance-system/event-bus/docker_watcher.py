@@ -0,0 +1,320 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# コンテナイベントのアクションと状態の対応
+_CONTAINER_ACTION_STATUS = {
+    'create': 'created',
+    'start': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+}
+
+class DockerEventWatcher:
+    """client.events() を購読し、ラベル付きコンテナ（Swarmではサービス/タスク）の状態をメモリ上に保持"""
+    def __init__(self, client, app_label: str = 'edge-surveillance',
+                 watch_services: bool = False, resync_interval: float = 30.0):
+        self.client = client
+        self.app_label = app_label
+        self.watch_services = watch_services
+        self.resync_interval = resync_interval
+
+        self.containers = {}  # {container_id: {'id', 'name', 'status', 'health', 'image', 'labels'}}
+        self.services = {}    # {service_id: {'id', 'name', 'labels', 'replicas'}}
+        self.tasks = {}       # {service_id: [task, ...]}
+        self.ready = set()    # 準備完了を通知したコンテナのホスト名（コンテナID先頭12桁）
+
+        self._cond = threading.Condition()
+        # タスク再取得の契機（サービスイベント・タスク待機者の到着のみ、コンテナイベントでは起こさない）
+        self._tasks_stale = threading.Event()
+        self._task_waiters = 0
+        self._task_waiter_arrived = False  # 新しい待機者が来たら再取得間隔を初期値に戻す
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        """初期スナップショット取得後、イベント購読スレッドを開始"""
+        since = self._resync()
+        self._thread = threading.Thread(target=self._run, args=(since,), daemon=True,
+                                        name='docker-event-watcher')
+        self._thread.start()
+        if self.watch_services:
+            threading.Thread(target=self._refresh_tasks_loop, daemon=True,
+                             name='docker-task-refresher').start()
+        logger.info(f"Docker event watcher started ({len(self.containers)} containers, "
+                    f"{len(self.services)} services indexed)")
+
+    def stop(self):
+        self._stopped = True
+
+    def _resync(self) -> int:
+        """Docker APIから索引を再構築（起動時・イベントストリーム再接続時のみ）"""
+        since = int(time.time())
+        containers, services = [], []
+        if self.watch_services:
+            # Swarmのコンテナは各ノード上にあるため、サービス/タスク単位で追跡
+            services = self.client.services.list(filters={'label': f'app={self.app_label}'})
+        else:
+            containers = self.client.containers.list(
+                all=True, filters={'label': f'app={self.app_label}'}
+            )
+        with self._cond:
+            self.containers = {
+                c.id: {
+                    'id': c.id,
+                    'name': c.name,
+                    'status': c.status,
+                    'health': None,
+                    'image': c.attrs.get('Config', {}).get('Image', ''),
+                    'labels': c.labels
+                }
+                for c in containers
+            }
+            self.services = {s.id: self._service_entry(s) for s in services}
+
+        if self.watch_services:
+            tasks = self._list_tasks()
+            with self._cond:
+                self._index_tasks(tasks)
+
+        with self._cond:
+            self._cond.notify_all()
+        return since
+
+    def _run(self, since: int):
+        """イベントストリーム処理（切断時は再同期して再接続）"""
+        while not self._stopped:
+            try:
+                filters = {'type': ['service'] if self.watch_services else ['container']}
+                for event in self.client.events(decode=True, since=since, filters=filters):
+                    since = event.get('time', since)
+                    self._handle_event(event)
+            except Exception as e:
+                logger.warning(f"Docker event stream interrupted: {str(e)}")
+            if self._stopped:
+                return
+            time.sleep(1)
+            try:
+                since = self._resync()
+            except Exception as e:
+                logger.warning(f"Docker watcher resync failed: {str(e)}")
+
+    def _handle_event(self, event: dict):
+        event_type = event.get('Type')
+        action = event.get('Action', '')
+        actor = event.get('Actor', {})
+        object_id = actor.get('ID')
+        attributes = actor.get('Attributes', {})
+
+        if event_type == 'container':
+            self._handle_container_event(object_id, action, attributes)
+        elif event_type == 'service':
+            self._handle_service_event(object_id, action)
+
+    def _handle_container_event(self, container_id: str, action: str, attributes: dict):
+        if attributes.get('app') != self.app_label:
+            return
+
+        with self._cond:
+            if action == 'destroy':
+                self.containers.pop(container_id, None)
+                self.ready.discard(container_id[:12])
+            else:
+                entry = self.containers.setdefault(container_id, {
+                    'id': container_id,
+                    'name': attributes.get('name', ''),
+                    'status': 'created',
+                    'health': None,
+                    'image': attributes.get('image', ''),
+                    'labels': {
+                        key: value for key, value in attributes.items()
+                        if key not in ('name', 'image', 'exitCode', 'signal')
+                    }
+                })
+                if action in _CONTAINER_ACTION_STATUS:
+                    entry['status'] = _CONTAINER_ACTION_STATUS[action]
+                elif action.startswith('health_status'):
+                    entry['health'] = action.split(':', 1)[1].strip()
+                elif action == 'rename':
+                    entry['name'] = attributes.get('name', entry['name'])
+            self._cond.notify_all()
+
+    def _handle_service_event(self, service_id: str, action: str):
+        if action == 'remove':
+            with self._cond:
+                self.services.pop(service_id, None)
+                self.tasks.pop(service_id, None)
+                self._cond.notify_all()
+            self._tasks_stale.set()
+            return
+
+        # サービスイベントは属性が少ないため、対象サービスのみ再取得
+        try:
+            service = self.client.services.get(service_id)
+        except Exception:
+            return
+        if service.attrs['Spec'].get('Labels', {}).get('app') != self.app_label:
+            return
+
+        with self._cond:
+            self.services[service_id] = self._service_entry(service)
+            self._cond.notify_all()
+        self._tasks_stale.set()
+
+    @staticmethod
+    def _service_entry(service) -> dict:
+        spec = service.attrs['Spec']
+        return {
+            'id': service.id,
+            'name': spec['Name'],
+            'labels': spec.get('Labels', {}),
+            'image': spec.get('TaskTemplate', {}).get('ContainerSpec', {}).get('Image', ''),
+            'replicas': spec.get('Mode', {}).get('Replicated', {}).get('Replicas')
+        }
+
+    def track_service(self, service):
+        """作成直後のサービスを索引に追加（作成イベントの到着を待たない）"""
+        with self._cond:
+            self.services[service.id] = self._service_entry(service)
+            self._cond.notify_all()
+        self._tasks_stale.set()
+
+    def forget_service(self, service_id: str):
+        """削除したサービスを索引から除外（削除イベントの到着を待たない）"""
+        with self._cond:
+            self.services.pop(service_id, None)
+            for task in self.tasks.pop(service_id, []):
+                self.ready.discard(self._task_container_id(task)[:12])
+
+    def _list_tasks(self) -> List[dict]:
+        """自アプリのサービスに属するタスクを1回のAPI呼び出しで取得"""
+        with self._cond:
+            service_ids = list(self.services)
+        if not service_ids:
+            return []
+        return self.client.api.tasks(filters={'service': service_ids})
+
+    def _index_tasks(self, tasks: List[dict]):
+        by_service = {}
+        for task in tasks:
+            by_service.setdefault(task['ServiceID'], []).append(task)
+            if task['DesiredState'] != 'running':
+                # 停止済みタスクの準備完了通知は破棄
+                self.ready.discard(self._task_container_id(task)[:12])
+        self.tasks = by_service
+
+    def _refresh_tasks_loop(self):
+        """タスク状態はイベントが発行されないため、まとめて再取得して待機者に通知
+
+        待機者がいる間は短い間隔、いない間はサービスイベント毎（なければresync_interval毎）に取得する。
+        """
+        interval = 0.05
+        while not self._stopped:
+            with self._cond:
+                waiting = self._task_waiters
+            if waiting == 0:
+                interval = 0.05
+                self._tasks_stale.wait(self.resync_interval)
+            # 取得中に届いたサービスイベントは次の周回で反映
+            self._tasks_stale.clear()
+            try:
+                tasks = self._list_tasks()
+                with self._cond:
+                    self._index_tasks(tasks)
+                    self._cond.notify_all()
+            except Exception as e:
+                logger.warning(f"Task refresh failed: {str(e)}")
+            with self._cond:
+                waiting = self._task_waiters
+                if waiting and self._task_waiter_arrived:
+                    self._task_waiter_arrived = False
+                    interval = 0.05
+            if waiting:
+                time.sleep(interval)
+                interval = min(interval * 2, 1.0)
+
+    def mark_ready(self, container_hostname: str):
+        """状態スクリプトからの準備完了通知を登録"""
+        with self._cond:
+            self.ready.add(container_hostname[:12])
+            self._cond.notify_all()
+
+    def is_ready(self, container_id: str) -> bool:
+        """準備完了通知済み、またはHEALTHCHECKがhealthyのコンテナか"""
+        with self._cond:
+            if container_id and container_id[:12] in self.ready:
+                return True
+            entry = self.containers.get(container_id)
+            return entry is not None and entry['health'] == 'healthy'
+
+    @staticmethod
+    def _task_container_id(task: dict) -> str:
+        return task.get('Status', {}).get('ContainerStatus', {}).get('ContainerID', '')
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: float,
+                 needs_tasks: bool = False) -> bool:
+        """索引が条件を満たすまでイベント通知で待機"""
+        with self._cond:
+            if needs_tasks:
+                self._task_waiters += 1
+                self._task_waiter_arrived = True
+                self._tasks_stale.set()
+            try:
+                return self._cond.wait_for(predicate, timeout)
+            finally:
+                if needs_tasks:
+                    self._task_waiters -= 1
+
+    def note_container_status(self, container_id: str, status: str):
+        """自身が行った操作の結果をイベント到着前に反映"""
+        with self._cond:
+            entry = self.containers.get(container_id)
+            if entry is not None:
+                entry['status'] = status
+                self._cond.notify_all()
+
+    def get_container(self, container_id: str) -> Optional[dict]:
+        with self._cond:
+            entry = self.containers.get(container_id)
+            return dict(entry) if entry else None
+
+    def find_containers(self, **labels) -> List[dict]:
+        """ラベル（machine_id='detector' → machine-id=detector）で索引を検索"""
+        wanted = {key.replace('_', '-'): value for key, value in labels.items()}
+        with self._cond:
+            return [
+                dict(entry) for entry in self.containers.values()
+                if all(entry['labels'].get(key) == value for key, value in wanted.items())
+            ]
+
+    def get_service(self, service_id_or_name: str) -> Optional[dict]:
+        with self._cond:
+            for entry in self.services.values():
+                if service_id_or_name in (entry['id'], entry['name']):
+                    return dict(entry)
+        return None
+
+    def find_services(self, **labels) -> List[dict]:
+        wanted = {key.replace('_', '-'): value for key, value in labels.items()}
+        with self._cond:
+            return [
+                dict(entry) for entry in self.services.values()
+                if all(entry['labels'].get(key) == value for key, value in wanted.items())
+            ]
+
+    def get_tasks(self, service_id: str) -> List[dict]:
+        with self._cond:
+            return list(self.tasks.get(service_id, []))
+
+    def get_ready_tasks(self, service_id: str) -> List[dict]:
+        """実行中かつ準備完了を通知したタスク"""
+        with self._cond:
+            return [
+                t for t in self.tasks.get(service_id, [])
+                if t['Status']['State'] == 'running' and t['DesiredState'] == 'running'
+                and self._task_container_id(t)[:12] in self.ready
+            ]
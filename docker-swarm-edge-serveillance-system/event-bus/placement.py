@@ -0,0 +1,104 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PlacementEngine:
+    """ノード在庫とライブタスク数から状態サービスの配置先ノードを選択"""
+    def __init__(self, base_constraints: List[str] = None):
+        self.base_constraints = base_constraints or ['node.labels.role==edge']
+        self.affinity = {}     # {machine_id: {node_label: value}} カメラを持つノード等への固定
+        self.assignments = {}  # {machine_id: (node_name, state_name, nano_cpus, memory_bytes)}
+        self._lock = threading.Lock()
+
+    def set_affinity(self, machine_id: str, node_labels: Dict[str, str]):
+        """マシンの全状態を指定ラベルのノードに配置"""
+        self.affinity[machine_id] = dict(node_labels or {})
+
+    def place(self, machine_id: str, state_name: str, nodes: Dict[str, dict],
+              nano_cpus: int, memory_bytes: int) -> Optional[str]:
+        """最も負荷の低い適格ノード名を返す（該当なしはNone）
+
+        nodesは get_node_resources() の戻り値。マシンは常に1状態のみ稼働するため、
+        同じマシンの前状態の予約は差し引いて評価する。
+        """
+        with self._lock:
+            reserved = self._reserved_by_node(exclude=machine_id)
+            previous = self.assignments.get(machine_id)
+
+            best_name, best_score = None, None
+            for node_name, node in nodes.items():
+                if not self._is_eligible(machine_id, node):
+                    continue
+
+                cpu_capacity = node.get('nano_cpus') or 0
+                memory_capacity = node.get('memory_bytes') or 0
+                if cpu_capacity <= 0 or memory_capacity <= 0:
+                    continue
+
+                cpu_used, memory_used = reserved.get(node_name, (0, 0))
+                load = max(
+                    (cpu_used + nano_cpus) / cpu_capacity,
+                    (memory_used + memory_bytes) / memory_capacity
+                )
+                if load > 1.0:
+                    continue
+
+                # 前状態のノードに余裕があれば移動しない、それ以外は負荷→タスク数の少ない順
+                sticky = 0 if previous and previous[0] == node_name else 1
+                score = (sticky, round(load, 2), node.get('running_tasks', 0), node_name)
+                if best_score is None or score < best_score:
+                    best_name, best_score = node_name, score
+
+            if best_name is None:
+                logger.warning(f"No eligible node with capacity for {machine_id}-{state_name}")
+                self.assignments.pop(machine_id, None)
+                return None
+
+            self.assignments[machine_id] = (best_name, state_name, nano_cpus, memory_bytes)
+            return best_name
+
+    def adopt(self, machine_id: str, state_name: str, node_name: str,
+              nano_cpus: int, memory_bytes: int):
+        """event-bus再起動時に引き継いだ稼働中サービスの配置を記録"""
+        with self._lock:
+            self.assignments[machine_id] = (node_name, state_name, nano_cpus, memory_bytes)
+
+    def constraints_for(self, node_name: Optional[str]) -> List[str]:
+        """配置決定をSwarmの配置制約に変換"""
+        if node_name is None:
+            return list(self.base_constraints)
+        return self.base_constraints + [f'node.hostname=={node_name}']
+
+    def release(self, machine_id: str):
+        with self._lock:
+            self.assignments.pop(machine_id, None)
+
+    def get_assignments(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                machine_id: {
+                    'node': node_name,
+                    'state': state_name,
+                    'nano_cpus': nano_cpus,
+                    'memory_bytes': memory_bytes
+                }
+                for machine_id, (node_name, state_name, nano_cpus, memory_bytes)
+                in self.assignments.items()
+            }
+
+    def _is_eligible(self, machine_id: str, node: dict) -> bool:
+        if node.get('status') != 'ready' or node.get('availability') != 'active':
+            return False
+        labels = node.get('labels', {})
+        return all(labels.get(key) == value for key, value in self.affinity.get(machine_id, {}).items())
+
+    def _reserved_by_node(self, exclude: str = None) -> Dict[str, tuple]:
+        reserved = {}
+        for machine_id, (node_name, _, nano_cpus, memory_bytes) in self.assignments.items():
+            if machine_id == exclude:
+                continue
+            cpu_used, memory_used = reserved.get(node_name, (0, 0))
+            reserved[node_name] = (cpu_used + nano_cpus, memory_used + memory_bytes)
+        return reserved
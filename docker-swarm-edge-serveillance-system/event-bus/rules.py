@@ -1,31 +1,175 @@
+import os
+import re
 import yaml
 import logging
-from typing import List, Dict, Tuple
+import operator
+import numpy as np
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+_RANGE_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*\.\.\s*(-?\d+(?:\.\d+)?)\s*$')
+_COMPARISONS = (
+    # 2文字の演算子を先に判定
+    ('>=', operator.ge),
+    ('<=', operator.le),
+    ('!=', operator.ne),
+    ('==', operator.eq),
+    ('>', operator.gt),
+    ('<', operator.lt),
+)
+
+def _parse_literal(text: str):
+    """条件式の右辺を数値または文字列として解釈"""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))
+
+class Condition:
+    """1つの条件をロード時にコンパイルした述語"""
+    __slots__ = ('key', 'path', 'expected', 'predicate', 'vector')
+    
+    def __init__(self, key: str, expected: Any):
+        self.key = key
+        self.path = tuple(key.split('.'))  # ネストしたキーは "a.b.c" で指定
+        self.expected = expected
+        self.predicate, self.vector = self._compile(expected)
+    
+    @staticmethod
+    def _compile(expected: Any) -> Tuple[Callable[[Any], bool], Optional[Callable]]:
+        """条件値を述語関数と（数値条件なら）NumPy列比較関数に変換"""
+        # リストはin判定
+        if isinstance(expected, (list, tuple)):
+            members = list(expected)
+            return (lambda actual: actual in members), None
+        
+        if isinstance(expected, str):
+            # 範囲指定 "0.5..0.9"（両端含む）
+            match = _RANGE_PATTERN.match(expected)
+            if match:
+                low, high = float(match.group(1)), float(match.group(2))
+                return (
+                    (lambda actual: _is_number(actual) and low <= actual <= high),
+                    (lambda column: (column >= low) & (column <= high))
+                )
+            
+            # 比較演算子 ">0.7", ">=3", "!=idle" など
+            for symbol, compare in _COMPARISONS:
+                if expected.startswith(symbol):
+                    operand = _parse_literal(expected[len(symbol):])
+                    if compare in (operator.eq, operator.ne):
+                        vector = (lambda column: compare(column, operand)) if isinstance(operand, float) else None
+                        return (lambda actual: compare(actual, operand)), vector
+                    if not isinstance(operand, float):
+                        raise ValueError(f"Non-numeric operand in condition: {expected}")
+                    return (
+                        (lambda actual: _is_number(actual) and compare(actual, operand)),
+                        (lambda column: compare(column, operand))
+                    )
+        
+        if _is_number(expected) and not isinstance(expected, bool):
+            return (lambda actual: actual == expected), (lambda column: column == expected)
+        
+        return (lambda actual: actual == expected), None
+    
+    def resolve(self, event_data: dict):
+        """イベントデータからキーパスの値を取得（存在しなければ_MISSING）"""
+        # "." を含むキーそのものが存在する場合はそちらを優先
+        if self.key in event_data:
+            return event_data[self.key]
+        
+        value = event_data
+        for part in self.path:
+            if isinstance(value, dict):
+                if part not in value:
+                    return _MISSING
+                value = value[part]
+            elif isinstance(value, (list, tuple)) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            else:
+                return _MISSING
+        return value
+    
+    def matches(self, event_data: dict) -> bool:
+        actual = self.resolve(event_data)
+        if actual is _MISSING:
+            return False
+        return self.predicate(actual)
+    
+    def matches_batch(self, events: List[dict], columns: dict) -> np.ndarray:
+        """イベント列に対する判定結果をbool配列で返す（数値条件はNumPyで一括比較）"""
+        if self.vector is None:
+            return np.fromiter((self.matches(e) for e in events), dtype=bool, count=len(events))
+        
+        # 同じキーの列は同一バッチ内で使い回す
+        if self.key not in columns:
+            values = [self.resolve(e) for e in events]
+            present = np.fromiter((v is not _MISSING for v in values), dtype=bool, count=len(values))
+            numeric = np.fromiter(
+                (float(v) if _is_number(v) else np.nan for v in values),
+                dtype=float, count=len(values)
+            )
+            columns[self.key] = (present, numeric)
+        
+        present, numeric = columns[self.key]
+        return present & self.vector(numeric)
+
 class TransitionRule:
     def __init__(self, rule_config: dict):
         self.source_machine = rule_config['source_machine']
         self.source_transition = rule_config['source_transition']
         self.target_machine = rule_config['target_machine']
         self.target_event = rule_config['target_event']
-        self.conditions = rule_config.get('conditions', {})
+        self.conditions = rule_config.get('conditions') or {}
+        # 条件はロード時に述語へコンパイル
+        self.compiled_conditions = tuple(
+            Condition(key, expected) for key, expected in self.conditions.items()
+        )
+    
+    def matches(self, event_data: dict) -> bool:
+        """全条件を満たすか判定"""
+        for condition in self.compiled_conditions:
+            if not condition.matches(event_data):
+                return False
+        return True
+    
+    def matches_batch(self, events: List[dict], columns: dict) -> np.ndarray:
+        """イベント列のうち全条件を満たすものをbool配列で返す"""
+        mask = np.ones(len(events), dtype=bool)
+        for condition in self.compiled_conditions:
+            mask &= condition.matches_batch(events, columns)
+            if not mask.any():
+                break
+        return mask
 
 class RulesEngine:
     def __init__(self):
         self.rules = []
+        self.rule_index = {}  # {(source_machine, source_transition): [TransitionRule, ...]}
         self.load_rules()
         
     def load_rules(self):
         """ルール設定ファイル読み込み"""
         try:
-            with open('/config/transition-rules.yaml', 'r') as f:
+            path = os.path.join(os.getenv('CONFIG_DIR', '/config'), 'transition-rules.yaml')
+            with open(path, 'r') as f:
                 rules_config = yaml.safe_load(f)
                 
-            for rule_config in rules_config['rules']:
-                self.rules.append(TransitionRule(rule_config))
+            for index, rule_config in enumerate(rules_config['rules']):
+                # 不正なルール（数値でない比較値等）はそのルールのみ読み飛ばし、他のルールは有効にする
+                try:
+                    rule = TransitionRule(rule_config)
+                except Exception as e:
+                    logger.error(f"Skipping invalid transition rule #{index} {rule_config}: {str(e)}")
+                    continue
+                self.add_rule(rule)
                 
             logger.info(f"Loaded {len(self.rules)} transition rules")
             
@@ -47,54 +191,77 @@ class RulesEngine:
         ]
         
         for rule_config in default_rules:
-            self.rules.append(TransitionRule(rule_config))
+            self.add_rule(TransitionRule(rule_config))
             
         logger.info(f"Loaded {len(self.rules)} default rules")
 
+    def add_rule(self, rule: TransitionRule):
+        """ルール追加（ソースマシン・遷移でインデックス化）"""
+        self.rules.append(rule)
+        self.rule_index.setdefault(
+            (rule.source_machine, rule.source_transition), []
+        ).append(rule)
+
+    def _rules_for(self, machine_id: str, transition_name: str) -> List[TransitionRule]:
+        """ソース遷移のルール（detector@cam01 等のインスタンスにはテンプレート名のルールを適用）"""
+        rules = self.rule_index.get((machine_id, transition_name))
+        if rules is None and '@' in machine_id:
+            rules = self.rule_index.get((machine_id.split('@', 1)[0], transition_name))
+        return rules or []
+
     def get_triggered_events(self, machine_id: str, transition_name: str, 
                            event_data: dict) -> List[Tuple[str, dict]]:
         """遷移によってトリガーされるイベント取得"""
         triggered_events = []
         
-        for rule in self.rules:
-            if (rule.source_machine == machine_id and 
-                rule.source_transition == transition_name):
+        for rule in self._rules_for(machine_id, transition_name):
+            # 条件チェック
+            if rule.matches(event_data):
+                event = {
+                    'name': rule.target_event,
+                    'data': event_data,
+                    'timestamp': datetime.now().isoformat(),
+                    'source_machine': machine_id,
+                    'source_transition': transition_name
+                }
+                triggered_events.append((rule.target_machine, event))
+                logger.info(f"Rule triggered: {rule.source_machine}.{rule.source_transition} -> {rule.target_machine}.{rule.target_event}")
                 
-                # 条件チェック
-                if self._check_conditions(rule.conditions, event_data):
-                    event = {
+        return triggered_events
+        
+    def get_triggered_events_batch(self, inputs: List[Tuple[str, str, dict]]
+                                   ) -> List[List[Tuple[str, dict]]]:
+        """(machine_id, transition_name, event_data) の一覧をまとめて評価
+        
+        戻り値は入力と同じ順序で、各入力について get_triggered_events と同じ結果を返す。
+        """
+        results = [[] for _ in inputs]
+        timestamp = datetime.now().isoformat()
+        
+        # ソース遷移毎にグループ化して列単位で条件判定
+        groups = {}
+        for position, (machine_id, transition_name, _) in enumerate(inputs):
+            groups.setdefault((machine_id, transition_name), []).append(position)
+        
+        triggered_count = 0
+        for (machine_id, transition_name), positions in groups.items():
+            rules = self._rules_for(machine_id, transition_name)
+            if not rules:
+                continue
+            
+            events = [inputs[position][2] for position in positions]
+            columns = {}
+            for rule in rules:
+                for index in np.flatnonzero(rule.matches_batch(events, columns)):
+                    position = positions[index]
+                    results[position].append((rule.target_machine, {
                         'name': rule.target_event,
-                        'data': event_data,
-                        'timestamp': datetime.now().isoformat(),
+                        'data': events[index],
+                        'timestamp': timestamp,
                         'source_machine': machine_id,
                         'source_transition': transition_name
-                    }
-                    triggered_events.append((rule.target_machine, event))
-                    logger.info(f"Rule triggered: {rule.source_machine}.{rule.source_transition} -> {rule.target_machine}.{rule.target_event}")
-                    
-        return triggered_events
+                    }))
+                    triggered_count += 1
         
-    def _check_conditions(self, conditions: dict, event_data: dict) -> bool:
-        """条件チェック"""
-        if not conditions:
-            return True
-            
-        for key, expected_value in conditions.items():
-            if key not in event_data:
-                return False
-                
-            actual_value = event_data[key]
-            
-            # 比較演算子をサポート
-            if isinstance(expected_value, str) and expected_value.startswith('>'):
-                threshold = float(expected_value[1:])
-                if not (isinstance(actual_value, (int, float)) and actual_value > threshold):
-                    return False
-            elif isinstance(expected_value, str) and expected_value.startswith('<'):
-                threshold = float(expected_value[1:])
-                if not (isinstance(actual_value, (int, float)) and actual_value < threshold):
-                    return False
-            elif actual_value != expected_value:
-                return False
-                
-        return True
\ No newline at end of file
+        logger.info(f"Batch rule evaluation: {len(inputs)} events, {triggered_count} triggered")
+        return results
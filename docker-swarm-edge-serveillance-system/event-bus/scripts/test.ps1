@@ -145,7 +145,10 @@ try {
     
     $PersonDetectionResponse = Invoke-RestMethod -Uri "http://localhost:5000/transition" -Method Post -Body ($PersonDetectionRequest | ConvertTo-Json -Depth 4) -ContentType "application/json" -TimeoutSec 10
     
-    Show-TestResult "人物検出イベント送信" $true "Triggered events: $($PersonDetectionResponse.triggered_events)"
+    # コンテナ切り替えとルール連鎖は非同期のため完了を待機
+    $TransitionResult = Invoke-RestMethod -Uri "http://localhost:5000/transitions/$($PersonDetectionResponse.transition_id)?wait=10" -Method Get -TimeoutSec 15
+    
+    Show-TestResult "人物検出イベント送信" ($TransitionResult.status -eq "completed") "Triggered events: $($TransitionResult.triggered_events)"
     
     if ($Verbose) {
         Write-Host "Person Detection Response:" -ForegroundColor Yellow
@@ -0,0 +1,157 @@
+"""PlacementEngine のシミュレーションテスト
+
+get_node_resources() と同じ形式の合成ノード在庫に対して、配置制約による除外（停止・drain・容量超過・
+affinity不一致）、負荷によるスコアリング、同点時の優先順（前状態のノード → タスク数 → ノード名）を確認し、
+多数のマシンの状態遷移を模擬して過剰予約・制約違反が起きないことを検証する。
+
+    python test_placement.py [ノード数] [マシン数] [遷移回数]
+    python -m pytest test_placement.py
+"""
+import random
+import statistics
+import sys
+
+from placement import PlacementEngine
+
+CPU = 10 ** 9
+GIB = 1 << 30
+
+def make_node(name: str, cpus: float = 4, memory_gib: float = 8, running_tasks: int = 0,
+              status: str = 'ready', availability: str = 'active', **labels) -> dict:
+    """get_node_resources() の1ノード分"""
+    return {
+        'node_id': name,
+        'status': status,
+        'availability': availability,
+        'nano_cpus': int(cpus * CPU),
+        'memory_bytes': int(memory_gib * GIB),
+        'running_tasks': running_tasks,
+        'labels': dict({'role': 'edge'}, **labels)
+    }
+
+def synthetic_nodes(count: int, seed: int = 0) -> dict:
+    """容量・状態・カメララベルがばらついたノード在庫（約1割は停止またはdrain）"""
+    rng = random.Random(seed)
+    nodes = {}
+    for i in range(count):
+        status = 'down' if rng.random() < 0.05 else 'ready'
+        availability = 'drain' if rng.random() < 0.05 else 'active'
+        nodes[f'edge-{i:02d}'] = make_node(
+            f'edge-{i:02d}', cpus=rng.choice([2, 4, 8]), memory_gib=rng.choice([2, 4, 8]),
+            status=status, availability=availability, camera=f'cam{i % 8:02d}'
+        )
+    return nodes
+
+def test_constraint_filtering():
+    engine = PlacementEngine()
+    nodes = {
+        'down': make_node('down', status='down'),
+        'drain': make_node('drain', availability='drain'),
+        'no-capacity': make_node('no-capacity', cpus=0),
+        'small': make_node('small', cpus=0.5, memory_gib=0.25),
+        'other-camera': make_node('other-camera', camera='cam02'),
+        'camera': make_node('camera', cpus=1, camera='cam01'),
+    }
+    engine.set_affinity('detector@cam01', {'camera': 'cam01'})
+    assert engine.place('detector@cam01', 'capturing', nodes, CPU // 2, GIB // 2) == 'camera'
+    # 容量を超える要求はどのノードにも配置しない（affinity先が満杯でも他ノードへ逃がさない）
+    assert engine.place('detector@cam01', 'processing', nodes, 2 * CPU, GIB) is None
+    assert 'detector@cam01' not in engine.get_assignments()
+    # affinityなしでも停止・drain・容量不足のノードは除外
+    assert engine.place('surveillance', 'disarmed', nodes, CPU, GIB) in ('other-camera', 'camera')
+    assert engine.constraints_for('camera') == ['node.labels.role==edge', 'node.hostname==camera']
+    assert engine.constraints_for(None) == ['node.labels.role==edge']
+
+def test_scoring_prefers_lowest_load():
+    engine = PlacementEngine()
+    nodes = {'big': make_node('big', cpus=8, memory_gib=8), 'cpu-heavy': make_node('cpu-heavy', cpus=16, memory_gib=2)}
+    # 負荷はCPU・メモリ使用率の大きい方（1CPU/1GiB: bigは12.5%、cpu-heavyはメモリで50%）
+    assert engine.place('a', 'processing', nodes, CPU, GIB) == 'big'
+    # bigが50%に達すると同負荷（ノード名順でbig）、超えるとcpu-heavyの方が低負荷
+    chosen = [engine.place(f'filler{i}', 'processing', nodes, CPU, GIB) for i in range(4)]
+    assert chosen == ['big', 'big', 'big', 'cpu-heavy']
+
+def test_tie_breaking():
+    engine = PlacementEngine()
+    nodes = {
+        'edge-b': make_node('edge-b', running_tasks=1),
+        'edge-a': make_node('edge-a', running_tasks=1),
+        'edge-c': make_node('edge-c', running_tasks=0),
+    }
+    # 同じ負荷ならタスク数の少ないノード
+    assert engine.place('m0', 'capturing', nodes, CPU // 10, GIB // 10) == 'edge-c'
+    engine.release('m0')
+    # タスク数も同じならノード名順
+    nodes['edge-c']['running_tasks'] = 3
+    assert engine.place('m1', 'capturing', nodes, CPU // 10, GIB // 10) == 'edge-a'
+    engine.adopt('heavy', 'processing', 'edge-a', 2 * CPU, GIB)
+    # 次の状態は、より低負荷のノードがあっても前状態のノードに余裕があれば留まる
+    assert engine.place('m1', 'processing', nodes, CPU, GIB) == 'edge-a'
+    # 同じマシンの前状態の予約は差し引いて評価（二重に数えると4CPUを超える）
+    assert engine.place('m1', 'processing', nodes, 3 * CPU // 2, GIB) == 'edge-a'
+    # 前状態のノードに入らなければ最も低負荷のノードへ移動
+    assert engine.place('m1', 'processing', nodes, 5 * CPU // 2, GIB) == 'edge-b'
+
+def simulate(node_count: int = 20, machine_count: int = 60, rounds: int = 10, seed: int = 0) -> dict:
+    """マシン毎に capturing / processing の遷移を繰り返して配置し、不変条件を検証"""
+    rng = random.Random(seed)
+    nodes = synthetic_nodes(node_count, seed)
+    engine = PlacementEngine()
+    machines = [f'detector@cam{i:02d}-{n}' for n, i in enumerate(rng.choices(range(8), k=machine_count))]
+    for machine_id in machines[::3]:
+        engine.set_affinity(machine_id, {'camera': machine_id.split('@')[1].split('-')[0]})
+    profiles = {'capturing': (CPU // 10, GIB // 8), 'processing': (CPU // 2, GIB // 2)}
+
+    moves = unplaced = 0
+    for round_index in range(rounds):
+        state_name = ('capturing', 'processing')[round_index % 2]
+        for machine_id in rng.sample(machines, len(machines)):
+            previous = engine.get_assignments().get(machine_id, {}).get('node')
+            node_name = engine.place(machine_id, state_name, nodes, *profiles[state_name])
+            if node_name is None:
+                unplaced += 1
+                continue
+            node = nodes[node_name]
+            assert node['status'] == 'ready' and node['availability'] == 'active', node_name
+            for key, value in engine.affinity.get(machine_id, {}).items():
+                assert node['labels'].get(key) == value, (machine_id, node_name)
+            if previous is not None and previous != node_name:
+                moves += 1
+            if previous != node_name:
+                node['running_tasks'] += 1
+                if previous is not None:
+                    nodes[previous]['running_tasks'] -= 1
+
+    reserved = {}
+    for assignment in engine.get_assignments().values():
+        cpu, memory = reserved.get(assignment['node'], (0, 0))
+        reserved[assignment['node']] = (cpu + assignment['nano_cpus'], memory + assignment['memory_bytes'])
+    loads = {}
+    for name, (cpu, memory) in reserved.items():
+        assert cpu <= nodes[name]['nano_cpus'] and memory <= nodes[name]['memory_bytes'], name
+        loads[name] = max(cpu / nodes[name]['nano_cpus'], memory / nodes[name]['memory_bytes'])
+
+    return {
+        'placed': len(engine.get_assignments()),
+        'unplaced': unplaced,
+        'moves': moves,
+        'nodes_used': len(loads),
+        'load_max': max(loads.values()),
+        'load_min': min(loads.values()),
+        'load_stdev': statistics.pstdev(loads.values())
+    }
+
+def test_simulation_invariants():
+    for seed in range(5):
+        result = simulate(seed=seed)
+        assert result['placed'] + result['unplaced'] > 0
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:4]]
+    test_constraint_filtering()
+    test_scoring_prefers_lowest_load()
+    test_tie_breaking()
+    result = simulate(*args)
+    print(f"placed {result['placed']} machines on {result['nodes_used']} nodes "
+          f"({result['unplaced']} unplaced placements, {result['moves']} moves)")
+    print(f"load max {result['load_max']:.2f} min {result['load_min']:.2f} stdev {result['load_stdev']:.2f}")
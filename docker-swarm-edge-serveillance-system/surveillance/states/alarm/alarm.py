@@ -1,10 +1,10 @@
 import time
-import requests
 import os
 import json
 import logging
 from datetime import datetime
 import threading
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +14,7 @@ class AlarmState:
         self.machine_id = os.getenv('MACHINE_ID', 'surveillance')
         self.state_name = os.getenv('STATE_NAME', 'alarm')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         self.alarm_active = True
         self.alarm_thread = None
         
@@ -58,7 +59,7 @@ class AlarmState:
         """アラーム解除"""
         self.alarm_active = False
         
-        self._send_transition_event('disarm_alarm', {
+        self.event_bus.send_transition('disarm_alarm', {
             'disarmed_by': 'auto_timeout',
             'alarm_duration': 10,
             'timestamp': datetime.now().isoformat()
@@ -66,29 +67,7 @@ class AlarmState:
         
         logger.info("🟢 Alarm disarmed - returning to normal operation")
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     alarm_state = AlarmState()
+    alarm_state.event_bus.notify_ready()
     alarm_state.run()
\ No newline at end of file
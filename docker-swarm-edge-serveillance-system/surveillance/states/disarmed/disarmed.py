@@ -1,8 +1,8 @@
 import time
-import requests
 import os
 import logging
 from datetime import datetime
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,6 +12,7 @@ class DisarmedState:
         self.machine_id = os.getenv('MACHINE_ID', 'surveillance')
         self.state_name = os.getenv('STATE_NAME', 'disarmed')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         
     def run(self):
         """待機状態実行"""
@@ -31,29 +32,7 @@ class DisarmedState:
                 logger.error(f"Error in disarmed state: {str(e)}")
                 time.sleep(10)
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     disarmed_state = DisarmedState()
+    disarmed_state.event_bus.notify_ready()
     disarmed_state.run()
\ No newline at end of file
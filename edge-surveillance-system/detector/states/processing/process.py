@@ -1,11 +1,11 @@
 import cv2
 import numpy as np
-import requests
 import os
 import json
 import time
 import logging
 from datetime import datetime
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,6 +15,7 @@ class ProcessingState:
         self.machine_id = os.getenv('MACHINE_ID', 'detector')
         self.state_name = os.getenv('STATE_NAME', 'processing')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         self.processing_timeout = 0.5  # 500ms timeout
         
     def run(self):
@@ -31,7 +32,7 @@ class ProcessingState:
                 
                 if person_detected:
                     # 人物検出時
-                    self._send_transition_event('person_detected', {
+                    self.event_bus.send_transition('person_detected', {
                         'detection_confidence': 0.85,
                         'timestamp': datetime.now().isoformat(),
                         'person_count': 1
@@ -40,7 +41,7 @@ class ProcessingState:
                     return
                 else:
                     # 人物未検出
-                    self._send_transition_event('processing_complete', {
+                    self.event_bus.send_transition('processing_complete', {
                         'result': 'no_person',
                         'timestamp': datetime.now().isoformat()
                     })
@@ -51,7 +52,7 @@ class ProcessingState:
                 logger.error(f"Processing error: {str(e)}")
                 
         # タイムアウト時
-        self._send_transition_event('processing_timeout', {
+        self.event_bus.send_transition('processing_timeout', {
             'timeout_duration': self.processing_timeout,
             'timestamp': datetime.now().isoformat()
         })
@@ -62,29 +63,6 @@ class ProcessingState:
         # 簡単なシミュレーション（実際にはYOLOやOpenPoseなどを使用）
         return np.random.random() > 0.6  # 40%の確率で人物検出
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     processing_state = ProcessingState()
-    processing_state.run()
\ No newline at end of file
+    processing_state.event_bus.run_state(processing_state.run)
\ No newline at end of file
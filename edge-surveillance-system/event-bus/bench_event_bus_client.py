@@ -0,0 +1,180 @@
+"""EventBusClient のベンチマーク
+
+1イベント毎の requests.post（変更前の状態コンテナ）と、keep-alive の EventBusClient、
+batch_window によるまとめ送信（スレッド / asyncio）の1イベントあたりの時間を比較する。
+送信先は応答コストがほぼゼロのループバックHTTPサーバー（--connect-delay で接続確立の遅延を模擬）、
+または --event-bus で起動する実際のイベントバス（FakeContainerManager 使用）。
+
+    python bench_event_bus_client.py [--events 1000] [--connect-delay 0.001] [--event-bus]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from bench_sharding import prepare_config, wait_started
+from event_bus_client import AsyncEventBusClient, EventBusClient
+
+BATCH_WINDOW = 0.005
+
+def start_loopback_server(port: int, connect_delay: float):
+    """/transition に202、/transitions に件数分の結果を返すだけのHTTP/1.1サーバー（接続は使い回す）"""
+    async def handle(reader, writer):
+        if connect_delay:
+            await asyncio.sleep(connect_delay)
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n'):
+                    if line.lower().startswith(b'content-length:'):
+                        length = int(line.split(b':')[1])
+                body = await reader.readexactly(length)
+                if head.startswith(b'POST /transitions '):
+                    count = len(json.loads(body)['transitions'])
+                    status = b'200 OK'
+                    body = json.dumps({'results': [{'status': 'accepted', 'status_code': 202}] * count}).encode()
+                else:
+                    status = b'202 ACCEPTED'
+                    body = b'{"status":"accepted"}'
+                writer.write(b'HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n'
+                             % (status, len(body)) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(asyncio.start_server(handle, '127.0.0.1', port))
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.post(f'http://127.0.0.1:{port}/transition', json={}).close()
+            return
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    raise TimeoutError('loopback server did not start')
+
+class Machines:
+    """マシン毎に image_captured / processing_complete を交互に送る（各マシンは1送信者のみが扱う）"""
+    def __init__(self, machine_ids):
+        self.machine_ids = machine_ids
+        self.sent = {machine_id: 0 for machine_id in machine_ids}
+
+    def next_transition(self, machine_id: str) -> str:
+        transition_name = ('image_captured', 'processing_complete')[self.sent[machine_id] % 2]
+        self.sent[machine_id] += 1
+        return transition_name
+
+def run_threads(machines: Machines, rounds: int, threads: int, send):
+    def worker(machine_ids):
+        for _ in range(rounds):
+            for machine_id in machine_ids:
+                assert send(machine_id, machines.next_transition(machine_id)), machine_id
+
+    workers = [threading.Thread(target=worker, args=(machines.machine_ids[i::threads],)) for i in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    for worker_thread in workers:
+        worker_thread.join()
+
+def legacy(url, machines, rounds, threads):
+    """変更前: 1イベント毎に requests.post（接続を使い回さない）"""
+    def send(machine_id, transition_name):
+        response = requests.post(f'{url}/transition', json={
+            'machine_id': machine_id, 'transition_name': transition_name, 'event_data': {}
+        }, timeout=5)
+        return response.status_code == 202
+    run_threads(machines, rounds, 1, send)
+
+def keep_alive(url, machines, rounds, threads):
+    client = EventBusClient(url, pool_size=threads)
+    run_threads(machines, rounds, threads,
+                lambda machine_id, name: client.send_transition(name, {}, machine_id=machine_id))
+    client.close()
+
+def batched(url, machines, rounds, threads):
+    client = EventBusClient(url, batch_window=BATCH_WINDOW)
+    run_threads(machines, rounds, threads,
+                lambda machine_id, name: client.send_transition(name, {}, machine_id=machine_id))
+    client.close()
+
+def async_batched(url, machines, rounds, threads):
+    async def main():
+        client = AsyncEventBusClient(base_url=url, batch_window=BATCH_WINDOW)
+        for _ in range(rounds):
+            results = await asyncio.gather(*[
+                client.send_transition(machines.next_transition(machine_id), {}, machine_id=machine_id)
+                for machine_id in machines.machine_ids
+            ])
+            assert all(results)
+        await client.close()
+    asyncio.run(main())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--machines', type=int, default=60, help='送信先のマシン数（detector@cam000..）')
+    parser.add_argument('--threads', type=int, default=10, help='並行送信するスレッド数')
+    parser.add_argument('--connect-delay', type=float, default=0.0,
+                        help='ループバックサーバーの接続確立時の遅延（ハンドシェイクRTT・DNSの模擬、秒）')
+    parser.add_argument('--event-bus', action='store_true', help='ループバックサーバーの代わりにイベントバスへ送信')
+    parser.add_argument('--port', type=int, default=5190)
+    args = parser.parse_args()
+    if args.event_bus and args.port % 10:
+        parser.error('--port must be a multiple of 10 with --event-bus')
+
+    logging.disable(logging.CRITICAL)
+    rounds = max(1, args.events // args.machines)
+    machine_ids = [f'detector@cam{i:03d}' for i in range(args.machines)]
+    process = None
+    with tempfile.TemporaryDirectory() as config_dir:
+        if args.event_bus:
+            # bench_sharding.py のノードを1シャードで起動
+            prepare_config(config_dir, args.machines)
+            url = f'http://127.0.0.1:{args.port + 1}'
+            process = subprocess.Popen([
+                sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_sharding.py'),
+                '--node', '1', '--shards', '1', '--base-port', str(args.port), '--latency', '0',
+                '--config-dir', config_dir
+            ])
+            wait_started(requests.Session(), url, process)
+        else:
+            start_loopback_server(args.port, args.connect_delay)
+            url = f'http://127.0.0.1:{args.port}'
+
+        try:
+            for name, run in [
+                ('requests.post per event', legacy),
+                ('EventBusClient keep-alive', keep_alive),
+                (f'EventBusClient keep-alive, {args.threads} threads', keep_alive),
+                (f'EventBusClient {BATCH_WINDOW * 1000:.0f}ms batches, {args.threads} threads', batched),
+                (f'AsyncEventBusClient {BATCH_WINDOW * 1000:.0f}ms batches, {args.machines} tasks', async_batched),
+            ]:
+                threads = args.threads if 'threads' in name else 1
+                started_at = time.perf_counter()
+                run(url, Machines(machine_ids), rounds, threads)
+                elapsed = time.perf_counter() - started_at
+                count = rounds * args.machines
+                print(f"{name:50s} {count} events {elapsed:6.2f}s  {elapsed / count * 1e6:6.0f}us/event")
+        finally:
+            if process is not None:
+                process.kill()
+                process.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""ホットスタンバイのフェイルオーバー試験
+
+同じ LEASE_PATH を使うリーダーとスタンバイを FakeContainerManager で起動し、
+クライアントが遷移を送信し続けている間にリーダーを SIGKILL する。
+応答が途切れた時間と、応答済み（202）の遷移が昇格後のスタンバイに残っていることを確認する。
+クライアントはスタンバイに送信する（昇格前はリーダーへ転送される）。
+
+    python bench_failover.py [--cameras 60] [--clients 4] [--duration 2]
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from bench_sharding import prepare_config
+
+def run_node(args):
+    """リーダー / スタンバイ1台分のイベントバス（子プロセスで実行）"""
+    os.environ.update(
+        CONFIG_DIR=args.config_dir,
+        JOURNAL_DIR=os.path.join(args.config_dir, 'journal'),
+        LEASE_PATH=os.path.join(args.config_dir, 'journal', 'leader.lock'),
+        REPLICA_ADVERTISE_URL=f'http://127.0.0.1:{args.node}'
+    )
+    logging.disable(logging.CRITICAL)
+
+    import app
+    from fake_container_manager import FakeContainerManager
+    from werkzeug.serving import make_server
+
+    app.ContainerManager = lambda **kwargs: FakeContainerManager(api_latency=args.latency, **kwargs)
+    app.initialize_system()
+    make_server('127.0.0.1', args.node, app.app, threaded=True).serve_forever()
+
+def wait_health(url: str, process, predicate, timeout: float = 60) -> dict:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        assert process.poll() is None, f'{url} exited'
+        try:
+            health = requests.get(f'{url}/health', timeout=1).json()
+            if predicate(health):
+                return health
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f'{url} did not become ready')
+
+def client(url: str, machine_ids: list, stop: threading.Event, log: list, acked: dict, lost: list):
+    """capturing <-> processing を往復させ、応答毎に (送信時刻, 応答時刻, ステータス) を記録
+
+    応答のなかった遷移は同じ冪等キーで再送する（リーダー停止の直前に確定した遷移は duplicate になる）。
+    """
+    session = requests.Session()
+    sequence = {machine_id: 0 for machine_id in machine_ids}
+    while not stop.is_set():
+        for machine_id in machine_ids:
+            sent_at = time.time()
+            try:
+                response = session.post(f'{url}/transition', json={
+                    'machine_id': machine_id,
+                    'transition_name': ('image_captured', 'processing_complete')[sequence[machine_id] % 2],
+                    'idempotency_key': f'{machine_id}-{sequence[machine_id]}'
+                }, timeout=2)
+                status = response.status_code
+            except requests.RequestException:
+                status = None
+            log.append((sent_at, time.time(), status))
+            if status in (200, 202):
+                acked[machine_id] = response.json()['version']
+                sequence[machine_id] += 1
+            elif status == 400:
+                # 応答済みの遷移が失われると、次に送る遷移が現在状態から無効になる
+                lost.append(machine_id)
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as config_dir:
+        prepare_config(config_dir, args.cameras)
+        command = [sys.executable, os.path.abspath(__file__), '--config-dir', config_dir,
+                   '--latency', str(args.latency)]
+        leader_url, standby_url = (f'http://127.0.0.1:{port}' for port in (args.port, args.port + 1))
+        leader = subprocess.Popen(command + ['--node', str(args.port)])
+        standby = None
+        try:
+            wait_health(leader_url, leader, lambda health: health['status'] in ('healthy', 'prewarming'))
+            standby = subprocess.Popen(command + ['--node', str(args.port + 1)])
+            wait_health(standby_url, standby,
+                        lambda health: (health['replication'].get('follower') or {}).get('connected'))
+
+            machine_ids = [f'detector@cam{i:03d}' for i in range(args.cameras)]
+            stop = threading.Event()
+            log, acked, lost = [], {}, []
+            clients = [threading.Thread(target=client, args=(standby_url, machine_ids[i::args.clients],
+                                                             stop, log, acked, lost))
+                       for i in range(args.clients)]
+            for thread in clients:
+                thread.start()
+            time.sleep(args.duration)
+            killed_at = time.time()
+            leader.send_signal(signal.SIGKILL)
+            time.sleep(args.duration)
+            stop.set()
+            for thread in clients:
+                thread.join()
+
+            status = requests.get(f'{standby_url}/status').json()
+            replication = requests.get(f'{standby_url}/health').json()['replication']
+        finally:
+            for process in (leader, standby):
+                if process is not None:
+                    process.kill()
+                    process.wait()
+
+    before = [replied_at for _, replied_at, code in log if code in (200, 202) and replied_at < killed_at]
+    after = [replied_at for _, replied_at, code in log if code in (200, 202) and replied_at >= killed_at]
+    assert before and after, 'no transitions were acknowledged before or after the failover'
+    assert replication['role'] == 'leader', replication
+    return {
+        'before': len(before),
+        'after': len(after),
+        'errors': sorted({code for _, _, code in log if code not in (200, 202)}, key=str),
+        'gap': min(after) - max(before),
+        'first_ack': min(after) - killed_at,
+        'lost': len(lost),
+        # 応答済みのversionとの差（昇格後のスタンバイが応答済みの遷移を失っていれば負）
+        'mismatches': {machine_id: status[machine_id]['version'] - version
+                       for machine_id, version in acked.items() if status[machine_id]['version'] != version}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cameras', type=int, default=60)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=2, help='SIGKILL前後それぞれの送信時間（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='Docker API呼び出し1回あたりの遅延（秒）')
+    parser.add_argument('--port', type=int, default=5210, help='リーダーは port、スタンバイは port + 1')
+    parser.add_argument('--node', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--config-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.node is not None:
+        run_node(args)
+        return
+
+    result = run(args)
+    print(f"{result['before']} transitions acknowledged before SIGKILL, {result['after']} after; "
+          f"other responses: {result['errors']}")
+    print(f"unavailable for {result['gap'] * 1000:.0f}ms (last ack before -> first ack after), "
+          f"first ack {result['first_ack'] * 1000:.0f}ms after SIGKILL")
+    print(f"lost acknowledged transitions: {result['lost']} invalid transitions, "
+          f"version mismatches {result['mismatches'] or 'none'}")
+    assert result['lost'] == 0 and not result['mismatches']
+
+if __name__ == '__main__':
+    main()
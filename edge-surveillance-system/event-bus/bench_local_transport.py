@@ -0,0 +1,156 @@
+"""ローカルトランスポート（Unixドメインソケット）と HTTP keep-alive の往復時間の比較
+
+1. 通信路のみ: 受け取った遷移イベントをそのまま受理応答する LocalTransportServer と Flask アプリに、
+   LocalTransportClient / keep-alive の requests.Session で送信（フレーム処理とコーデックの比較）
+2. --event-bus: LOCAL_TRANSPORT_PATH を設定したイベントバス（bench_sharding.py のノード）に、
+   EventBusClient で unix:// と http:// からそれぞれ /transition を送信（遷移処理を含む往復）
+
+送信するイベントはバウンディングボックス3個の person_detected（bench_wire_format.py と同じ形）。
+
+    python bench_local_transport.py [--requests 2000] [--format msgpack] [--event-bus]
+"""
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+import wire_format
+from bench_sharding import prepare_config, wait_started
+from bench_wire_format import detector_events
+from event_bus_client import EventBusClient
+from local_transport import LOCAL_SCHEME, LocalTransportClient, LocalTransportServer
+
+def sample_event() -> dict:
+    return dict(detector_events())['person_detected x3']
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50 * 1e6:7.0f}us  p99 {p99 * 1e6:7.0f}us  mean {statistics.mean(samples) * 1e6:7.0f}us"
+
+def time_calls(send, count: int) -> list:
+    for _ in range(min(100, count)):  # 接続確立とウォームアップ
+        send()
+    samples = []
+    for _ in range(count):
+        started_at = time.perf_counter()
+        send()
+        samples.append(time.perf_counter() - started_at)
+    return samples
+
+def bench_transport(socket_path: str, port: int, count: int, content_type: str):
+    """通信路のみ（ハンドラは受理応答を返すだけ）"""
+    from flask import Flask, Response, request
+    from werkzeug.serving import make_server
+
+    def handler(path, body):
+        return {'status': 'accepted', 'machine_id': body['machine_id']}, 202
+
+    server = LocalTransportServer(socket_path, handler)
+    server.start()
+
+    app = Flask(__name__)
+
+    @app.route('/transition', methods=['POST'])
+    def transition():
+        body, status = handler('/transition', wire_format.loads(request.get_data(), request.content_type))
+        return Response(wire_format.dumps(body, content_type), status=status, mimetype=content_type)
+
+    http_server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+    event = sample_event()
+    client = LocalTransportClient(socket_path)
+    # LocalTransportClient は msgpack がインストールされていれば msgpack を使うため、HTTP側と形式を揃える
+    client.flag = 1 if wire_format.is_msgpack(content_type) else 0
+
+    def send_local():
+        status, _, _ = client.request('/transition', event)
+        assert status == 202
+
+    session = requests.Session()
+    session.headers.update({'Content-Type': content_type, 'Accept': content_type})
+    url = f'http://127.0.0.1:{port}/transition'
+
+    def send_http():
+        response = session.post(url, data=wire_format.dumps(event, content_type))
+        assert response.status_code == 202
+        wire_format.loads(response.content, response.headers.get('Content-Type'))
+
+    print(f"transport only ({content_type}):")
+    print(f"  {'unix socket':22s} {percentiles(time_calls(send_local, count))}")
+    print(f"  {'HTTP keep-alive':22s} {percentiles(time_calls(send_http, count))}")
+    client.close()
+    server.stop()
+    http_server.shutdown()
+
+def bench_event_bus(config_dir: str, socket_path: str, port: int, count: int, payload_format: str):
+    """イベントバスの /transition（遷移の確定・キュー投入を含む）"""
+    prepare_config(config_dir, 60)
+    url = f'http://127.0.0.1:{port + 1}'
+    process = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_sharding.py'),
+        '--node', '1', '--shards', '1', '--base-port', str(port), '--latency', '0', '--config-dir', config_dir
+    ], env=dict(os.environ, LOCAL_TRANSPORT_PATH=socket_path))
+    try:
+        wait_started(requests.Session(), url, process)
+        event_data = sample_event()['event_data']
+        print(f"event bus /transition ({payload_format}):")
+        for name, base_url in (('unix socket', LOCAL_SCHEME + socket_path.format(shard=1)), ('HTTP keep-alive', url)):
+            # マシン毎に image_captured / person_detected を交互に送る
+            client = EventBusClient(base_url, max_retries=0, payload_format=payload_format)
+            machine_ids = [f'detector@cam{i:03d}' for i in range(60)]
+            calls = iter(range(10 ** 9))
+
+            def send():
+                index = next(calls)
+                machine_id = machine_ids[index % len(machine_ids)]
+                if (index // len(machine_ids)) % 2 == 0:
+                    result = client.send_transition('image_captured', {}, machine_id=machine_id)
+                else:
+                    result = client.send_transition('person_detected', dict(event_data, detection_confidence=0.5),
+                                                    machine_id=machine_id)
+                assert result is not None
+
+            # ウォームアップの件数と合わせて往復の回数を偶数周にする
+            samples = time_calls(send, count - (count + 100) % (2 * len(machine_ids)))
+            print(f"  {name:22s} {percentiles(samples)}")
+            assert client.local is None or client._local_retry_at == 0, 'fell back to HTTP'
+            client.close()
+    finally:
+        process.kill()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--format', choices=('json', 'msgpack'), default='msgpack')
+    parser.add_argument('--event-bus', action='store_true', help='通信路のみの比較の後にイベントバスへの往復も計測')
+    parser.add_argument('--port', type=int, default=5170)
+    args = parser.parse_args()
+    if args.format == 'msgpack' and wire_format.msgpack is None:
+        parser.error('msgpack is not installed')
+
+    logging.disable(logging.CRITICAL)
+    content_type = wire_format.MSGPACK_TYPE if args.format == 'msgpack' else wire_format.JSON_TYPE
+    with tempfile.TemporaryDirectory() as directory:
+        bench_transport(os.path.join(directory, 'transport.sock'), args.port + 9, args.requests, content_type)
+        if args.event_bus:
+            config_dir = os.path.join(directory, 'config')
+            os.makedirs(config_dir)
+            bench_event_bus(config_dir, os.path.join(directory, 'shard-{shard}.sock'), args.port,
+                            args.requests, args.format)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""シャード構成の負荷試験
+
+Dockerの代わりに FakeContainerManager（API呼び出し毎の遅延を模擬）を使うイベントバスを
+シャード数分のプロセスで起動し、カメラ毎の detector@{camera_id} マシンへの遷移を全てシャード1に送信する。
+1シャード / Nシャードの完了時間を比較し、シャードを跨ぐルール連鎖と /status の集約を確認する。
+
+    python bench_sharding.py [--shards 3] [--cameras 60] [--latency 0.02]
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config')
+
+def prepare_config(config_dir: str, camera_count: int):
+    """リポジトリの設定を複製し、detector をカメラ毎のテンプレートにする"""
+    for name in os.listdir(CONFIG_DIR):
+        if name.endswith('.yaml'):
+            shutil.copy(os.path.join(CONFIG_DIR, name), config_dir)
+    path = os.path.join(config_dir, 'detector-config.yaml')
+    with open(path) as f:
+        config = f.read()
+    with open(path, 'w') as f:
+        f.write(re.sub(r'^machine_id: .*$', 'machine_id: "detector@{camera_id}"', config, count=1, flags=re.M))
+    with open(os.path.join(config_dir, 'cameras.yaml'), 'w') as f:
+        f.write('cameras:\n' + ''.join(f'  - camera_id: cam{i:03d}\n' for i in range(camera_count)))
+
+def shard_url(base_port: int, shard) -> str:
+    return f'http://127.0.0.1:{base_port + int(shard)}'
+
+def run_node(args):
+    """1シャード分のイベントバス（子プロセスで実行）"""
+    os.environ.update(
+        CONFIG_DIR=args.config_dir,
+        JOURNAL_DIR=os.path.join(args.config_dir, f'journal-{args.node}'),
+        SHARD_ID=str(args.node),
+        SHARD_COUNT=str(args.shards),
+        # {shard} のみ置換されるため、ポート番号の下1桁をシャード番号にする
+        SHARD_URL_TEMPLATE=f'http://127.0.0.1:{args.base_port // 10}{{shard}}',
+        TRANSITION_WORKERS=str(args.workers)
+    )
+    logging.disable(logging.CRITICAL)
+
+    import app
+    from fake_container_manager import FakeContainerManager
+    from werkzeug.serving import make_server
+
+    app.ContainerManager = lambda **kwargs: FakeContainerManager(api_latency=args.latency, **kwargs)
+    app.initialize_system()
+    make_server('127.0.0.1', args.base_port + args.node, app.app, threaded=True).serve_forever()
+
+def wait_started(session, url: str, process, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        assert process.poll() is None, f'{url} exited'
+        try:
+            startup = session.get(f'{url}/health').json()['startup']
+            if startup and startup['complete']:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'{url} did not start')
+
+def run(args, shard_count: int) -> dict:
+    with tempfile.TemporaryDirectory() as config_dir:
+        prepare_config(config_dir, args.cameras)
+        command = [sys.executable, os.path.abspath(__file__), '--config-dir', config_dir,
+                   '--shards', str(shard_count), '--base-port', str(args.base_port),
+                   '--latency', str(args.latency), '--workers', str(args.workers)]
+        processes = [subprocess.Popen(command + ['--node', str(shard)]) for shard in range(1, shard_count + 1)]
+        session = requests.Session()
+        entry = shard_url(args.base_port, 1)
+        try:
+            started_at = time.time()
+            for shard, process in enumerate(processes, 1):
+                wait_started(session, shard_url(args.base_port, shard), process)
+            startup = time.time() - started_at
+            owned = {shard: len(session.get(f'{shard_url(args.base_port, shard)}/shard').json()['machines'])
+                     for shard in range(1, shard_count + 1)}
+
+            # 全リクエストをシャード1に送信（他シャード所有のマシンは転送される）
+            machine_ids = [f'detector@cam{i:03d}' for i in range(args.cameras)]
+
+            def post(machine_id):
+                return session.post(f'{entry}/transition', json={
+                    'machine_id': machine_id, 'transition_name': 'image_captured'
+                }).json()['transition_id']
+
+            def wait(transition_id):
+                return session.get(f'{entry}/transitions/{transition_id}', params={'wait': 30}).json()
+
+            started_at = time.time()
+            with ThreadPoolExecutor(args.clients) as executor:
+                transition_ids = list(executor.map(post, machine_ids))
+                accepted = time.time() - started_at
+                results = list(executor.map(wait, transition_ids))
+            completed = time.time() - started_at
+            assert {result['status'] for result in results} == {'completed'}, results
+
+            # シャードを跨ぐルール連鎖（detector@cam005 -> surveillance）
+            response = session.post(f'{entry}/transition', json={
+                'machine_id': 'detector@cam005', 'transition_name': 'person_detected',
+                'event_data': {'detection_confidence': 0.9}
+            }).json()
+            chain = wait(response['transition_id'])['triggered_events']
+            assert chain, 'no rule was triggered'
+            # /status はどのシャードに問い合わせても全マシンを返す
+            status = session.get(f'{entry}/status').json()
+            assert len(status) == args.cameras + 1, len(status)
+            return {'startup': startup, 'owned': owned, 'accepted': accepted,
+                    'completed': completed, 'chain': chain}
+        finally:
+            for process in processes:
+                process.kill()
+                process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=3)
+    parser.add_argument('--cameras', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.02, help='Docker API呼び出し1回あたりの遅延（秒）')
+    parser.add_argument('--workers', type=int, default=2, help='シャード毎の TRANSITION_WORKERS')
+    parser.add_argument('--clients', type=int, default=16, help='並行して送信するクライアント数')
+    parser.add_argument('--base-port', type=int, default=5110, help='シャードNは base-port + N で待ち受け')
+    parser.add_argument('--node', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--config-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.base_port % 10 or args.shards > 9:
+        parser.error('--base-port must be a multiple of 10 and --shards at most 9')
+
+    if args.node is not None:
+        run_node(args)
+        return
+
+    for shard_count in sorted({1, args.shards}):
+        result = run(args, shard_count)
+        print(f"{shard_count} shard(s): startup {result['startup']:.2f}s, owned {result['owned']}, "
+              f"{args.cameras} transitions accepted in {result['accepted']:.2f}s, "
+              f"completed in {result['completed']:.2f}s")
+    print(f"cross-shard chain: detector@cam005.person_detected triggered {result['chain']} event(s)")
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,411 @@
 import docker
 import logging
+import os
+import threading
 import time
-from typing import Dict, Optional
+import uuid
+from typing import Callable, Dict, Optional
+
+from docker_watcher import DockerEventWatcher
+from resource_monitor import ResourceMonitor
+from state_machines import ResourceProfile, resource_name
 
 logger = logging.getLogger(__name__)
 
 class ContainerManager:
-    def __init__(self):
+    HANDOFF_MODES = ('break-before-make', 'make-before-break')
+    
+    def __init__(self, handoff_mode: str = None, event_bus_url_for: Callable[[str], str] = None,
+                 local_socket_for: Callable[[str], str] = None,
+                 on_generation: Callable[[str, str, Optional[str]], None] = None):
         self.client = docker.from_env()
         self.active_containers = {}  # {machine_id: container_id}
+        # 状態コンテナに渡すイベントバスURL（シャード構成ではマシンを所有するシャード）
+        self.event_bus_url_for = event_bus_url_for or (lambda machine_id: 'http://event-bus:5000')
+        # 同一ホストの状態コンテナにはイベントバスのソケットを含むボリュームをマウントし、ソケットで接続させる
+        self.local_socket_for = local_socket_for
+        self.local_transport_volume = os.getenv('LOCAL_TRANSPORT_VOLUME', 'edge-surveillance-event-bus-socket')
+        # コンテナ毎の世代トークン（STATE_GENERATION）。イベントの送信を始める前に on_generation で通知し、
+        # 置き換えられたコンテナからの遅延イベントをイベントバスで破棄させる
+        self.on_generation = on_generation
+        self.generations = {}  # {container_id: 世代トークン}
+        
+        # break-before-make: 旧コンテナ停止後に起動 / make-before-break: 新コンテナ準備完了後に旧コンテナ停止
+        self.handoff_mode = handoff_mode or os.getenv('TRANSITION_HANDOFF', 'break-before-make')
+        if self.handoff_mode not in self.HANDOFF_MODES:
+            raise ValueError(f"Unknown handoff mode: {self.handoff_mode}")
+        self.ready_timeout = float(os.getenv('READY_TIMEOUT', '30'))
+        
+        # ウォームスタンバイプール（キー: (machine_id, state_name)）
+        self.pool_config = {}        # {key: (container_image, size)}
+        self.standby_pools = {}      # {key: [container_id, ...]} 起動通知済み
+        self.pending_standby = {}    # {container_id: (key, created_at)} 起動通知待ち
+        self.pool_stats = {}         # {key: {'hits': int, 'misses': int}}
+        self.standby_ready_timeout = 120
+        self._pool_lock = threading.Lock()
+        self._refilling = set()
+        
+        # frozenライフサイクルの常駐コンテナ {(machine_id, state_name): container_id}
+        self.frozen_containers = {}
+        
+        # 状態毎のリソースプロファイルと観測値に基づく推奨（RESOURCE_AUTOSIZE=off/recommend/apply）
+        self.resource_profiles = {}  # {(machine_id, state_name): ResourceProfile}
+        self.resource_monitor = ResourceMonitor(
+            self.client, mode=os.getenv('RESOURCE_AUTOSIZE', 'recommend'), is_running=self._is_running
+        )
+        
+        # コンテナ状態はイベントストリームで保持し、ポーリングしない
+        self.watcher = DockerEventWatcher(self.client)
+        # ラベルのないコンテナを名前の接頭辞で検索済みのmachine_id（索引にないため初回のみAPIで検索）
+        self._unlabeled_swept = set()
+        self.watcher.start()
         
     def start_state_container(self, machine_id: str, state_name: str, 
-                            container_image: str) -> str:
+                            container_image: str, lifecycle: str = 'ephemeral',
+                            stop_existing: bool = True) -> str:
         """状態用コンテナ起動"""
         try:
-            container_name = f"{machine_id}-{state_name}"
-            
-            # 既存コンテナがあれば強制停止
-            self._force_stop_existing_containers(machine_id)
-            
-            # 新しいコンテナ起動
-            container = self.client.containers.run(
-                image=container_image,
-                name=container_name,
-                detach=True,
-                environment={
-                    'MACHINE_ID': machine_id,
-                    'STATE_NAME': state_name,
-                    'EVENT_BUS_URL': 'http://event-bus:5000'
-                },
-                network='edge-surveillance-network',
-                restart_policy={"Name": "no"}  # 自動再起動を無効化
-            )
-            
-            self.active_containers[machine_id] = container.id
-            logger.info(f"Started container {container_name} ({container.id[:12]})")
-            
-            return container.id
+            container_name = f"{resource_name(machine_id)}-{state_name}"
             
+            if stop_existing:
+                # 既存コンテナがあれば強制停止
+                self._force_stop_existing_containers(machine_id)
+            elif self.watcher.find_containers(machine_id=machine_id, state=state_name):
+                # 旧コンテナと並行起動する場合は名前の衝突を避ける
+                container_name = f"{container_name}-{uuid.uuid4().hex[:8]}"
+
+            if lifecycle == 'frozen':
+                # 常駐コンテナとして起動（以降は一時停止/再開で切り替え）
+                container = self._run_container(
+                    container_name, machine_id, state_name, container_image, frozen=True
+                )
+                container_id = container.id
+                self.frozen_containers[(machine_id, state_name)] = container_id
+                logger.info(f"Started frozen-lifecycle container {container_name} ({container_id[:12]})")
+            else:
+                # スタンバイプールから起動済みコンテナを取得
+                container_id = self._acquire_standby(machine_id, state_name)
+
+                if container_id is None:
+                    # 新しいコンテナ起動
+                    container = self._run_container(
+                        container_name, machine_id, state_name, container_image
+                    )
+                    container_id = container.id
+                    logger.info(f"Started container {container_name} ({container_id[:12]})")
+
+                self._schedule_refill((machine_id, state_name))
+
+            self.active_containers[machine_id] = container_id
+            self.resource_monitor.track(machine_id, state_name, container_id)
+
+            return container_id
+
         except Exception as e:
             logger.error(f"Failed to start container for {machine_id}-{state_name}: {str(e)}")
             raise
 
+    def adopt_state_containers(self, machine_id: str, current_state, states) -> Optional[str]:
+        """event-bus再起動時: ラベルから既存コンテナを検出し、復元した状態と照合
+
+        現在状態と一致するコンテナ（frozen状態の一時停止コンテナを含む）は引き継ぎ、
+        不一致のもののみ停止する。引き継いだコンテナIDを返す（なければNone）。
+        """
+        self._stop_unlabeled_containers(machine_id)
+        states_by_name = {state.name: state for state in states}
+        adopted_id = None
+        mismatched = []
+        
+        # 稼働中のコンテナを優先して引き継ぐ
+        entries = sorted(self.watcher.find_containers(machine_id=machine_id),
+                         key=lambda entry: entry['status'] != 'running')
+        for entry in entries:
+            state = states_by_name.get(entry['labels'].get('state'))
+            # スタンバイの準備完了状況は再起動で失われるため引き継がない（プールは再補充）
+            matches = (state is not None and entry['image'] == state.container_image and
+                       '-standby-' not in entry['name'])
+            if (matches and adopted_id is None and state.name == current_state.name and
+                    entry['status'] in ('running', 'paused')):
+                if entry['status'] == 'paused':
+                    # 切り替え途中で停止した場合は再開（再開できなければ置き換え）
+                    try:
+                        self.client.api.unpause(entry['id'])
+                        self.watcher.note_container_status(entry['id'], 'running')
+                        if state.lifecycle == 'frozen':
+                            self.client.api.kill(entry['id'], signal='SIGUSR1')
+                    except Exception as e:
+                        logger.warning(f"Failed to resume {entry['name']}: {str(e)}")
+                        mismatched.append(entry)
+                        continue
+                adopted_id = entry['id']
+                self.generations[adopted_id] = entry['labels'].get('generation')
+                self._activate(machine_id, state.name, adopted_id)
+                if state.lifecycle == 'frozen':
+                    self.frozen_containers[(machine_id, state.name)] = entry['id']
+            elif (matches and state.lifecycle == 'frozen' and entry['status'] == 'paused' and
+                    state.name != current_state.name and
+                    (machine_id, state.name) not in self.frozen_containers):
+                self.frozen_containers[(machine_id, state.name)] = entry['id']
+                self.generations[entry['id']] = entry['labels'].get('generation')
+            else:
+                mismatched.append(entry)
+        
+        for entry in mismatched:
+            logger.info(f"Replacing mismatched container {entry['name']} ({entry['status']})")
+            self._stop_container_by_id(entry['id'])
+        
+        if adopted_id is not None:
+            self.active_containers[machine_id] = adopted_id
+            self.resource_monitor.track(machine_id, current_state.name, adopted_id)
+            logger.info(f"Adopted running container for {machine_id}-{current_state.name} "
+                        f"({adopted_id[:12]}), replaced {len(mismatched)}")
+        return adopted_id
+
+    def _run_container(self, container_name: str, machine_id: str, state_name: str,
+                       container_image: str, standby: bool = False, frozen: bool = False):
+        """状態コンテナ作成・起動"""
+        generation = uuid.uuid4().hex[:16]
+        environment = {
+            'MACHINE_ID': machine_id,
+            'STATE_NAME': state_name,
+            'EVENT_BUS_URL': self.event_bus_url_for(machine_id),
+            'STATE_LIFECYCLE': 'frozen' if frozen else 'ephemeral',
+            'STATE_GENERATION': generation
+        }
+        if standby:
+            environment['STANDBY_MODE'] = '1'
+        volumes = None
+        if self.local_socket_for is not None:
+            # 遷移イベントはソケットで送信し、接続できない場合はHTTPのURLにフォールバック
+            socket_path = self.local_socket_for(machine_id)
+            environment['EVENT_BUS_HTTP_URL'] = environment['EVENT_BUS_URL']
+            environment['EVENT_BUS_URL'] = f"unix://{socket_path}"
+            volumes = {self.local_transport_volume: {'bind': os.path.dirname(socket_path), 'mode': 'rw'}}
+
+        profile = self.resource_monitor.effective_profile(
+            machine_id, state_name,
+            self.resource_profiles.get((machine_id, state_name), ResourceProfile())
+        )
+
+        # スタンバイコンテナは取り出して起動シグナルを送る時点で有効化
+        if not standby and self.on_generation is not None:
+            self.on_generation(machine_id, state_name, generation)
+
+        container = self.client.containers.run(
+            image=container_image,
+            name=container_name,
+            detach=True,
+            environment=environment,
+            volumes=volumes,
+            labels={
+                'machine-id': machine_id,
+                'state': state_name,
+                'generation': generation,
+                'app': 'edge-surveillance'
+            },
+            network='edge-surveillance-network',
+            restart_policy={"Name": "no"},  # 自動再起動を無効化
+            nano_cpus=profile.cpu_limit,
+            mem_limit=profile.memory_limit,
+            mem_reservation=profile.memory_reservation,
+            # CPU予約は相対的な配分（1 CPU = 1024 shares、Dockerの最小値は2）として指定
+            cpu_shares=max(int(profile.cpu_reservation / 1e9 * 1024), 2) if profile.cpu_reservation else None
+        )
+        self.generations[container.id] = generation
+        return container
+
+    def _activate(self, machine_id: str, state_name: str, container_id: str):
+        """既存コンテナ（スタンバイ・frozen・引き継ぎ）の世代をイベント送信の再開前に有効化"""
+        if self.on_generation is not None:
+            self.on_generation(machine_id, state_name, self.generations.get(container_id))
+
+    def prewarm_image(self, image: str) -> dict:
+        """イメージをローカルに用意（同じタグの移動も反映するため毎回pull。ダイジェストが同じなら層は再取得しない）"""
+        try:
+            previous_id = self.client.images.get(image).id
+        except docker.errors.ImageNotFound:
+            previous_id = None
+        try:
+            current_id = self.client.images.pull(image).id
+        except docker.errors.APIError:
+            if previous_id is None:
+                raise
+            # composeでビルドしたローカルイメージ等、レジストリにないイメージはローカルのものを使う
+            return {'pulled': False, 'local': True}
+        return {'pulled': previous_id is None, 'updated': previous_id not in (None, current_id)}
+
+    def configure_resources(self, machine_id: str, state_name: str, profile: ResourceProfile):
+        """(machine_id, state_name) ごとのCPU/メモリ制限・予約を設定"""
+        self.resource_profiles[(machine_id, state_name)] = profile
+
+    def get_resource_report(self) -> Dict[str, dict]:
+        """状態毎の設定値・観測p95・推奨値"""
+        return self.resource_monitor.get_report(dict(self.resource_profiles))
+
+    def configure_standby_pool(self, machine_id: str, state_name: str,
+                               container_image: str, size: int):
+        """(machine_id, state_name) ごとのスタンバイプール設定"""
+        if size <= 0:
+            return
+
+        key = (machine_id, state_name)
+        with self._pool_lock:
+            self.pool_config[key] = (container_image, size)
+            self.standby_pools.setdefault(key, [])
+            self.pool_stats.setdefault(key, {'hits': 0, 'misses': 0})
+
+        logger.info(f"Standby pool configured for {machine_id}-{state_name}: size={size}")
+        self._schedule_refill(key)
+
+    def mark_standby_ready(self, container_hostname: str) -> bool:
+        """スタンバイコンテナからの起動完了通知を登録"""
+        with self._pool_lock:
+            for container_id, (key, _) in self.pending_standby.items():
+                if container_id.startswith(container_hostname):
+                    del self.pending_standby[container_id]
+                    self.standby_pools[key].append(container_id)
+                    self.watcher.mark_ready(container_hostname)
+                    logger.info(f"Standby container ready: {key[0]}-{key[1]} ({container_id[:12]})")
+                    return True
+        return False
+
+    def _acquire_standby(self, machine_id: str, state_name: str) -> Optional[str]:
+        """スタンバイコンテナを取り出して起動シグナル送信"""
+        key = (machine_id, state_name)
+        if key not in self.pool_config:
+            return None
+
+        while True:
+            with self._pool_lock:
+                pool = self.standby_pools[key]
+                if not pool:
+                    self.pool_stats[key]['misses'] += 1
+                    logger.info(f"Standby pool miss: {machine_id}-{state_name}")
+                    return None
+                container_id = pool.pop(0)
+
+            try:
+                status = self._indexed_status(container_id)
+                if status != 'running':
+                    raise RuntimeError(f"standby container is {status}")
+
+                # 待機中の状態スクリプトに処理開始を通知
+                self._activate(machine_id, state_name, container_id)
+                self.client.api.kill(container_id, signal='SIGUSR1')
+
+            except Exception as e:
+                logger.warning(f"Discarding standby container {container_id[:12]}: {str(e)}")
+                self._stop_container_by_id(container_id)
+                continue
+
+            with self._pool_lock:
+                self.pool_stats[key]['hits'] += 1
+            logger.info(f"Standby pool hit: {machine_id}-{state_name} ({container_id[:12]})")
+            return container_id
+
+    def _schedule_refill(self, key):
+        """バックグラウンドでスタンバイプールを補充"""
+        with self._pool_lock:
+            if key not in self.pool_config or key in self._refilling:
+                return
+            self._refilling.add(key)
+
+        threading.Thread(target=self._refill_pool, args=(key,), daemon=True).start()
+
+    def _refill_pool(self, key):
+        """スタンバイプール補充処理"""
+        machine_id, state_name = key
+        container_image, size = self.pool_config[key]
+
+        try:
+            while True:
+                with self._pool_lock:
+                    expired = [
+                        cid for cid, (pending_key, created_at) in self.pending_standby.items()
+                        if pending_key == key and time.time() - created_at > self.standby_ready_timeout
+                    ]
+                    for cid in expired:
+                        del self.pending_standby[cid]
+
+                    pending_count = sum(
+                        1 for pending_key, _ in self.pending_standby.values() if pending_key == key
+                    )
+                    filled = len(self.standby_pools[key]) + pending_count >= size
+
+                for cid in expired:
+                    logger.warning(f"Standby container {cid[:12]} never became ready, removing")
+                    self._stop_container_by_id(cid)
+
+                if filled:
+                    break
+
+                container_name = f"{resource_name(machine_id)}-{state_name}-standby-{uuid.uuid4().hex[:8]}"
+                container = self._run_container(
+                    container_name, machine_id, state_name, container_image, standby=True
+                )
+                with self._pool_lock:
+                    self.pending_standby[container.id] = (key, time.time())
+                logger.info(f"Created standby container {container_name} ({container.id[:12]})")
+
+        except Exception as e:
+            logger.error(f"Standby pool refill failed for {machine_id}-{state_name}: {str(e)}")
+        finally:
+            with self._pool_lock:
+                self._refilling.discard(key)
+
+    def _has_standby(self, machine_id: str, state_name: str) -> bool:
+        """利用可能なスタンバイコンテナがあるか"""
+        with self._pool_lock:
+            return bool(self.standby_pools.get((machine_id, state_name)))
+
+    def _is_standby_container(self, container_id: str) -> bool:
+        """プール管理下のスタンバイコンテナか判定"""
+        with self._pool_lock:
+            if container_id in self.pending_standby:
+                return True
+            return any(container_id in pool for pool in self.standby_pools.values())
+
+    def get_pool_stats(self) -> Dict[str, dict]:
+        """スタンバイプールのヒット/ミス統計取得"""
+        stats = {}
+        with self._pool_lock:
+            for key, (container_image, size) in self.pool_config.items():
+                pending_count = sum(
+                    1 for pending_key, _ in self.pending_standby.values() if pending_key == key
+                )
+                hits = self.pool_stats[key]['hits']
+                misses = self.pool_stats[key]['misses']
+                stats[f"{key[0]}-{key[1]}"] = {
+                    'image': container_image,
+                    'size': size,
+                    'ready': len(self.standby_pools[key]),
+                    'pending': pending_count,
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / (hits + misses) if hits + misses else None
+                }
+        return stats
+
     def transition_container(self, machine_id: str, old_state, new_state):
         """状態遷移時のコンテナ切り替え"""
         try:
-            # 古いコンテナ強制停止
+            if self.handoff_mode == 'make-before-break':
+                self._transition_overlapped(machine_id, old_state, new_state)
+                return
+            
+            # 古いコンテナ停止（frozenなら一時停止して保持）
+            if old_state.lifecycle == 'frozen':
+                self._freeze_container(machine_id, old_state.name)
             self._force_stop_existing_containers(machine_id)
             
-            # 少し待機してからコンテナ起動
-            time.sleep(0.5)
+            # frozenコンテナが残っていれば再開のみで切り替え
+            if new_state.lifecycle == 'frozen' and self._thaw_container(machine_id, new_state.name):
+                logger.info(f"Transitioned {machine_id}: {old_state.name} -> {new_state.name} (thawed)")
+                return
             
-            # 新しいコンテナ起動
+            # 新しいコンテナ起動（旧コンテナは削除済みのため名前は衝突しない）
             self.start_state_container(
-                machine_id, new_state.name, new_state.container_image
+                machine_id, new_state.name, new_state.container_image, new_state.lifecycle
             )
             
             logger.info(f"Transitioned {machine_id}: {old_state.name} -> {new_state.name}")
@@ -62,38 +414,161 @@ class ContainerManager:
             logger.error(f"Container transition failed for {machine_id}: {str(e)}")
             raise
 
-    def _force_stop_existing_containers(self, machine_id: str):
-        """既存のコンテナを強制停止（すべてのパターンで）"""
+    def _transition_overlapped(self, machine_id: str, old_state, new_state):
+        """make-before-break: 新コンテナの準備完了を確認してから旧コンテナを停止"""
+        started_at = time.time()
+        old_container_id = self.active_containers.get(machine_id)
+        
+        if new_state.lifecycle == 'frozen' and self._thaw_container(machine_id, new_state.name):
+            new_container_id = self.active_containers[machine_id]
+        else:
+            new_container_id = self.start_state_container(
+                machine_id, new_state.name, new_state.container_image, new_state.lifecycle,
+                stop_existing=False
+            )
+        
+        ready = self._wait_for_ready(new_container_id)
+        
+        # 旧コンテナ停止（frozenなら一時停止して保持）
+        frozen_ids = set(self.frozen_containers.values())
+        if old_container_id in frozen_ids:
+            if old_container_id != new_container_id:
+                self._freeze_container(machine_id, old_state.name)
+        elif old_container_id is not None:
+            self._stop_container_by_id(old_container_id)
+        self._force_stop_existing_containers(machine_id, keep=new_container_id)
+        
+        logger.info(
+            f"Transitioned {machine_id}: {old_state.name} -> {new_state.name} "
+            f"(overlapped, {'ready' if ready else 'not ready'} after {time.time() - started_at:.2f}s)"
+        )
+
+    def _wait_for_ready(self, container_id: str) -> bool:
+        """準備完了通知（またはHEALTHCHECK）をイベント通知で待機"""
+        if self.watcher.wait_for(lambda: self.watcher.is_ready(container_id), self.ready_timeout):
+            return True
+        logger.warning(f"Container {container_id[:12]} not ready after {self.ready_timeout}s, handing off anyway")
+        return False
+
+    def _freeze_container(self, machine_id: str, state_name: str):
+        """frozenコンテナをcgroup freezerで一時停止"""
+        container_id = self.frozen_containers.get((machine_id, state_name))
+        if container_id is None:
+            return
+        
+        if self.active_containers.get(machine_id) == container_id:
+            del self.active_containers[machine_id]
+        try:
+            if self._indexed_status(container_id) == 'running':
+                self.client.api.pause(container_id)
+                self.watcher.note_container_status(container_id, 'paused')
+                logger.info(f"Paused container {machine_id}-{state_name} ({container_id[:12]})")
+        except Exception as e:
+            # 一時停止できないコンテナは破棄して次回再作成
+            logger.warning(f"Failed to pause {machine_id}-{state_name}: {str(e)}")
+            del self.frozen_containers[(machine_id, state_name)]
+            self._stop_container_by_id(container_id)
+
+    def _thaw_container(self, machine_id: str, state_name: str) -> bool:
+        """一時停止中のfrozenコンテナを再開"""
+        container_id = self.frozen_containers.get((machine_id, state_name))
+        if container_id is None:
+            return False
+        
+        try:
+            status = self._indexed_status(container_id)
+            self._activate(machine_id, state_name, container_id)
+            if status in ['paused', 'running']:
+                if status == 'paused':
+                    self.client.api.unpause(container_id)
+                # 再開を待機中の状態スクリプトに次の処理開始を通知
+                self.client.api.kill(container_id, signal='SIGUSR1')
+            elif status in ['exited', 'created']:
+                # 状態スクリプトが終了していた場合は同じコンテナを再起動
+                self.client.api.start(container_id)
+            else:
+                raise RuntimeError(f"unexpected container status {status}")
+            self.watcher.note_container_status(container_id, 'running')
+            
+            self.active_containers[machine_id] = container_id
+            self.resource_monitor.track(machine_id, state_name, container_id)
+            logger.info(f"Resumed container {machine_id}-{state_name} ({container_id[:12]})")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"Failed to resume {machine_id}-{state_name}, recreating: {str(e)}")
+            del self.frozen_containers[(machine_id, state_name)]
+            self._stop_container_by_id(container_id)
+            return False
+
+    def _force_stop_existing_containers(self, machine_id: str, keep: str = None):
+        """既存のコンテナを強制停止（すべてのパターンで、keepは除く）"""
         try:
             # 1. アクティブコンテナリストから停止
-            if machine_id in self.active_containers:
+            if machine_id in self.active_containers and self.active_containers[machine_id] != keep:
                 container_id = self.active_containers[machine_id]
                 self._stop_container_by_id(container_id)
                 del self.active_containers[machine_id]
+                self._forget_frozen(container_id)
             
-            # 2. 名前パターンマッチで停止（念のため）
-            containers = self.client.containers.list(all=True)
-            for container in containers:
-                if container.name.startswith(f"{machine_id}-"):
-                    logger.info(f"Force stopping container by name pattern: {container.name}")
-                    self._stop_container_by_id(container.id)
+            # 2. ラベル索引から停止（念のため、スタンバイ・frozenコンテナは除く）
+            frozen_ids = set(self.frozen_containers.values())
+            for entry in self.watcher.find_containers(machine_id=machine_id):
+                if (entry['id'] != keep and entry['id'] not in frozen_ids and
+                        not self._is_standby_container(entry['id'])):
+                    logger.info(f"Force stopping container by label: {entry['name']}")
+                    self._stop_container_by_id(entry['id'])
+            
+            # 3. ラベルのないコンテナは名前パターンマッチで停止
+            self._stop_unlabeled_containers(machine_id, keep)
             
         except Exception as e:
             logger.warning(f"Error during force stop for {machine_id}: {str(e)}")
 
+    def _stop_unlabeled_containers(self, machine_id: str, keep: str = None):
+        """ラベル導入前の版などで起動した "{machine}-" で始まるラベルなしコンテナを停止（マシン毎に初回のみ）"""
+        if machine_id in self._unlabeled_swept:
+            return
+        prefix = f"{resource_name(machine_id)}-"
+        try:
+            for container in self.client.containers.list(all=True, filters={'name': prefix}):
+                if (container.name.startswith(prefix) and container.id != keep and
+                        container.labels.get('app') != self.watcher.app_label):
+                    logger.info(f"Force stopping unlabeled container by name pattern: {container.name}")
+                    self._stop_container_by_id(container.id)
+            self._unlabeled_swept.add(machine_id)
+        except Exception as e:
+            logger.warning(f"Error stopping unlabeled containers for {machine_id}: {str(e)}")
+
+    def _forget_frozen(self, container_id: str):
+        """停止したコンテナをfrozen管理から外す"""
+        for key, frozen_id in list(self.frozen_containers.items()):
+            if frozen_id == container_id:
+                del self.frozen_containers[key]
+
+    def _is_running(self, container_id: str) -> bool:
+        """索引上で実行中か（一時停止・停止中、索引にないコンテナはFalse）"""
+        entry = self.watcher.get_container(container_id)
+        return entry is not None and entry['status'] == 'running'
+
+    def _indexed_status(self, container_id: str) -> str:
+        """索引からコンテナ状態を取得（イベント未着の場合のみAPIに問い合わせ）"""
+        entry = self.watcher.get_container(container_id)
+        if entry is not None:
+            return entry['status']
+        return self.client.containers.get(container_id).status
+
     def _stop_container_by_id(self, container_id: str):
         """コンテナIDで停止"""
+        self.generations.pop(container_id, None)
         try:
-            container = self.client.containers.get(container_id)
-            
-            if container.status == 'running':
+            if self._indexed_status(container_id) == 'running':
                 logger.info(f"Stopping running container {container_id[:12]}")
-                container.stop(timeout=5)  # より短いタイムアウト
+                self.client.api.stop(container_id, timeout=5)  # より短いタイムアウト
             
-            # コンテナ削除
-            if container.status in ['exited', 'created', 'stopped']:
-                container.remove(force=True)
-                logger.info(f"Removed container {container_id[:12]}")
+            # コンテナ削除（同期的に削除されるため、直後に同名コンテナを起動できる）
+            self.client.api.remove_container(container_id, force=True)
+            logger.info(f"Removed container {container_id[:12]}")
                 
         except docker.errors.NotFound:
             logger.info(f"Container {container_id[:12]} not found (already removed)")
@@ -107,6 +582,11 @@ class ContainerManager:
             except:
                 pass
 
+    def mark_container_ready(self, container_hostname: str):
+        """状態スクリプトからの準備完了通知を登録"""
+        self.watcher.mark_ready(container_hostname)
+        logger.info(f"Container ready: {container_hostname[:12]}")
+
     def get_container_status(self, machine_id: str) -> dict:
         """コンテナ状態取得"""
         if machine_id not in self.active_containers:
@@ -114,16 +594,29 @@ class ContainerManager:
             
         container_id = self.active_containers[machine_id]
         try:
-            container = self.client.containers.get(container_id)
+            entry = self.watcher.get_container(container_id)
+            if entry is None:
+                # 起動直後でイベント未着の場合のみAPIに問い合わせ
+                container = self.client.containers.get(container_id)
+                entry = {
+                    'status': container.status,
+                    'health': None,
+                    'image': container.image.tags[0] if container.image.tags else 'unknown',
+                    'name': container.name
+                }
             return {
-                'status': container.status,
+                'status': entry['status'],
+                'health': entry['health'],
                 'container_id': container_id[:12],
-                'image': container.image.tags[0] if container.image.tags else 'unknown',
-                'name': container.name
+                'image': entry['image'] or 'unknown',
+                'name': entry['name'],
+                'frozen_states': sorted(
+                    state for (owner, state) in list(self.frozen_containers) if owner == machine_id
+                )
             }
         except docker.errors.NotFound:
             # コンテナが見つからない場合はリストから削除
-            del self.active_containers[machine_id]
+            self.active_containers.pop(machine_id, None)
             return {'status': 'not_found'}
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
@@ -132,7 +625,7 @@ class ContainerManager:
         """全コンテナクリーンアップ（デバッグ用）"""
         try:
             if machine_id:
-                pattern = f"{machine_id}-"
+                pattern = f"{resource_name(machine_id)}-"
             else:
                 pattern = "detector-"  # または適切なプレフィックス
                 
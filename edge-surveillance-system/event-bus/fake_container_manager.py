@@ -0,0 +1,86 @@
+"""Dockerを使わない ContainerManager（ストレステスト・負荷試験用）
+
+app が呼び出すメソッドのみを持ち、コンテナ操作は Docker API 1回あたり api_latency 秒の待ちで模擬する。
+コンテナ切り替えの順序と、同一マシンの切り替えの重なりを記録する。
+"""
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+class FakeContainerManager:
+    # 操作毎の Docker API 呼び出し回数（break-before-make: 旧コンテナ停止 + 新コンテナ起動）
+    API_CALLS = {'adopt': 1, 'start': 2, 'transition': 2}
+
+    def __init__(self, event_bus_url_for=None, on_generation=None, local_socket_for=None,
+                 api_latency: float = 0.0):
+        self.event_bus_url_for = event_bus_url_for
+        self.on_generation = on_generation
+        self.api_latency = api_latency
+        self.active_containers = {}  # {machine_id: (container_id, state_name)}
+        self.applied = defaultdict(list)  # {machine_id: [(old_state, new_state), ...]}
+        self.overlaps = 0
+        self.api_calls = 0
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def _call_api(self, operation: str):
+        count = self.API_CALLS[operation]
+        with self._lock:
+            self.api_calls += count
+        if self.api_latency:
+            time.sleep(self.api_latency * count)
+
+    def _run(self, machine_id: str, state_name: str):
+        container_id = uuid.uuid4().hex
+        self.active_containers[machine_id] = (container_id, state_name)
+        if self.on_generation is not None:
+            self.on_generation(machine_id, state_name, container_id[:12])
+
+    def prewarm_image(self, image: str) -> dict:
+        return {'pulled': False}
+
+    def configure_resources(self, machine_id, state_name, profile):
+        pass
+
+    def configure_standby_pool(self, machine_id, state_name, container_image, size):
+        pass
+
+    def adopt_state_containers(self, machine_id, current_state, states):
+        self._call_api('adopt')
+        return None
+
+    def start_state_container(self, machine_id, state_name, container_image,
+                              lifecycle='ephemeral', stop_existing=True):
+        self._call_api('start')
+        self._run(machine_id, state_name)
+
+    def transition_container(self, machine_id, old_state, new_state):
+        with self._lock:
+            if machine_id in self._active:
+                self.overlaps += 1
+            self._active.add(machine_id)
+        self._call_api('transition')  # 切り替え中に他スレッドの遷移を割り込ませる
+        self._run(machine_id, new_state.name)
+        with self._lock:
+            self.applied[machine_id].append((old_state.name, new_state.name))
+            self._active.discard(machine_id)
+
+    def mark_container_ready(self, container_hostname):
+        pass
+
+    def mark_standby_ready(self, container_hostname) -> bool:
+        return False
+
+    def get_pool_stats(self) -> dict:
+        return {}
+
+    def get_resource_report(self) -> dict:
+        return {}
+
+    def get_container_status(self, machine_id: str) -> dict:
+        if machine_id not in self.active_containers:
+            return {'status': 'not_running'}
+        container_id, state_name = self.active_containers[machine_id]
+        return {'status': 'running', 'health': None, 'container_id': container_id[:12],
+                'image': f'{state_name}:fake', 'name': f'{machine_id}-{state_name}', 'frozen_states': []}
@@ -0,0 +1,115 @@
+import glob
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+def load_container_images(config_paths: List[str]) -> List[str]:
+    """ステートマシン設定から全状態のcontainer_imageを収集"""
+    images = []
+    for path in config_paths:
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        for state_config in (config.get('states') or {}).values():
+            image = state_config.get('container_image')
+            if image and image not in images:
+                images.append(image)
+    return images
+
+class ImagePrewarmer:
+    """全状態イメージを事前取得し、設定ファイル変更時に再取得"""
+    def __init__(self, prewarm_image: Callable[[str], dict], config_paths: List[str],
+                 check_interval: float = 30.0, config_glob: str = None):
+        self.prewarm_image = prewarm_image  # イメージ1つを全対象ノードに用意（失敗時は例外）
+        self.config_paths = config_paths
+        self.config_glob = config_glob  # 確認毎に再検索する設定ファイル（追加されたマシン設定も対象にする）
+        self.check_interval = check_interval
+
+        self.progress = {}  # {image: {'status', 'detail', 'updated_at'}}
+        self._config_mtimes = {}
+        self._lock = threading.RLock()
+        self.first_pass_done = threading.Event()  # 初回の事前取得が完了（成否問わず）
+
+    def start(self):
+        """初回の事前取得と設定変更監視をバックグラウンドで開始"""
+        threading.Thread(target=self._run, daemon=True, name='image-prewarm').start()
+
+    def _run(self):
+        while True:
+            try:
+                paths = self._current_paths()
+                if self._configs_changed(paths):
+                    self.prewarm(load_container_images(paths))
+            except Exception as e:
+                logger.error(f"Image prewarm failed: {str(e)}")
+            self.first_pass_done.set()
+            time.sleep(self.check_interval)
+
+    def wait_first_pass(self, timeout: float = None) -> bool:
+        """初回の事前取得の完了まで待機（初期コンテナの起動をイメージの取得後に行うため）"""
+        return self.first_pass_done.wait(timeout)
+
+    def _current_paths(self) -> List[str]:
+        paths = list(self.config_paths)
+        if self.config_glob:
+            paths += [path for path in sorted(glob.glob(self.config_glob)) if path not in paths]
+        return paths
+
+    def _configs_changed(self, paths: List[str]) -> bool:
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        changed = mtimes != self._config_mtimes
+        self._config_mtimes = mtimes
+        return changed
+
+    def prewarm(self, images: List[str]):
+        """全イメージを順に用意（同じタグでも内容が更新されている場合があるため毎回確認）"""
+        with self._lock:
+            # 設定から外れたイメージは進捗から除外
+            for image in list(self.progress):
+                if image not in images:
+                    del self.progress[image]
+            for image in images:
+                self._set(image, 'pending')
+
+        for image in images:
+            self._set(image, 'pulling')
+            started_at = time.time()
+            try:
+                detail = self.prewarm_image(image)
+                detail['seconds'] = round(time.time() - started_at, 2)
+                self._set(image, 'ready', detail)
+                logger.info(f"Prewarmed image {image}: {detail}")
+            except Exception as e:
+                self._set(image, 'failed', {'error': str(e)})
+                logger.warning(f"Failed to prewarm image {image}: {str(e)}")
+
+    def _set(self, image: str, status: str, detail: dict = None):
+        with self._lock:
+            self.progress[image] = {
+                'status': status,
+                'detail': detail,
+                'updated_at': datetime.now().isoformat()
+            }
+
+    def get_progress(self) -> Dict[str, dict]:
+        with self._lock:
+            images = {image: dict(entry) for image, entry in self.progress.items()}
+        statuses = [entry['status'] for entry in images.values()]
+        return {
+            'complete': bool(statuses) and all(status in ('ready', 'failed') for status in statuses),
+            'ready': statuses.count('ready'),
+            'failed': statuses.count('failed'),
+            'total': len(statuses),
+            'images': images
+        }
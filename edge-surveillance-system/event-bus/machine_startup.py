@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class MachineStartup:
+    """マシン毎の初期コンテナ起動を並列数上限付きでバックグラウンド実行し、進捗を保持"""
+    def __init__(self, start_machine: Callable[[str], None], max_workers: int = 8):
+        self.start_machine = start_machine  # マシン1台分の初期コンテナ起動（失敗時は例外）
+        self.max_workers = max_workers
+        self.machines = {}  # {machine_id: {'status', 'error', 'started_at', 'seconds'}}
+        self._events = {}   # {machine_id: threading.Event} 起動処理の完了（成否問わず）
+        self._lock = threading.Lock()
+        self._executor = None
+        self._wait_before_start = None
+        self.accept_transitions = False  # 起動中のマシンへの遷移を受け付けるか
+
+    def start(self, machine_ids: List[str], accept_transitions: bool = False,
+              wait_before_start: Callable[[], object] = None):
+        """全マシンの起動を投入してすぐに戻る（HTTPサーバーは並行して受付開始）
+
+        accept_transitions=True（稼働中コンテナの引き継ぎ）では起動処理中も遷移を受け付け、
+        コンテナ切り替えのみ起動処理の完了後に行う。
+        wait_before_start を指定すると、各マシンの起動前にその完了を待つ（待機中のマシンも起動中として扱う）。
+        """
+        self.accept_transitions = accept_transitions
+        self._wait_before_start = wait_before_start
+        with self._lock:
+            for machine_id in machine_ids:
+                self.machines[machine_id] = {
+                    'status': 'pending', 'error': None, 'started_at': None, 'seconds': None
+                }
+                self._events[machine_id] = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='machine-startup')
+        for machine_id in machine_ids:
+            self._executor.submit(self._start_one, machine_id)
+        # 全件完了後にワーカースレッドを解放
+        threading.Thread(target=self._executor.shutdown, kwargs={'wait': True},
+                         daemon=True, name='machine-startup-reaper').start()
+
+    def _start_one(self, machine_id: str):
+        try:
+            if self._wait_before_start is not None:
+                self._wait_before_start()
+        except Exception as e:
+            logger.warning(f"Waiting before starting {machine_id} failed: {str(e)}")
+        self._update(machine_id, status='starting', started_at=datetime.now().isoformat())
+        started_at = time.time()
+        try:
+            self.start_machine(machine_id)
+            seconds = round(time.time() - started_at, 2)
+            self._update(machine_id, status='ready', seconds=seconds)
+            logger.info(f"Machine {machine_id} started in {seconds}s")
+        except Exception as e:
+            seconds = round(time.time() - started_at, 2)
+            self._update(machine_id, status='failed', error=str(e), seconds=seconds)
+            logger.error(f"Machine {machine_id} failed to start after {seconds}s: {str(e)}")
+        finally:
+            self._events[machine_id].set()
+
+    def _update(self, machine_id: str, **fields):
+        with self._lock:
+            self.machines[machine_id].update(fields)
+
+    def is_starting(self, machine_id: str) -> bool:
+        """初期コンテナの起動処理が未完了のマシンか（未登録マシンはFalse）"""
+        event = self._events.get(machine_id)
+        return event is not None and not event.is_set()
+
+    def blocks_transitions(self, machine_id: str) -> bool:
+        """起動処理が未完了のため遷移を受け付けないマシンか"""
+        return not self.accept_transitions and self.is_starting(machine_id)
+
+    def wait(self, machine_id: str, timeout: float = None) -> bool:
+        """マシンの起動処理完了まで待機（遷移のコンテナ切り替えを初期起動の後に行うため）"""
+        event = self._events.get(machine_id)
+        return event is None or event.wait(timeout)
+
+    def get_machine(self, machine_id: str) -> dict:
+        with self._lock:
+            entry = self.machines.get(machine_id)
+            return dict(entry) if entry else None
+
+    def get_progress(self) -> Dict[str, object]:
+        with self._lock:
+            machines = {machine_id: dict(entry) for machine_id, entry in self.machines.items()}
+        statuses = [entry['status'] for entry in machines.values()]
+        return {
+            'complete': all(status in ('ready', 'failed') for status in statuses),
+            'ready': statuses.count('ready'),
+            'failed': statuses.count('failed'),
+            'total': len(statuses),
+            'machines': machines
+        }
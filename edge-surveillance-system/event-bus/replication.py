@@ -0,0 +1,242 @@
+import collections
+import fcntl
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+from sharding import ShardRouter
+
+logger = logging.getLogger(__name__)
+
+def default_advertise_url(port: int = 5000) -> str:
+    """フォロワーからリーダーへの接続先（コンテナのIPアドレス）"""
+    return f"http://{socket.gethostbyname(socket.gethostname())}:{port}"
+
+class LeaderLease:
+    """同一ノード上のリースファイルに対するflockでリーダーを選出
+
+    ロックはリーダーのプロセスが終了するとカーネルが即座に解放するため、
+    待機中のフォロワーはTTL切れを待たずに引き継げる。ファイルにはリーダーのURLを書き込む。
+    """
+    def __init__(self, path: str, advertise_url: str):
+        self.path = path
+        self.advertise_url = advertise_url
+        self.is_leader = False
+        self.acquired_at = None
+        self._fd = None
+
+    def _open(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def try_acquire(self) -> bool:
+        """リースを取得できればリーダーになる（他プロセスが保持中ならFalse）"""
+        try:
+            fcntl.flock(self._open(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self._publish()
+        return True
+
+    def acquire(self):
+        """リースが解放されるまで待機して取得（フォロワーの待機スレッドで呼ぶ）"""
+        fcntl.flock(self._open(), fcntl.LOCK_EX)
+        self._publish()
+
+    def _publish(self):
+        """リーダーのURLをリースファイルに書き込み"""
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, json.dumps({
+            'url': self.advertise_url, 'pid': os.getpid(), 'acquired_at': time.time()
+        }).encode(), 0)
+        self.acquired_at = time.time()
+
+    def leader_url(self) -> Optional[str]:
+        """現在のリーダーのURL（自身がリーダーなら自身のURL）"""
+        if self.is_leader:
+            return self.advertise_url
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f).get('url')
+        except (OSError, ValueError):
+            return None
+
+class ReplicationLog:
+    """確定済み遷移の連番付きリングバッファ（リーダーがフォロワーへ配信）"""
+    def __init__(self, capacity: int = 10000, wait_timeout: float = 0.5):
+        self.wait_timeout = wait_timeout  # 応答前にフォロワーへの送信を待つ上限（フォロワー停滞時は非同期に縮退）
+        self.epoch = uuid.uuid4().hex  # リーダー毎に異なる値（連番は別リーダーとの間で比較できない）
+        self.seq = 0
+        self.sent_seq = 0  # フォロワーへの送信（ソケットへの書き込み）が完了した連番
+        self.followers = 0
+        self._entries = collections.deque(maxlen=capacity)  # [(seq, line)]
+        self._cond = threading.Condition()
+
+    def append(self, machine_id: str, transition_name: str, from_state: str,
+               to_state: str, version: int, idempotency_key: str = None) -> int:
+        """確定済み遷移を追加してそのseqを返す（マシンのロック内で呼ぶことでマシン毎の順序を保証）"""
+        with self._cond:
+            self.seq += 1
+            entry = {
+                'type': 'transition',
+                'seq': self.seq,
+                'machine_id': machine_id,
+                'transition': transition_name,
+                'from_state': from_state,
+                'to_state': to_state,
+                'version': version
+            }
+            if idempotency_key:
+                entry['key'] = idempotency_key
+            line = json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+            self._entries.append((self.seq, line))
+            self._cond.notify_all()
+            return self.seq
+
+    def wait_replicated(self, seq: int, timeout: float = None) -> bool:
+        """seqまでの遷移がフォロワーへ送信されるまで待機（フォロワー未接続なら待たない）
+
+        送信済みのデータはリーダーのプロセスが終了してもカーネルからフォロワーへ届くため、
+        応答前に待つことで応答済みの遷移がフェイルオーバーで失われないようにする。
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.followers == 0 or self.sent_seq >= seq,
+                self.wait_timeout if timeout is None else timeout
+            )
+
+    def _sent(self, seq: int):
+        with self._cond:
+            if seq > self.sent_seq:
+                self.sent_seq = seq
+                self._cond.notify_all()
+
+    def _read(self, since: int, timeout: float) -> Optional[List[bytes]]:
+        """since より後のエントリ（バッファから溢れていればNone）"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > since, timeout)
+            if self.seq > since and (not self._entries or self._entries[0][0] > since + 1):
+                return None
+            return [line for seq, line in self._entries if seq > since]
+
+    def stream(self, epoch: str, since: int, snapshot_source: Callable[[], Dict[str, dict]],
+               heartbeat: float = 1.0) -> Iterator[bytes]:
+        """スナップショット（必要時）に続けて確定済み遷移を改行区切りJSONで配信"""
+        # 別のリーダーの連番から再開する場合はスナップショットから配信
+        snapshot = epoch != self.epoch or since > self.seq
+        with self._cond:
+            self.followers += 1
+        try:
+            while True:
+                lines = None if snapshot else self._read(since, heartbeat)
+                if lines is None:
+                    # 取得前の連番を送るため、直後の遷移はスナップショットと重複し得る（フォロワーはversionで判定）
+                    since = self.seq
+                    snapshot = False
+                    yield json.dumps({
+                        'type': 'snapshot', 'epoch': self.epoch, 'seq': since,
+                        'machines': snapshot_source()
+                    }).encode() + b'\n'
+                elif not lines:
+                    yield json.dumps({'type': 'heartbeat', 'seq': since}).encode() + b'\n'
+                else:
+                    since += len(lines)
+                    yield b''.join(lines)
+                # 次の要求で再開された時点で直前の送信は完了している
+                self._sent(since)
+        finally:
+            with self._cond:
+                self.followers -= 1
+                self._cond.notify_all()
+
+class ReplicationFollower:
+    """リーダーの配信を購読し、ローカルのステートマシンに反映"""
+    FORWARD_HEADERS = ('Content-Type', 'Accept', ShardRouter.FORWARDED_HEADER)  # リーダーへ引き継ぐヘッダー
+
+    def __init__(self, leader_url: Callable[[], Optional[str]],
+                 apply_states: Callable[[Dict[str, dict]], int],
+                 heartbeat: float = 1.0, reconnect_interval: float = 0.2):
+        self.leader_url = leader_url
+        self.apply_states = apply_states  # {machine_id: {'state', 'version'[, 'keys']}} のうち新しいものを反映
+        self.heartbeat = heartbeat
+        self.reconnect_interval = reconnect_interval
+
+        self.epoch = None
+        self.seq = 0
+        self.stats = {'connected': False, 'snapshots': 0, 'applied': 0, 'last_received_at': None}
+        self._session = requests.Session()
+        self._stopped = False
+        self._response = None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name='replication-follower').start()
+
+    def stop(self):
+        """購読を停止（昇格時）"""
+        self._stopped = True
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def _run(self):
+        while not self._stopped:
+            url = self.leader_url()
+            try:
+                if url:
+                    self._follow(url)
+            except Exception as e:
+                if not self._stopped:
+                    logger.warning(f"Replication stream from {url} interrupted: {str(e)}")
+            self.stats['connected'] = False
+            if not self._stopped:
+                time.sleep(self.reconnect_interval)
+
+    def _follow(self, url: str):
+        self._response = self._session.get(
+            f"{url}/replication/stream", params={'epoch': self.epoch, 'since': self.seq}, stream=True,
+            timeout=(self.reconnect_interval * 5, self.heartbeat * 3)
+        )
+        self._response.raise_for_status()
+        self.stats['connected'] = True
+        logger.info(f"Following leader {url} from seq {self.seq}")
+        for line in self._response.iter_lines():
+            if self._stopped:
+                return
+            if not line:
+                continue
+            entry = json.loads(line)
+            self.stats['last_received_at'] = time.time()
+            if entry['type'] == 'snapshot':
+                self.apply_states(entry['machines'])
+                self.epoch = entry['epoch']
+                self.stats['snapshots'] += 1
+            elif entry['type'] == 'transition':
+                saved = {'state': entry['to_state'], 'version': entry['version']}
+                if entry.get('key'):
+                    saved['keys'] = {entry['key']: entry['version']}
+                self.apply_states({entry['machine_id']: saved})
+                self.stats['applied'] += 1
+            self.seq = entry['seq']
+
+    def forward(self, method: str, path: str, data: bytes, headers,
+                timeout: float = 5.0) -> requests.Response:
+        """スタンバイが受けたリクエストをリーダーへ転送"""
+        url = self.leader_url()
+        if not url:
+            raise RuntimeError('No leader has published its URL')
+        return self._session.request(
+            method, url + path, data=data, timeout=timeout,
+            headers={key: value for key, value in headers.items() if key in self.FORWARD_HEADERS}
+        )
+
+    def get_stats(self) -> Dict[str, object]:
+        return dict(self.stats, epoch=self.epoch, seq=self.seq)
@@ -0,0 +1,138 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from state_machines import ResourceProfile
+
+logger = logging.getLogger(__name__)
+
+class ResourceMonitor:
+    """状態コンテナの container.stats() を購読し、p95使用量から制限値を推奨"""
+    MODES = ('off', 'recommend', 'apply')
+
+    def __init__(self, client, mode: str = 'recommend', window: int = 600,
+                 min_samples: int = 30, headroom: float = 1.2,
+                 is_running: Callable[[str], bool] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown resource autosize mode: {mode}")
+        self.client = client
+        self.mode = mode
+        self.min_samples = min_samples
+        self.headroom = headroom  # 推奨制限 = p95 × headroom
+        self.window = window
+        # 一時停止中（frozen）・停止中のコンテナのほぼ0のサンプルはp95を下げるため記録しない
+        self.is_running = is_running
+
+        self.samples = {}   # {(machine_id, state_name): deque[(cpu_nano, memory_bytes)]}
+        self.streams = {}   # {container_id: (machine_id, state_name)} 購読中のコンテナ
+        self._lock = threading.Lock()
+
+    def track(self, machine_id: str, state_name: str, container_id: str):
+        """コンテナの統計ストリーム購読を開始（コンテナ毎に1回のみ）"""
+        if self.mode == 'off':
+            return
+        key = (machine_id, state_name)
+        with self._lock:
+            if container_id in self.streams:
+                return
+            self.streams[container_id] = key
+            self.samples.setdefault(key, deque(maxlen=self.window))
+        threading.Thread(target=self._stream, args=(container_id, key), daemon=True,
+                         name=f'stats-{container_id[:12]}').start()
+
+    def _stream(self, container_id: str, key):
+        """統計ストリーム処理（コンテナ削除でストリームが終了するまで）"""
+        try:
+            for stats in self.client.api.stats(container_id, stream=True, decode=True):
+                if self.is_running is not None and not self.is_running(container_id):
+                    continue
+                sample = self._parse_stats(stats)
+                if sample is not None:
+                    with self._lock:
+                        self.samples[key].append(sample)
+        except Exception as e:
+            logger.debug(f"Stats stream for {container_id[:12]} ended: {str(e)}")
+        finally:
+            with self._lock:
+                self.streams.pop(container_id, None)
+
+    @staticmethod
+    def _parse_stats(stats: dict) -> Optional[tuple]:
+        """1サンプルをCPU使用量(nano CPUs)とメモリ使用量(キャッシュ除く)に変換"""
+        cpu_stats = stats.get('cpu_stats', {})
+        precpu_stats = stats.get('precpu_stats', {})
+        cpu_delta = (cpu_stats.get('cpu_usage', {}).get('total_usage', 0) -
+                     precpu_stats.get('cpu_usage', {}).get('total_usage', 0))
+        system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+        online_cpus = cpu_stats.get('online_cpus') or len(
+            cpu_stats.get('cpu_usage', {}).get('percpu_usage') or []
+        ) or 1
+        if system_delta <= 0:
+            return None
+
+        memory_stats = stats.get('memory_stats', {})
+        usage = memory_stats.get('usage')
+        if usage is None:
+            return None
+        # cgroup v2: inactive_file / v1: cache をページキャッシュとして除外
+        cache = memory_stats.get('stats', {}).get('inactive_file',
+                                                  memory_stats.get('stats', {}).get('cache', 0))
+
+        cpu_nano = int(cpu_delta / system_delta * online_cpus * 1e9)
+        return max(cpu_nano, 0), max(usage - cache, 0)
+
+    def recommend(self, machine_id: str, state_name: str) -> Optional[ResourceProfile]:
+        """観測p95から推奨プロファイルを算出（サンプル不足はNone）"""
+        with self._lock:
+            samples = list(self.samples.get((machine_id, state_name), ()))
+        if len(samples) < self.min_samples:
+            return None
+
+        observed = np.array(samples, dtype=np.float64)
+        cpu_p95, memory_p95 = np.percentile(observed, 95, axis=0)
+        memory_peak = observed[:, 1].max()
+
+        # CPU超過はスロットリングのみだが、メモリ超過はOOM killのためピークを下回らない
+        return ResourceProfile(
+            cpu_limit=max(int(cpu_p95 * self.headroom), 50000000),  # 最低0.05 CPU
+            memory_limit=max(int(memory_p95 * self.headroom), int(memory_peak), 32 * 1024 * 1024),
+            cpu_reservation=int(cpu_p95),
+            memory_reservation=int(memory_p95)
+        )
+
+    def effective_profile(self, machine_id: str, state_name: str,
+                          configured: ResourceProfile) -> ResourceProfile:
+        """applyモードでは推奨値、それ以外は設定値を使用"""
+        if self.mode == 'apply':
+            recommended = self.recommend(machine_id, state_name)
+            if recommended is not None:
+                return recommended
+        return configured
+
+    def get_report(self, profiles: Dict[tuple, ResourceProfile]) -> Dict[str, dict]:
+        """/resources 用: 設定値・観測値・推奨値"""
+        report = {}
+        for (machine_id, state_name), configured in profiles.items():
+            with self._lock:
+                samples = list(self.samples.get((machine_id, state_name), ()))
+            observed = None
+            if samples:
+                values = np.array(samples, dtype=np.float64)
+                cpu_p95, memory_p95 = np.percentile(values, 95, axis=0)
+                observed = {
+                    'samples': len(samples),
+                    'cpu_p95': int(cpu_p95),
+                    'memory_p95': int(memory_p95),
+                    'memory_peak': int(values[:, 1].max())
+                }
+            recommended = self.recommend(machine_id, state_name)
+            report[f"{machine_id}-{state_name}"] = {
+                'configured': configured.to_dict(),
+                'observed': observed,
+                'recommended': recommended.to_dict() if recommended else None,
+                'applied': self.mode == 'apply' and recommended is not None
+            }
+        return report
@@ -0,0 +1,102 @@
+import bisect
+import hashlib
+import logging
+import os
+import re
+from typing import List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_TRANSITION_ID_SHARD = re.compile(r'^s(\d+)-')
+
+class HashRing:
+    """machine_id を仮想ノード付きのコンシステントハッシュでシャードに割り当て"""
+    def __init__(self, shards: List[str], vnodes: int = 128):
+        points = sorted(
+            (self._hash(f"{shard}#{index}"), shard)
+            for shard in shards for index in range(vnodes)
+        )
+        self._keys = [key for key, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def owner(self, key: str) -> str:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._shards[index]
+
+class ShardRouter:
+    """自シャードが所有するマシンの判定と、他シャード所有マシンへのリクエスト転送
+
+    シャードは 1..SHARD_COUNT の番号で識別し、各シャードのURLは SHARD_URL_TEMPLATE から作る。
+    SHARD_COUNT=1（既定）では全マシンを自身が所有し、転送は行わない。
+    """
+    FORWARDED_HEADER = 'X-Event-Bus-Forwarded'  # 転送元シャード（転送の連鎖を防ぐ）
+
+    def __init__(self, shard_id: str = None, shard_count: int = None,
+                 url_template: str = None, timeout: float = 5.0):
+        self.shard_count = int(shard_count or os.getenv('SHARD_COUNT', '1'))
+        self.shard_id = str(shard_id or os.getenv('SHARD_ID', '1'))
+        self.url_template = url_template or os.getenv(
+            'SHARD_URL_TEMPLATE', 'http://event-bus-{shard}:5000'
+        )
+        self.default_url = os.getenv('EVENT_BUS_URL', 'http://event-bus:5000')
+        self.timeout = timeout
+        self.enabled = self.shard_count > 1
+
+        self.shards = [str(index) for index in range(1, self.shard_count + 1)]
+        if self.shard_id not in self.shards:
+            raise ValueError(f"SHARD_ID {self.shard_id} is not in 1..{self.shard_count}")
+        self.ring = HashRing(self.shards)
+
+        # シャード間の接続を再利用
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.shard_count, pool_maxsize=32)
+        self.session.mount('http://', adapter)
+
+    def owner(self, machine_id: str) -> str:
+        if not self.enabled:
+            return self.shard_id
+        return self.ring.owner(machine_id)
+
+    def is_local(self, machine_id: str) -> bool:
+        return not self.enabled or self.ring.owner(machine_id) == self.shard_id
+
+    def shard_url(self, shard: str) -> str:
+        if not self.enabled:
+            return self.default_url
+        return self.url_template.format(shard=shard)
+
+    def url_for(self, machine_id: str) -> str:
+        """マシンを所有するシャードのURL（状態コンテナの EVENT_BUS_URL に使用）"""
+        return self.shard_url(self.owner(machine_id))
+
+    def transition_id_prefix(self) -> str:
+        """遷移IDにシャード番号を埋め込み、/transitions/<id> をどのシャードでも解決できるようにする"""
+        return f"s{self.shard_id}-" if self.enabled else ''
+
+    def shard_of_transition(self, transition_id: str) -> Optional[str]:
+        match = _TRANSITION_ID_SHARD.match(transition_id)
+        return match.group(1) if match else None
+
+    def peers(self) -> List[str]:
+        return [shard for shard in self.shards if shard != self.shard_id]
+
+    def forward(self, shard: str, method: str, path: str, json: dict = None,
+                params: dict = None) -> requests.Response:
+        """他シャードへリクエストを転送（転送ヘッダー付き）"""
+        return self.session.request(
+            method, self.shard_url(shard) + path, json=json, params=params,
+            headers={self.FORWARDED_HEADER: self.shard_id}, timeout=self.timeout
+        )
+
+    def get_info(self) -> dict:
+        return {
+            'shard_id': self.shard_id,
+            'shard_count': self.shard_count,
+            'url': self.shard_url(self.shard_id)
+        }
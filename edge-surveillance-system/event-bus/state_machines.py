@@ -1,40 +1,126 @@
+import collections
+import glob
+import logging
+import os
+import threading
+import time
 import yaml
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# カメラ台帳が大きくなるため、libyaml があればCローダーで解析
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_MEMORY_UNITS = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+# マシン毎に保持する冪等キー数（クライアントの再試行・フェイルオーバー後の再送を重複と判定する範囲）
+IDEMPOTENCY_WINDOW = 16
+
+def parse_memory(value) -> Optional[int]:
+    """'512m' / '1g' / バイト数をバイト数に変換"""
+    if value is None:
+        return None
+    text = str(value).strip().lower().rstrip('b')
+    if text and text[-1] in _MEMORY_UNITS:
+        return int(float(text[:-1]) * _MEMORY_UNITS[text[-1]])
+    return int(float(text))
+
+def parse_cpus(value) -> Optional[int]:
+    """CPU数（0.5など）をnano CPUsに変換"""
+    if value is None:
+        return None
+    return int(float(value) * 1e9)
+
+class ResourceProfile:
+    """状態コンテナのCPU/メモリ制限・予約（未指定はNone）"""
+    __slots__ = ('cpu_limit', 'memory_limit', 'cpu_reservation', 'memory_reservation')
+    
+    def __init__(self, cpu_limit: int = None, memory_limit: int = None,
+                 cpu_reservation: int = None, memory_reservation: int = None):
+        self.cpu_limit = cpu_limit                    # nano CPUs
+        self.memory_limit = memory_limit              # bytes
+        self.cpu_reservation = cpu_reservation        # nano CPUs
+        self.memory_reservation = memory_reservation  # bytes
+    
+    @classmethod
+    def from_config(cls, config: dict) -> 'ResourceProfile':
+        config = config or {}
+        return cls(
+            cpu_limit=parse_cpus(config.get('cpu_limit')),
+            memory_limit=parse_memory(config.get('memory_limit')),
+            cpu_reservation=parse_cpus(config.get('cpu_reservation')),
+            memory_reservation=parse_memory(config.get('memory_reservation'))
+        )
+    
+    def merged(self, defaults: 'ResourceProfile') -> 'ResourceProfile':
+        """未指定の項目をdefaultsで補完"""
+        return ResourceProfile(*(
+            getattr(self, key) if getattr(self, key) is not None else getattr(defaults, key)
+            for key in self.__slots__
+        ))
+    
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.__slots__}
 
 class State:
-    def __init__(self, name: str, container_image: str):
+    """状態の定義（テンプレートの全インスタンスで共有するため不変）"""
+    __slots__ = ('name', 'container_image', 'standby_pool', 'lifecycle', 'resources')
+    
+    LIFECYCLES = ('ephemeral', 'frozen')
+    
+    def __init__(self, name: str, container_image: str, standby_pool: int = 0,
+                 lifecycle: str = 'ephemeral', resources: ResourceProfile = None):
+        if lifecycle not in self.LIFECYCLES:
+            raise ValueError(f"Unknown lifecycle '{lifecycle}' for state {name}")
         self.name = name
         self.container_image = container_image
-        self.is_active = False
-        self.activated_at = None
-        
-    def activate(self):
-        self.is_active = True
-        self.activated_at = datetime.now()
-        
-    def deactivate(self):
-        self.is_active = False
+        self.standby_pool = standby_pool  # ウォームスタンバイコンテナ数
+        self.lifecycle = lifecycle  # ephemeral: 遷移毎に再作成 / frozen: 一時停止して保持
+        self.resources = resources or ResourceProfile()  # CPU/メモリ制限・予約
 
 class Transition:
+    __slots__ = ('name', 'from_state', 'to_state', 'trigger_event')
+    
     def __init__(self, name: str, from_state: str, to_state: str, trigger_event: str):
         self.name = name
         self.from_state = from_state
         self.to_state = to_state
         self.trigger_event = trigger_event
 
-class StateMachine:
-    def __init__(self, machine_id: str, config: dict):
-        self.machine_id = machine_id
+def resource_name(machine_id: str) -> str:
+    """コンテナ/サービス名に使うマシン名（detector@cam01 → detector-cam01）"""
+    return machine_id.replace('@', '-')
+
+def _instantiate(value, params: dict):
+    """設定値中の {camera_id} 等をインスタンスのパラメータで置換"""
+    if isinstance(value, str):
+        return value.format(**params) if '{' in value else value
+    if isinstance(value, dict):
+        return {key: _instantiate(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_instantiate(item, params) for item in value]
+    return value
+
+class MachineTemplate:
+    """1つの設定ファイルからコンパイルした状態・遷移表（同じテンプレートのマシン間で共有）"""
+    def __init__(self, config: dict):
+        self.machine_id = config.get('machine_id')  # "detector@{camera_id}" ならテンプレート
         self.states = {}
         self.transitions = {}
-        self.current_state = None
+        self.placement = config.get('placement', {})  # Swarm配置設定（affinity等）
+        # {camera_id} を含む配置設定のみインスタンス毎に展開（それ以外は共有）
+        self.parametric_placement = '{' in repr(self.placement)
         
         # 設定から状態を構築
         for state_name, state_config in config['states'].items():
             self.states[state_name] = State(
                 name=state_name,
-                container_image=state_config['container_image']
+                container_image=state_config['container_image'],
+                standby_pool=int(state_config.get('standby_pool', 0)),
+                lifecycle=state_config.get('lifecycle', 'ephemeral'),
+                resources=ResourceProfile.from_config(state_config.get('resources'))
             )
         
         # 遷移を構築
@@ -47,74 +133,295 @@ class StateMachine:
             )
             self.transitions[transition.name] = transition
         
+        self._compile_transition_tables()
+        
+        self.initial_state = self.states[config['initial_state']]
+
+    def _compile_transition_tables(self):
+        """遷移をfrom_state / (from_state, trigger_event) をキーとする表に事前コンパイル"""
+        by_state = {state_name: [] for state_name in self.states}
+        by_event = {}
+        
+        for transition in self.transitions.values():
+            for state_name in (transition.from_state, transition.to_state):
+                if state_name not in self.states:
+                    raise ValueError(
+                        f"Transition {transition.name} references unknown state: {state_name}"
+                    )
+            by_state[transition.from_state].append(transition)
+            # 同一キーの遷移が複数ある場合は定義順で最初のものを優先
+            by_event.setdefault((transition.from_state, transition.trigger_event), transition.name)
+        
+        self.transitions_by_state = {
+            state_name: tuple(transitions) for state_name, transitions in by_state.items()
+        }
+        self.transitions_by_event = by_event
+        
+        # /transition・/status 応答用の遷移一覧も状態毎に事前生成
+        self.available_transition_names = {
+            state_name: [t.name for t in transitions]
+            for state_name, transitions in self.transitions_by_state.items()
+        }
+        self.available_transition_info = {
+            state_name: [
+                {'name': t.name, 'to_state': t.to_state, 'trigger_event': t.trigger_event}
+                for t in transitions
+            ]
+            for state_name, transitions in self.transitions_by_state.items()
+        }
+
+    def placement_for(self, params: dict) -> dict:
+        return _instantiate(self.placement, params) if self.parametric_placement else self.placement
+
+class StateMachine:
+    """マシン1台分の可変状態（状態・遷移の定義はテンプレートを参照）"""
+    __slots__ = ('machine_id', 'template', 'current_state', 'version', 'replication_seq', 'lock',
+                 'activated_at', 'placement', 'generation', 'idempotency_keys')
+    
+    def __init__(self, machine_id: str, template: MachineTemplate, params: dict = None):
+        self.machine_id = machine_id
+        self.template = template
+        self.version = 0  # 遷移確定毎に増加
+        self.replication_seq = 0  # 直近の遷移の ReplicationLog 上のseq（応答前の複製待ちに使用）
+        self.lock = threading.RLock()  # 判定〜確定を原子的に行うためのマシン単位ロック
+        self.placement = template.placement_for(params or {})
+        # 現在の状態のイベントを送信できるコンテナの世代トークン
+        # （None: 未追跡のため検査しない / '': 遷移確定後、新しいコンテナの起動前）
+        self.generation = None
+        self.idempotency_keys = None  # {冪等キー: 確定したversion}（最初のキー受信時に作成）
+        
         # 初期状態設定
-        initial_state_name = config['initial_state']
-        self.current_state = self.states[initial_state_name]
-        self.current_state.activate()
+        self.current_state = template.initial_state
+        self.activated_at = datetime.now()
+
+    @property
+    def states(self) -> Dict[str, State]:
+        return self.template.states
+
+    @property
+    def transitions(self) -> Dict[str, Transition]:
+        return self.template.transitions
 
     def transition_to(self, transition_name: str, event_data: dict = None) -> Tuple[State, State]:
         """状態遷移実行"""
-        if transition_name not in self.transitions:
+        transition = self.template.transitions.get(transition_name)
+        if transition is None:
             raise ValueError(f"Unknown transition: {transition_name}")
-            
-        transition = self.transitions[transition_name]
-        
-        if self.current_state.name != transition.from_state:
-            raise ValueError(
-                f"Invalid transition {transition_name} from {self.current_state.name}"
-            )
-        
-        # 状態切り替え
-        old_state = self.current_state
-        old_state.deactivate()
         
-        new_state = self.states[transition.to_state]
-        new_state.activate()
-        self.current_state = new_state
-        
-        return old_state, new_state
+        with self.lock:
+            if self.current_state.name != transition.from_state:
+                raise ValueError(
+                    f"Invalid transition {transition_name} from {self.current_state.name}"
+                )
+            
+            # 状態切り替え
+            old_state = self.current_state
+            new_state = self.template.states[transition.to_state]
+            self.current_state = new_state
+            self.activated_at = datetime.now()
+            self.version += 1
+            # 旧状態のコンテナは以降のイベントを送信できない（新しいコンテナの起動時に再設定）
+            self.generation = ''
+            
+            return old_state, new_state
+
+    def restore(self, state_name: str, version: int):
+        """ジャーナルから復元した状態とバージョンを設定"""
+        if state_name not in self.template.states:
+            raise ValueError(f"Unknown state {state_name} for machine {self.machine_id}")
+        with self.lock:
+            self.current_state = self.template.states[state_name]
+            self.activated_at = datetime.now()
+            self.version = version
 
     def get_current_state(self) -> State:
         return self.current_state
+
+    def is_stale_generation(self, generation: Optional[str]) -> bool:
+        """既に置き換えられたコンテナ（世代）からのイベントか"""
+        return bool(generation) and self.generation is not None and generation != self.generation
+
+    def applied_version(self, idempotency_key: Optional[str]) -> Optional[int]:
+        """確定済みの冪等キーならその遷移のversion"""
+        if not idempotency_key or not self.idempotency_keys:
+            return None
+        return self.idempotency_keys.get(idempotency_key)
+
+    def remember_keys(self, keys: Dict[str, int]):
+        """確定した遷移の冪等キーを記録（古いものから破棄）"""
+        if not keys:
+            return
+        with self.lock:
+            if self.idempotency_keys is None:
+                self.idempotency_keys = collections.OrderedDict()
+            self.idempotency_keys.update(keys)
+            while len(self.idempotency_keys) > IDEMPOTENCY_WINDOW:
+                self.idempotency_keys.popitem(last=False)
         
     def can_transition(self, transition_name: str) -> bool:
         """遷移可能かチェック"""
-        if transition_name not in self.transitions:
-            return False
-        transition = self.transitions[transition_name]
-        return self.current_state.name == transition.from_state
+        transition = self.template.transitions.get(transition_name)
+        return transition is not None and self.current_state.name == transition.from_state
+    
+    def get_available_transitions(self) -> List[str]:
+        """現在の状態から可能な遷移名一覧"""
+        return self.template.available_transition_names[self.current_state.name]
+    
+    def get_available_transition_info(self) -> List[dict]:
+        """現在の状態から可能な遷移の詳細一覧"""
+        return self.template.available_transition_info[self.current_state.name]
+    
+    def find_transition_for_event(self, event_name: str) -> Optional[str]:
+        """現在の状態でイベントに対応する遷移名をO(1)で取得"""
+        return self.template.transitions_by_event.get((self.current_state.name, event_name))
 
 class StateMachineManager:
-    def __init__(self):
-        self.machines = {}
+    CONFIG_SUFFIX = '-config.yaml'
+    
+    def __init__(self, journal=None, config_dir: str = None, inventory_path: str = None,
+                 owns: Callable[[str], bool] = None, replication_log=None):
+        self.machines = {}  # 自シャードが所有するマシンのみ
+        self.templates = {}    # {テンプレート名: MachineTemplate} machine_idに"@"を含む設定
+        self.instances = {}    # {テンプレート名: [machine_id, ...]}
+        self.config_paths = []  # 読み込んだ設定ファイル（イメージ事前取得の変更監視用）
+        self._resource_names = set()
+        self.config_dir = config_dir or os.getenv('CONFIG_DIR', '/config')
+        self.inventory_path = inventory_path or os.getenv(
+            'CAMERA_INVENTORY', os.path.join(self.config_dir, 'cameras.yaml')
+        )
+        self.journal = journal  # TransitionJournal（Noneなら再起動時は初期状態から開始）
+        self.owns = owns  # 自シャードが所有するマシンか（Noneなら全マシンを所有）
+        self.replication_log = replication_log  # ReplicationLog（ホットスタンバイへの配信用）
         self.load_configurations()
         
     def load_configurations(self):
-        """設定ファイルからマシン設定読み込み"""
-        # Detector machine
-        with open('/config/detector-config.yaml', 'r') as f:
-            detector_config = yaml.safe_load(f)
-        self.machines['detector'] = StateMachine('detector', detector_config)
-        
-        # Surveillance machine  
-        with open('/config/surveillance-config.yaml', 'r') as f:
-            surveillance_config = yaml.safe_load(f)
-        self.machines['surveillance'] = StateMachine('surveillance', surveillance_config)
-
-    def initialize_machines(self):
-        """マシン初期化"""
-        for machine in self.machines.values():
-            # 既に初期状態に設定済み
-            pass
+        """設定ディレクトリの *-config.yaml を読み込み
+
+        machine_id が "detector@{camera_id}" のような設定はテンプレートとして1回だけコンパイルし、
+        カメラ台帳の各カメラについてインスタンスを生成する（インスタンス毎のYAML解析なし）。
+        """
+        started_at = time.time()
+        cameras = None
+        
+        for path in sorted(glob.glob(os.path.join(self.config_dir, '*' + self.CONFIG_SUFFIX))):
+            with open(path, 'r') as f:
+                config = yaml.load(f, Loader=_YAML_LOADER)
+            self.config_paths.append(path)
+            template = MachineTemplate(config)
+            machine_id = template.machine_id or os.path.basename(path)[:-len(self.CONFIG_SUFFIX)]
+            
+            if '@' not in machine_id:
+                self._add_machine(machine_id, template)
+                continue
+            
+            if cameras is None:
+                cameras = self._load_inventory()
+            name = machine_id.split('@', 1)[0]
+            self.templates[name] = template
+            self.instances[name] = []
+            for camera in cameras:
+                # templates指定のあるカメラは指定テンプレートのみ生成
+                if name not in camera.get('templates', [name]):
+                    continue
+                instance_id = machine_id.format(**camera)
+                self._add_machine(instance_id, template, camera)
+                self.instances[name].append(instance_id)
+        
+        logger.info(f"Loaded {len(self.machines)} of {len(self._resource_names)} machines "
+                    f"({len(self.templates)} templates) in {(time.time() - started_at) * 1000:.1f}ms")
+
+    def _load_inventory(self) -> List[dict]:
+        """カメラ台帳 {'cameras': [{'camera_id': ..., ...}]} 読み込み"""
+        try:
+            with open(self.inventory_path, 'r') as f:
+                inventory = yaml.load(f, Loader=_YAML_LOADER) or {}
+        except FileNotFoundError:
+            logger.warning(f"Camera inventory {self.inventory_path} not found, no template instances created")
+            return []
+        self.config_paths.append(self.inventory_path)
+        return inventory.get('cameras') or []
+
+    def _add_machine(self, machine_id: str, template: MachineTemplate, params: dict = None):
+        """マシン登録（重複・コンテナ/サービス名の衝突を検出、他シャード所有のマシンは名前のみ予約）"""
+        name = resource_name(machine_id)
+        if name in self._resource_names:
+            raise ValueError(f"Machine {machine_id} duplicates or collides with container name {name}")
+        self._resource_names.add(name)
+        if self.owns is None or self.owns(machine_id):
+            self.machines[machine_id] = StateMachine(machine_id, template, params)
+
+    def resolve_targets(self, machine_id: str) -> List[str]:
+        """ルールの対象マシン名を解決（テンプレート名なら他シャード所有分も含む全インスタンス）"""
+        if machine_id in self.instances:
+            return list(self.instances[machine_id])
+        return [machine_id]
+
+    def initialize_machines(self, start_journal: bool = True):
+        """マシン初期化（ジャーナルがあれば前回の状態を復元、なければ初期状態のまま）
+
+        start_journal=False（ホットスタンバイ）では復元のみ行い、ジャーナルへは書き込まない。
+        """
+        if self.journal is None:
+            return
+        restored = self.restore_states(self.journal.load())
+        logger.info(f"Restored {restored} machines from journal")
+        if start_journal:
+            self.journal.start(self.get_snapshot)
+    
+    def restore_states(self, states: Dict[str, dict]) -> int:
+        """{machine_id: {'state', 'version'[, 'keys']}} のうち現在より新しいバージョンのみ反映（冪等キーは常に記録）"""
+        restored = 0
+        for machine_id, saved in states.items():
+            machine = self.machines.get(machine_id)
+            if machine is None:
+                logger.warning(f"Saved state for unknown machine {machine_id}, ignoring")
+                continue
+            with machine.lock:
+                machine.remember_keys(saved.get('keys'))
+                if saved['version'] <= machine.version:
+                    continue
+                try:
+                    machine.restore(saved['state'], saved['version'])
+                    restored += 1
+                except ValueError as e:
+                    # 設定変更で状態が削除された場合は初期状態から開始
+                    logger.warning(f"Cannot restore {machine_id}: {str(e)}")
+        return restored
+    
+    def get_snapshot(self) -> Dict[str, dict]:
+        """全マシンの現在状態（ジャーナルのスナップショット用）"""
+        snapshot = {}
+        for machine_id, machine in self.machines.items():
+            with machine.lock:
+                snapshot[machine_id] = {
+                    'state': machine.current_state.name, 'version': machine.version
+                }
+                if machine.idempotency_keys:
+                    snapshot[machine_id]['keys'] = dict(machine.idempotency_keys)
+        return snapshot
             
     def execute_transition(self, machine_id: str, transition_name: str, 
-                         event_data: dict = None) -> Tuple[State, State]:
-        """遷移実行"""
+                         event_data: dict = None, idempotency_key: str = None) -> Tuple[State, State]:
+        """遷移実行（冪等キーはジャーナル・ホットスタンバイにも記録し、再起動・フェイルオーバー後も重複と判定）"""
         if machine_id not in self.machines:
             raise ValueError(f"Unknown machine: {machine_id}")
             
         machine = self.machines[machine_id]
-        return machine.transition_to(transition_name, event_data)
+        with machine.lock:
+            old_state, new_state = machine.transition_to(transition_name, event_data)
+            if idempotency_key:
+                machine.remember_keys({idempotency_key: machine.version})
+            if self.journal is not None:
+                self.journal.append(
+                    machine_id, transition_name, old_state.name, new_state.name, machine.version,
+                    idempotency_key
+                )
+            if self.replication_log is not None:
+                machine.replication_seq = self.replication_log.append(
+                    machine_id, transition_name, old_state.name, new_state.name, machine.version,
+                    idempotency_key
+                )
+        return old_state, new_state
     
     def get_machine(self, machine_id: str) -> StateMachine:
         return self.machines[machine_id]
@@ -124,25 +431,8 @@ class StateMachineManager:
         
     def can_handle_event(self, machine_id: str, event: dict) -> bool:
         """イベント処理可能かチェック"""
-        machine = self.machines[machine_id]
-        event_name = event['name']
-        
-        # 現在の状態から処理可能な遷移を探す
-        current_state = machine.get_current_state()
-        for transition in machine.transitions.values():
-            if (transition.from_state == current_state.name and 
-                transition.trigger_event == event_name):
-                return True
-        return False
+        return self.machines[machine_id].find_transition_for_event(event['name']) is not None
         
     def get_transition_for_event(self, machine_id: str, event: dict) -> Optional[str]:
         """イベントに対応する遷移名取得"""
-        machine = self.machines[machine_id]
-        event_name = event['name']
-        current_state = machine.get_current_state()
-        
-        for transition in machine.transitions.values():
-            if (transition.from_state == current_state.name and 
-                transition.trigger_event == event_name):
-                return transition.name
-        return None
\ No newline at end of file
+        return self.machines[machine_id].find_transition_for_event(event['name'])
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""同一マシンへの並行遷移のストレステスト
+
+Dockerを使わない FakeContainerManager で app.accept_transition を多数のスレッドから同時に呼び、
+マシン単位のロックとバージョン番号の下で遷移が失われず、コンテナ切り替えが交錯しないことを確認する。
+
+    python test_transition_stress.py [マシン数] [スレッド数] [スレッド毎の送信数]
+    python -m pytest test_transition_stress.py
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# イメージでは common/ のモジュールを同じディレクトリにコピーしている
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+import app
+from fake_container_manager import FakeContainerManager
+from machine_startup import MachineStartup
+from sharding import ShardRouter
+from state_machines import StateMachineManager
+from transition_pipeline import TransitionPipeline
+
+# a -> b -> c -> a を巡回する遷移（どの状態でも有効な遷移は1つだけ）
+CYCLE = [('a', 'b'), ('b', 'c'), ('c', 'a')]
+
+MACHINE_CONFIG = '''machine_id: "stress@{camera_id}"
+initial_state: a
+states:
+''' + ''.join(f'''  {state}:
+    container_image: stress-{state}:latest
+''' for state, _ in CYCLE) + '''transitions:
+''' + ''.join(f'''  - name: {old}_to_{new}
+    from_state: {old}
+    to_state: {new}
+''' for old, new in CYCLE)
+
+class NoRules:
+    def get_triggered_events(self, machine_id, transition_name, event_data):
+        return []
+
+def setup_app(config_dir: str, machine_count: int, workers: int = 8) -> FakeContainerManager:
+    """偽マネージャーでappのグローバルを構成（ジャーナル・レプリケーションなし）"""
+    with open(os.path.join(config_dir, 'stress-config.yaml'), 'w') as f:
+        f.write(MACHINE_CONFIG)
+    with open(os.path.join(config_dir, 'cameras.yaml'), 'w') as f:
+        f.write('cameras:\n' + ''.join(f'  - camera_id: cam{i:03d}\n' for i in range(machine_count)))
+
+    # 切り替え毎に待ちを入れ、他スレッドの遷移を割り込ませる
+    manager = FakeContainerManager(api_latency=0.00025)
+    app.container_manager = manager
+    app.rules_engine = NoRules()
+    app.shard_router = ShardRouter(shard_id='1', shard_count=1)
+    app.state_machine_manager = StateMachineManager(config_dir=config_dir)
+    app.machine_startup = MachineStartup(lambda machine_id: None)
+    app.transition_pipeline = TransitionPipeline(app.apply_transition, max_workers=workers)
+    app.replication_log = None
+    return manager
+
+def fire(machine_ids, rounds: int, results: list):
+    """現在状態を知らないクライアントとして、巡回順の遷移を順に送り続ける"""
+    for i in range(rounds):
+        for machine_id in machine_ids:
+            old, new = CYCLE[i % len(CYCLE)]
+            body, status = app.accept_transition({
+                'machine_id': machine_id,
+                'transition_name': f'{old}_to_{new}',
+                'idempotency_key': f'{threading.get_ident()}-{machine_id}-{i}'
+            })[:2]
+            results.append((machine_id, status, body.get('version')))
+
+def run_stress(machine_count: int = 4, threads: int = 16, rounds: int = 200) -> dict:
+    with tempfile.TemporaryDirectory() as config_dir:
+        manager = setup_app(config_dir, machine_count)
+        machine_ids = app.state_machine_manager.get_machine_ids()
+
+        results = []
+        started_at = time.time()
+        workers = [threading.Thread(target=fire, args=(machine_ids, rounds, results)) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        app.transition_pipeline.shutdown()
+        elapsed = time.time() - started_at
+
+    statuses = defaultdict(int)
+    versions = defaultdict(list)
+    for machine_id, status, version in results:
+        statuses[status] += 1
+        if status == 202:
+            versions[machine_id].append(version)
+
+    for machine_id in machine_ids:
+        machine = app.state_machine_manager.get_machine(machine_id)
+        accepted = sorted(versions[machine_id])
+        # 受理した遷移はすべて連番のバージョンで確定している（失われた・二重に確定した遷移がない）
+        assert accepted == list(range(1, machine.version + 1)), machine_id
+        # 最終状態は受理数から決まる巡回上の状態
+        assert machine.current_state.name == CYCLE[machine.version % len(CYCLE)][0], machine_id
+        # コンテナ切り替えは確定順に途切れなく連なる（前の切り替え先から次が始まる）
+        applied = manager.applied[machine_id]
+        assert len(applied) == machine.version, machine_id
+        assert all(applied[i][0] == CYCLE[i % len(CYCLE)][0] and applied[i][1] == CYCLE[i % len(CYCLE)][1]
+                   for i in range(len(applied))), machine_id
+    assert manager.overlaps == 0
+    assert statuses[500] == 0
+
+    return {
+        'requests': len(results),
+        'accepted': statuses[202],
+        'rejected': statuses[400],
+        'elapsed': elapsed,
+        'versions': {machine_id: app.state_machine_manager.get_machine(machine_id).version
+                     for machine_id in machine_ids}
+    }
+
+def test_concurrent_transitions_on_same_machine():
+    logging.disable(logging.ERROR)  # 無効な遷移（想定内）のエラーログを抑制
+    try:
+        result = run_stress(machine_count=2, threads=16, rounds=100)
+    finally:
+        logging.disable(logging.NOTSET)
+    assert result['accepted'] == sum(result['versions'].values())
+    assert result['accepted'] + result['rejected'] == result['requests']
+
+if __name__ == '__main__':
+    logging.disable(logging.ERROR)  # 無効な遷移（想定内）のエラーログを抑制
+    args = [int(arg) for arg in sys.argv[1:4]]
+    result = run_stress(*args)
+    print(f"{result['requests']} requests in {result['elapsed']:.2f}s: "
+          f"{result['accepted']} accepted, {result['rejected']} rejected (invalid from current state)")
+    print(f"final versions: {result['versions']}")
+    print("no lost or interleaved transitions")
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class TransitionJournal:
+    """確定済み遷移の追記専用ジャーナルと定期スナップショット（event-bus再起動時の状態復元用）
+
+    fsyncはflush_interval毎にまとめて行うため、クラッシュ時に失われ得るのは直近の1間隔分のみ。
+    """
+    JOURNAL_FILE = 'transitions.jsonl'
+    SNAPSHOT_FILE = 'snapshot.json'
+
+    def __init__(self, directory: str, flush_interval: float = 0.05, snapshot_every: int = 1000):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every  # この件数を書き込む毎にスナップショットを作成しジャーナルを切り詰め
+
+        self.stats = {'appended': 0, 'flushes': 0, 'snapshots': 0, 'last_flush_ms': 0.0}
+        self._buffer = []  # fsync待ちのエントリ（エンコード済み）
+        self._since_snapshot = 0
+        self._snapshot_source = None
+        self._file = None
+        self._lock = threading.Lock()         # バッファ用
+        self._write_lock = threading.RLock()  # ファイル書き込み用
+        self._stopped = False
+        self._thread = None
+
+    def load(self) -> Dict[str, dict]:
+        """スナップショット+ジャーナル末尾から {machine_id: {'state', 'version'}} を復元"""
+        started_at = time.time()
+        machines = {}
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                machines = json.load(f).get('machines', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable journal snapshot: {str(e)}")
+
+        replayed = 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中でクラッシュした末尾行は破棄
+                        logger.warning("Skipping torn journal entry")
+                        continue
+                    saved = machines.get(entry['machine_id'])
+                    # スナップショット作成中に追記された遷移はスナップショットにも含まれ得るためversionで判定
+                    if saved is None or entry['version'] > saved['version']:
+                        keys = saved.get('keys', {}) if saved else {}
+                        if entry.get('key'):
+                            keys[entry['key']] = entry['version']
+                        machines[entry['machine_id']] = {
+                            'state': entry['to_state'], 'version': entry['version'], 'keys': keys
+                        }
+                        replayed += 1
+        except FileNotFoundError:
+            pass
+
+        logger.info(f"Loaded {len(machines)} machine states from journal "
+                    f"({replayed} entries replayed) in {(time.time() - started_at) * 1000:.1f}ms")
+        return machines
+
+    def start(self, snapshot_source: Callable[[], Dict[str, dict]]):
+        """復元直後のスナップショットでジャーナルを圧縮し、まとめ書きスレッドを開始"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._snapshot_source = snapshot_source
+        self._file = open(self.journal_path, 'ab')
+        self._snapshot()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='transition-journal')
+        self._thread.start()
+
+    def append(self, machine_id: str, transition_name: str, from_state: str,
+               to_state: str, version: int, idempotency_key: str = None):
+        """確定済み遷移を追記（マシンのロック内で呼ぶことでマシン毎の順序を保証）"""
+        entry = {
+            'machine_id': machine_id,
+            'transition': transition_name,
+            'from_state': from_state,
+            'to_state': to_state,
+            'version': version,
+            'at': time.time()
+        }
+        if idempotency_key:
+            entry['key'] = idempotency_key
+        line = json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            self._buffer.append(line)
+            self.stats['appended'] += 1
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(self.flush_interval)
+            try:
+                with self._write_lock:
+                    self.flush()
+                    if self._since_snapshot >= self.snapshot_every:
+                        self._snapshot()
+            except Exception as e:
+                logger.error(f"Transition journal write failed: {str(e)}")
+
+    def flush(self):
+        """溜まったエントリを1回のwrite+fsyncで永続化"""
+        with self._write_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                lines, self._buffer = self._buffer, []
+            started_at = time.time()
+            self._file.write(b''.join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._since_snapshot += len(lines)
+            self.stats['flushes'] += 1
+            self.stats['last_flush_ms'] = round((time.time() - started_at) * 1000, 2)
+
+    def _snapshot(self):
+        """全マシンの現在状態を原子的に書き出し、反映済みのジャーナルを切り詰め"""
+        with self._write_lock:
+            # ファイルに書き込み済みのエントリは全て確定済みのため、この後取得する状態に含まれる
+            machines = self._snapshot_source()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'machines': machines, 'created_at': time.time()}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._fsync_directory()
+
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self._since_snapshot = 0
+            self.stats['snapshots'] += 1
+
+    def _fsync_directory(self):
+        """renameを永続化するためディレクトリもfsync"""
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def get_stats(self) -> Dict[str, object]:
+        with self._lock:
+            return dict(self.stats, pending=len(self._buffer))
+
+    def close(self, snapshot: bool = True):
+        """停止時に残りを書き出し（snapshot=Trueならスナップショットも作成）"""
+        self._stopped = True
+        if self._file is None:
+            return
+        self.flush()
+        if snapshot:
+            self._snapshot()
+        self._file.close()
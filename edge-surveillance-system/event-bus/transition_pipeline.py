@@ -0,0 +1,132 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class TransitionRecord:
+    """非同期で処理される遷移1件の記録"""
+    def __init__(self, machine_id: str, transition_name: str, old_state, new_state,
+                 event_data: dict, parent_id: str = None, id_prefix: str = ''):
+        self.id = id_prefix + uuid.uuid4().hex  # シャード構成では所有シャードを示す接頭辞付き
+        self.machine_id = machine_id
+        self.transition_name = transition_name
+        self.old_state = old_state
+        self.new_state = new_state
+        self.event_data = event_data or {}
+        self.parent_id = parent_id
+        self.status = 'pending'  # pending -> running -> completed / failed
+        self.error = None
+        self.triggered_events = 0
+        self.created_at = datetime.now()
+        self.completed_at = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            'transition_id': self.id,
+            'machine_id': self.machine_id,
+            'transition_name': self.transition_name,
+            'old_state': self.old_state.name,
+            'new_state': self.new_state.name,
+            'parent_id': self.parent_id,
+            'status': self.status,
+            'error': self.error,
+            'triggered_events': self.triggered_events,
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+class TransitionPipeline:
+    """マシン毎に順序を保証したキューでコンテナ切り替えを実行するワーカープール"""
+    def __init__(self, handler: Callable[[TransitionRecord], None],
+                 max_workers: int = 4, history_size: int = 1000, id_prefix: str = ''):
+        self.handler = handler
+        self.id_prefix = id_prefix
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='transition-worker')
+        self.history_size = history_size
+        self.records = OrderedDict()  # {transition_id: TransitionRecord}
+        self.queues = {}              # {machine_id: deque[TransitionRecord]}（空になったら削除）
+        self.draining = set()         # ワーカーが処理中のmachine_id
+        self._lock = threading.Lock()
+
+    def submit(self, machine_id: str, transition_name: str, old_state, new_state,
+               event_data: dict = None, parent_id: str = None) -> TransitionRecord:
+        """確定済みの遷移をマシンのキューに追加"""
+        record = TransitionRecord(
+            machine_id, transition_name, old_state, new_state, event_data, parent_id,
+            id_prefix=self.id_prefix
+        )
+
+        with self._lock:
+            self.records[record.id] = record
+            self._trim_history()
+            self.queues.setdefault(machine_id, deque()).append(record)
+
+            # 同一マシンのワーカーは常に1つだけ（キュー順に処理）
+            if machine_id not in self.draining:
+                self.draining.add(machine_id)
+                self.executor.submit(self._drain, machine_id)
+
+        return record
+
+    def get(self, transition_id: str) -> Optional[TransitionRecord]:
+        with self._lock:
+            return self.records.get(transition_id)
+
+    def wait(self, transition_id: str, timeout: float) -> Optional[TransitionRecord]:
+        """遷移の完了を最大timeout秒待機"""
+        record = self.get(transition_id)
+        if record is not None:
+            record.done.wait(timeout)
+        return record
+
+    def get_queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            return {machine_id: len(queue) for machine_id, queue in self.queues.items()}
+
+    def _drain(self, machine_id: str):
+        """マシンのキューが空になるまで順に処理"""
+        while True:
+            with self._lock:
+                queue = self.queues[machine_id]
+                if not queue:
+                    # テンプレートのインスタンス等、遷移の止まったマシンのキューを残さない
+                    del self.queues[machine_id]
+                    self.draining.discard(machine_id)
+                    return
+                record = queue.popleft()
+
+            record.status = 'running'
+            try:
+                self.handler(record)
+                record.status = 'completed'
+            except Exception as e:
+                record.status = 'failed'
+                record.error = str(e)
+                logger.error(f"Transition {record.id[:8]} failed on {machine_id}: {str(e)}")
+            finally:
+                record.completed_at = datetime.now()
+                record.done.set()
+
+    def _trim_history(self):
+        """完了済みの古い記録を削除（処理中の記録は位置に関わらず残す）"""
+        excess = len(self.records) - self.history_size
+        if excess <= 0:
+            return
+        trimmed = []
+        for transition_id, record in self.records.items():
+            if record.done.is_set():
+                trimmed.append(transition_id)
+                if len(trimmed) == excess:
+                    break
+        for transition_id in trimmed:
+            del self.records[transition_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -1,10 +1,10 @@
 import time
-import requests
 import os
 import json
 import numpy as np
 import logging
 from datetime import datetime
+from event_bus_client import EventBusClient
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +14,7 @@ class AnalyzingState:
         self.machine_id = os.getenv('MACHINE_ID', 'surveillance')
         self.state_name = os.getenv('STATE_NAME', 'analyzing')
         self.event_bus_url = os.getenv('EVENT_BUS_URL', 'http://localhost:5000')
+        self.event_bus = EventBusClient(self.event_bus_url, self.machine_id, self.state_name)
         self.analysis_duration = 2.0  # 2秒の分析時間
         
     def run(self):
@@ -29,7 +30,7 @@ class AnalyzingState:
             
             if threat_detected:
                 # 脅威検出時
-                self._send_transition_event('threat_detected', {
+                self.event_bus.send_transition('threat_detected', {
                     'threat_level': 'HIGH',
                     'threat_type': 'unknown_person',
                     'confidence': 0.92,
@@ -38,7 +39,7 @@ class AnalyzingState:
                 logger.warning("THREAT DETECTED - Activating alarm!")
             else:
                 # 脅威なし
-                self._send_transition_event('no_threat', {
+                self.event_bus.send_transition('no_threat', {
                     'result': 'authorized_person',
                     'confidence': 0.88,
                     'timestamp': datetime.now().isoformat()
@@ -48,7 +49,7 @@ class AnalyzingState:
         except Exception as e:
             logger.error(f"Analysis error: {str(e)}")
             # エラー時は安全のため脅威として扱う
-            self._send_transition_event('threat_detected', {
+            self.event_bus.send_transition('threat_detected', {
                 'threat_level': 'UNKNOWN',
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
@@ -62,29 +63,6 @@ class AnalyzingState:
         # 30%の確率で脅威と判定
         return np.random.random() > 0.7
 
-    def _send_transition_event(self, transition_name: str, event_data: dict):
-        """イベントバスに遷移イベント送信"""
-        try:
-            payload = {
-                'machine_id': self.machine_id,
-                'transition_name': transition_name,
-                'event_data': event_data
-            }
-            
-            response = requests.post(
-                f"{self.event_bus_url}/transition",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.info(f"Transition event sent: {transition_name}")
-            else:
-                logger.error(f"Failed to send transition event: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error sending transition event: {str(e)}")
-
 if __name__ == '__main__':
     analyzing_state = AnalyzingState()
-    analyzing_state.run()
\ No newline at end of file
+    analyzing_state.event_bus.run_state(analyzing_state.run)
\ No newline at end of file